@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import socketio
+
+from benchmark_helpers import percentiles
+
+FORMAT_VERSION = 1 # Bump when the results layout changes, so old and new files are not compared blindly
+
+# Each event's latency: from sending it to the reply that completes it (see run_building)
+EVENTS = ('connect', 'create_session', 'join_session_resident', 'admin_assign_visitor_role', 'visitor_submit_purpose',
+          'start_voting_round', 'submit_vote', 'votes_tallied')
+ERROR_KINDS = ('timeout', 'server_error', 'connection')
+
+
+class ServerError(Exception):
+    """The server answered with an 'error' event instead of the expected reply."""
+
+
+class Client:
+    """
+    One simulated browser. expect() registers for a reply before the request that triggers it
+    is sent, so a quick reply is never missed; an 'error' event fails whatever the client is
+    waiting for.
+    """
+
+    def __init__(self, url, serializer):
+        self.url = url
+        self.sio = socketio.AsyncClient(reconnection=False, serializer=serializer)
+        self.waiting = {} # Event name -> future of its data
+        self.sio.on('*', self._on_event)
+
+    async def _on_event(self, event, data=None):
+        if event == 'error':
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ServerError(data.get('message') if isinstance(data, dict) else data))
+            self.waiting.clear()
+            return
+        future = self.waiting.pop(event, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def expect(self, event):
+        future = self.waiting[event] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def connect(self):
+        await self.sio.connect(self.url, transports=['websocket'])
+
+    async def request(self, event, data, reply, timeout):
+        future = self.expect(reply)
+        if data is None:
+            await self.sio.emit(event)
+        else:
+            await self.sio.emit(event, data)
+        return await asyncio.wait_for(future, timeout)
+
+    async def close(self):
+        try:
+            await self.sio.disconnect()
+        except Exception:
+            pass
+
+
+class Recorder:
+    """Latencies and failures per event, for one load generator process."""
+
+    def __init__(self):
+        self.latencies = {event: [] for event in EVENTS}
+        self.errors = {event: dict.fromkeys(ERROR_KINDS, 0) for event in EVENTS}
+        self.buildings = {'completed': 0, 'failed': 0}
+        self.votes = 0
+
+    async def timed(self, event, awaitable):
+        # Records the latency, or the kind of failure and re-raises it
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        except asyncio.TimeoutError:
+            self.errors[event]['timeout'] += 1
+            raise
+        except ServerError:
+            self.errors[event]['server_error'] += 1
+            raise
+        except (socketio.exceptions.ConnectionError, OSError):
+            self.errors[event]['connection'] += 1
+            raise
+        self.latencies[event].append((time.perf_counter() - started) * 1000)
+        return result
+
+    def to_dict(self):
+        return {'latencies': self.latencies, 'errors': self.errors, 'buildings': self.buildings, 'votes': self.votes}
+
+
+async def run_building(options, recorder):
+    """
+    One building through a full round: the admin creates a session, the visitor and the
+    residents join, the admin assigns the visitor, the visitor states a purpose, the admin
+    starts voting and every resident votes. t-1 residents allow (so each share is folded in
+    without closing the round early) and the rest deny, so every vote is accepted and the
+    tally follows the last one.
+    """
+    timeout = options['timeout']
+    admin = Client(options['url'], options['serializer'])
+    visitor = Client(options['url'], options['serializer'])
+    residents = [Client(options['url'], options['serializer']) for _ in range(options['residents'])]
+    clients = [admin, visitor] + residents
+    try:
+        await asyncio.gather(*(recorder.timed('connect', asyncio.wait_for(client.connect(), timeout)) for client in clients))
+        created = await recorder.timed('create_session', admin.request('create_session', None, 'session_created', timeout))
+        session_id = created['session_id']
+
+        visitor_joined = admin.expect('user_joined_for_roles') # The admin learns the visitor's SID from this
+        await recorder.timed('join_session_resident', visitor.request(
+            'join_session_resident', {'session_id': session_id, 'nickname': 'Visitor'}, 'joined_successfully_waiting_role', timeout))
+        visitor_sid = (await asyncio.wait_for(visitor_joined, timeout))['sid']
+        await asyncio.gather(*(recorder.timed('join_session_resident', resident.request(
+            'join_session_resident', {'session_id': session_id, 'nickname': f"Resident {i}"}, 'joined_successfully_waiting_role', timeout))
+            for i, resident in enumerate(residents)))
+
+        # Fan-out events are complete once every recipient has the broadcast
+        roles = [resident.expect('role_assigned') for resident in residents] + [visitor.expect('role_assigned')]
+        await recorder.timed('admin_assign_visitor_role', asyncio.wait_for(asyncio.gather(
+            admin.sio.emit('admin_assign_visitor_role', {'session_id': session_id, 'visitor_sid': visitor_sid}), *roles), timeout))
+
+        await recorder.timed('visitor_submit_purpose', asyncio.wait_for(asyncio.gather(
+            admin.expect('purpose_received_from_visitor'),
+            visitor.request('visitor_submit_purpose', {'session_id': session_id, 'purpose': options['purpose']},
+                            'purpose_submission_confirmed', timeout)), timeout))
+
+        parameters = admin.expect('voting_parameters_set')
+        started = [resident.expect('voting_started') for resident in residents]
+        await recorder.timed('start_voting_round', asyncio.wait_for(asyncio.gather(
+            admin.sio.emit('start_voting_round', {'session_id': session_id, 'timer_duration': options['timer_duration']}),
+            parameters, *started), timeout))
+        allow_votes = max(parameters.result()['t'] - 1, 0)
+
+        tallied = admin.expect('votes_tallied')
+        votes = [recorder.timed('submit_vote', resident.request(
+            'submit_vote', {'session_id': session_id, 'vote_type': 'allow' if i < allow_votes else 'deny'},
+            'vote_submitted_confirmation', timeout)) for i, resident in enumerate(residents)]
+        # From the first vote sent until every vote is confirmed and the admin has the outcome
+        await recorder.timed('votes_tallied', asyncio.wait_for(asyncio.gather(tallied, *votes), timeout))
+        recorder.votes += len(votes)
+        recorder.buildings['completed'] += 1
+    except Exception:
+        recorder.buildings['failed'] += 1
+    finally:
+        await asyncio.gather(*(client.close() for client in clients[1:]))
+        await admin.close() # Last: the admin leaving closes the session
+
+
+async def run_buildings(options, buildings, concurrency):
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_building():
+        async with semaphore:
+            await run_building(options, recorder)
+
+    await asyncio.gather(*(one_building() for _ in range(buildings)))
+    return recorder.to_dict()
+
+
+def run_worker(options, buildings, concurrency):
+    # Entry point of each load generator process
+    return asyncio.run(run_buildings(options, buildings, concurrency))
+
+
+def _process_tree(pid):
+    # The server process and its descendants (e.g. the reloader's child), from /proc
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, ()))
+    return tree
+
+
+def _cpu_and_rss(pids):
+    cpu_ticks, rss_kb = 0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu_ticks += int(fields[11]) + int(fields[12]) # utime + stime
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb += int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            continue # Exited meanwhile
+    return cpu_ticks / os.sysconf('SC_CLK_TCK'), rss_kb
+
+
+class ServerMonitor:
+    """Samples the server's CPU time and resident memory (Linux /proc) while the load runs."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self._stop = threading.Event()
+        self._rss_samples = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._started = time.monotonic()
+        self._cpu_start, rss = _cpu_and_rss(_process_tree(self.pid))
+        self._rss_samples.append(rss)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.monotonic() - self._started
+        cpu_end, rss = _cpu_and_rss(_process_tree(self.pid))
+        self._rss_samples.append(rss)
+        cpu_seconds = cpu_end - self._cpu_start
+        return {'cpu_seconds': round(cpu_seconds, 2), 'cpu_percent': round(cpu_seconds / elapsed * 100, 1),
+                'rss_mb_start': round(self._rss_samples[0] / 1024, 1), 'rss_mb_peak': round(max(self._rss_samples) / 1024, 1),
+                'rss_mb_end': round(rss / 1024, 1)}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._rss_samples.append(_cpu_and_rss(_process_tree(self.pid))[1])
+
+
+def summarize(latencies, errors):
+    failed = sum(errors.values())
+    attempts = len(latencies) + failed
+    summary = percentiles(latencies)
+    summary.update(errors=errors, error_rate=round(failed / attempts, 4) if attempts else 0.0)
+    summary['mean_ms'] = round(sum(latencies) / len(latencies), 3) if latencies else None
+    return summary
+
+
+def merge(parts):
+    merged = {'latencies': {event: [] for event in EVENTS}, 'errors': {event: dict.fromkeys(ERROR_KINDS, 0) for event in EVENTS},
+              'buildings': {'completed': 0, 'failed': 0}, 'votes': 0}
+    for part in parts:
+        for event in EVENTS:
+            merged['latencies'][event].extend(part['latencies'][event])
+            for kind in ERROR_KINDS:
+                merged['errors'][event][kind] += part['errors'][event][kind]
+        for outcome in merged['buildings']:
+            merged['buildings'][outcome] += part['buildings'][outcome]
+        merged['votes'] += part['votes']
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of a running server (app.py or async_app.py): "
+                                                 "simulated buildings play the full voting flow over Socket.IO.")
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--buildings", type=int, default=100, help="Buildings (sessions) played through a full round")
+    parser.add_argument("--residents", type=int, default=20, help="Voting residents per building, besides the admin and the visitor")
+    parser.add_argument("--concurrency", type=int, default=20, help="Buildings in flight at once, across all processes")
+    parser.add_argument("--processes", type=int, default=1, help="Load generator processes (the client side is CPU-bound too)")
+    parser.add_argument("--purpose", default="I have a parcel delivery from DHL for apartment 4")
+    parser.add_argument("--timer-duration", type=int, default=120, help="Round timer; long enough that every round ends on its last vote")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each reply")
+    parser.add_argument("--serializer", choices=('default', 'msgpack'), default='default', help="Must match the server's SOCKETIO_SERIALIZER")
+    parser.add_argument("--server-pid", type=int, help="PID of the server, to report its CPU and RSS (Linux)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    options = {'url': args.url, 'residents': args.residents, 'purpose': args.purpose, 'timer_duration': args.timer_duration,
+               'timeout': args.timeout, 'serializer': args.serializer}
+    processes = max(1, min(args.processes, args.buildings))
+    shares = [args.buildings // processes + (i < args.buildings % processes) for i in range(processes)]
+    concurrency = max(1, args.concurrency // processes)
+
+    monitor = ServerMonitor(args.server_pid) if args.server_pid else None
+    if monitor:
+        monitor.start()
+    started = time.monotonic()
+    if processes == 1:
+        parts = [run_worker(options, shares[0], concurrency)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(run_worker, [options] * processes, shares, [concurrency] * processes))
+    elapsed = time.monotonic() - started
+    server = monitor.stop() if monitor else None
+
+    merged = merge(parts)
+    results = {
+        'format_version': FORMAT_VERSION,
+        'parameters': {'buildings': args.buildings, 'residents': args.residents, 'concurrency': concurrency * processes,
+                       'processes': processes, 'serializer': args.serializer, 'timer_duration': args.timer_duration},
+        'buildings': merged['buildings'],
+        'clients': args.buildings * (args.residents + 2),
+        'duration_seconds': round(elapsed, 2),
+        'throughput': {'buildings_per_second': round(merged['buildings']['completed'] / elapsed, 2),
+                       'votes_per_second': round(merged['votes'] / elapsed, 1)},
+        'events': {event: summarize(merged['latencies'][event], merged['errors'][event]) for event in EVENTS},
+        'server': server,
+    }
+    print(json.dumps(results, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import jinja2
+import socketio
+from aiohttp import web
+
+from qr_service import QR_FORMATS, etag_matches, http_cache_headers
+from settings import SETTINGS
+from structured_logging import configure_logging
+from voting_service import create_voting_service
+
+# asyncio entry point: the same pages and Socket.IO events as app.py, served by python-socketio's
+# AsyncServer on aiohttp instead of Flask-SocketIO on threads. Run it instead of app.py.
+config = dict(SETTINGS) # See settings.py
+
+# The NLP engine's worker processes are spawned and import this module again as __mp_main__;
+# only the server process itself sets up logging and the voting service
+SERVER_PROCESS = __name__ != '__mp_main__'
+if SERVER_PROCESS:
+    configure_logging(level=config['LOG_LEVEL'],
+                      json_output=config['LOG_JSON'],
+                      rate_limit_burst=config['LOG_RATE_LIMIT_BURST'],
+                      rate_limit_interval=config['LOG_RATE_LIMIT_INTERVAL'])
+logger = logging.getLogger(__name__)
+
+client_manager = None
+if config['SOCKETIO_MESSAGE_QUEUE']:
+    client_manager = socketio.AsyncRedisManager(config['SOCKETIO_MESSAGE_QUEUE'])
+sio = socketio.AsyncServer(async_mode='aiohttp', client_manager=client_manager, serializer=config['SOCKETIO_SERIALIZER'])
+web_app = web.Application()
+sio.attach(web_app)
+
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+                               autoescape=True)
+
+
+class AsyncioTransport:
+    """
+    How VotingService talks to clients under the asyncio server. The service runs in executor
+    threads, on the NLP engine's thread and on the round timer thread, so emits and room changes
+    are handed to the loop thread-safely and sent in order by one task. Calls made before the
+    loop is running (e.g. the tally of a round restored from the vote journal, due at once) are
+    held until start().
+    """
+
+    def __init__(self, sio, executor):
+        self.sio = sio
+        self.executor = executor
+        self.loop = None
+        self._outbox = None
+        self._lock = threading.Lock()
+        self._early = [] # (callback, args) made before start()
+
+    def start(self, loop):
+        with self._lock:
+            self.loop = loop
+            self._outbox = asyncio.Queue()
+            loop.create_task(self._send())
+            for callback, args in self._early:
+                loop.call_soon(callback, *args)
+            self._early = []
+
+    def emit(self, event, data, room):
+        self._call_soon(self._enqueue, (self.sio.emit, (event, data), {'room': room}))
+
+    def join_room(self, sid, room):
+        self._call_soon(self._enqueue, (self.sio.enter_room, (sid, room), {}))
+
+    def leave_room(self, sid, room):
+        self._call_soon(self._enqueue, (self.sio.leave_room, (sid, room), {}))
+
+    def spawn(self, function, *args):
+        self._call_soon(self._run_in_executor, functools.partial(function, *args))
+
+    def _call_soon(self, callback, *args):
+        with self._lock:
+            if self.loop is None:
+                self._early.append((callback, args))
+                return
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def _enqueue(self, item):
+        self._outbox.put_nowait(item)
+
+    def _run_in_executor(self, function):
+        self.loop.run_in_executor(self.executor, function)
+
+    async def _send(self):
+        while True:
+            send, args, kwargs = await self._outbox.get()
+            try:
+                result = send(*args, **kwargs)
+                if inspect.isawaitable(result): # enter_room/leave_room are coroutines in newer python-socketio releases
+                    await result
+            except Exception as e:
+                logger.error("Could not send %s to the client: %s", args[0], e)
+
+
+executor = ThreadPoolExecutor(max_workers=config['ASYNC_EXECUTOR_WORKERS'], thread_name_prefix='voting')
+transport = AsyncioTransport(sio, executor)
+voting = create_voting_service(config, transport) if SERVER_PROCESS else None
+
+async def in_executor(function, *args):
+    # VotingService methods take per-session locks (or SQLite write transactions) that other threads
+    # hold too, and some split or reconstruct secrets, so they never run on the loop itself
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(function, *args))
+
+sid_tails = {} # SID -> future done when its latest event has been handled
+
+async def handle_in_order(sid, function, *args):
+    # Runs an event in the executor after the same client's earlier events, so e.g. a disconnect
+    # is never handled before the join_session_resident sent just before it
+    previous = sid_tails.get(sid)
+    done = sid_tails[sid] = asyncio.get_running_loop().create_future()
+    try:
+        if previous is not None:
+            await previous
+        return await in_executor(function, *args)
+    finally:
+        done.set_result(None)
+        if sid_tails.get(sid) is done:
+            del sid_tails[sid]
+
+async def start_transport(app):
+    transport.start(asyncio.get_running_loop())
+
+web_app.on_startup.append(start_transport)
+
+async def admin_index(request):
+    return web.Response(text=templates.get_template('main_display.html').render(socketio_serializer=config['SOCKETIO_SERIALIZER']),
+                        content_type='text/html')
+
+async def readiness(request):
+    # Readiness probe: 503 until the NLP engine can process purposes
+    ready = voting.nlp_engine.is_ready()
+    return web.json_response({'ready': ready, 'nlp_engine': voting.nlp_engine.stats()}, status=200 if ready else 503)
+
+async def metrics(request):
+    # NLP stage histograms and live sessions per status: Prometheus text format by default, JSON with ?format=json
+    if request.query.get('format') == 'json':
+        return web.Response(text=voting.metrics_json(), content_type='application/json')
+    return web.Response(text=voting.metrics_prometheus(), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+async def resident_join_page(request):
+    session_id = request.match_info['session_id']
+    if await in_executor(voting.session_store.__contains__, session_id):
+        return web.Response(text=templates.get_template('resident_vote.html').render(session_id=session_id, socketio_serializer=config['SOCKETIO_SERIALIZER']),
+                            content_type='text/html')
+    return web.Response(text="Session not found or inactive.", status=404)
+
+def request_host_url(request):
+    return f"{request.scheme}://{request.host}/"
+
+async def session_qr_code(request):
+    # The session's join QR code, rendered when the session was created; ?format=svg|png|compact
+    session_id = request.match_info['session_id']
+    if not await in_executor(voting.session_store.__contains__, session_id):
+        return web.Response(text="Session not found or inactive.", status=404)
+    fmt = request.query.get('format', voting.qr_service.default_format)
+    if fmt not in QR_FORMATS:
+        return web.Response(text=f"Unknown QR code format '{fmt}'.", status=400)
+    rendered = await asyncio.wrap_future(voting.qr_service.get(voting.join_url(request_host_url(request), session_id), fmt))
+    headers = http_cache_headers(rendered, config['QR_HTTP_MAX_AGE'])
+    if etag_matches(rendered, request.headers.get('If-None-Match')):
+        del headers['Content-Type']
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=rendered.body, headers=headers)
+
+web_app.router.add_get('/', admin_index)
+web_app.router.add_get('/ready', readiness)
+web_app.router.add_get('/metrics', metrics)
+web_app.router.add_get('/join/{session_id}', resident_join_page)
+web_app.router.add_get('/qr/{session_id}', session_qr_code)
+
+# --- Socket.IO events; the flow itself is in voting_service.py ---
+@sio.on('create_session')
+async def handle_create_session(sid, data=None):
+    environ = sio.get_environ(sid) or {}
+    host_url = f"{environ.get('wsgi.url_scheme', 'http')}://{environ.get('HTTP_HOST', 'localhost')}/"
+    await handle_in_order(sid, voting.create_session, sid, host_url)
+
+@sio.on('admin_assign_visitor_role')
+async def handle_admin_assign_visitor_role(sid, data):
+    await handle_in_order(sid, voting.assign_visitor_role, sid, data)
+
+@sio.on('visitor_submit_purpose')
+async def handle_visitor_submit_purpose(sid, data):
+    await handle_in_order(sid, voting.submit_purpose, sid, data) # The NLP engine does the work and calls back on its own thread
+
+@sio.on('start_voting_round')
+async def handle_start_voting_round(sid, data):
+    await handle_in_order(sid, voting.start_voting_round, sid, data)
+
+@sio.on('tally_votes')
+async def handle_tally_votes_request(sid, data):
+    await handle_in_order(sid, voting.request_tally, sid, data)
+
+@sio.on('admin_reset_round')
+async def handle_admin_reset_round(sid, data):
+    await handle_in_order(sid, voting.reset_round, sid, data)
+
+@sio.on('request_session_snapshot')
+async def handle_request_session_snapshot(sid, data):
+    await handle_in_order(sid, voting.send_snapshot, sid, data)
+
+@sio.on('join_session_resident')
+async def handle_user_join(sid, data):
+    await handle_in_order(sid, voting.join_session, sid, data)
+
+@sio.on('submit_vote')
+async def handle_submit_vote(sid, data):
+    await handle_in_order(sid, voting.submit_vote, sid, data)
+
+@sio.on('disconnect')
+async def handle_disconnect(sid, reason=None):
+    await handle_in_order(sid, voting.disconnect, sid)
+
+if __name__ == '__main__':
+    web.run_app(web_app, host='0.0.0.0', port=5001)
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import time
+
+import socketio
+
+from benchmark_helpers import percentiles
+
+
+async def open_admin(url):
+    """Connects an admin client and creates a session. Returns (client, session_id)."""
+    admin = socketio.AsyncClient()
+    created = asyncio.get_running_loop().create_future()
+    admin.on('session_created', lambda data: created.done() or created.set_result(data['session_id']))
+    await admin.connect(url, transports=['websocket'])
+    await admin.emit('create_session')
+    return admin, await asyncio.wait_for(created, 30)
+
+
+class Resident:
+    """One resident client; request() sends an event and waits for the named reply."""
+
+    def __init__(self, url, session_id, nickname):
+        self.url = url
+        self.session_id = session_id
+        self.nickname = nickname
+        self.client = socketio.AsyncClient()
+        self.waiting = {}
+        for event in ('joined_successfully_waiting_role', 'role_assigned', 'error', 'nickname_taken_error'):
+            self.client.on(event, self._handler(event))
+
+    def _handler(self, event):
+        def handle(data):
+            future = self.waiting.pop(event, None)
+            if future is not None and not future.done():
+                future.set_result(data)
+        return handle
+
+    async def request(self, event, data, reply, timeout):
+        future = self.waiting[reply] = asyncio.get_running_loop().create_future()
+        await self.client.emit(event, data)
+        return await asyncio.wait_for(future, timeout)
+
+    async def join(self, timeout):
+        await self.client.connect(self.url, transports=['websocket'])
+        # The first join adds the resident; joining again only resends its role (a read-mostly round trip)
+        await self.request('join_session_resident', {'session_id': self.session_id, 'nickname': self.nickname},
+                           'joined_successfully_waiting_role', timeout)
+
+
+async def connect_all(url, session_id, connections, ramp, timeout):
+    """Connects and joins `connections` residents, `ramp` at a time. Returns (joined residents, failures)."""
+    semaphore = asyncio.Semaphore(ramp)
+    residents = [Resident(url, session_id, f"load_{i}") for i in range(connections)]
+
+    async def join(resident):
+        async with semaphore:
+            try:
+                await resident.join(timeout)
+                return True
+            except Exception:
+                return False
+
+    joined = await asyncio.gather(*(join(resident) for resident in residents))
+    return [resident for resident, ok in zip(residents, joined) if ok], joined.count(False)
+
+
+async def drive_events(residents, seconds, timeout):
+    """Each resident re-sends join_session_resident and waits for its role_assigned reply, for `seconds`."""
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+
+    async def loop(resident):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                await resident.request('join_session_resident', {'session_id': resident.session_id, 'nickname': resident.nickname},
+                                       'role_assigned', timeout)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(loop(resident) for resident in residents))
+    elapsed = time.monotonic() - started
+    return dict(percentiles(latencies), round_trips=len(latencies), errors=errors,
+                round_trips_per_second=round(len(latencies) / elapsed, 1))
+
+
+async def run_against(url, connections, ramp, seconds, timeout):
+    admin, session_id = await open_admin(url)
+    started = time.monotonic()
+    residents, failed = await connect_all(url, session_id, connections, ramp, timeout)
+    connect_seconds = time.monotonic() - started
+    result = {'url': url, 'connections_requested': connections, 'connections_held': len(residents), 'connect_failures': failed,
+              'connect_seconds': round(connect_seconds, 2)}
+    result.update(await drive_events(residents, seconds, timeout))
+    await asyncio.gather(*(resident.client.disconnect() for resident in residents), return_exceptions=True)
+    await admin.disconnect()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running server (app.py or async_app.py): connections held and Socket.IO round trips per second.")
+    parser.add_argument("--url", action="append", required=True, help="Server URL; repeat to compare servers, e.g. both entry points on different ports")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--ramp", type=int, default=50, help="Connections opened at a time")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the round-trip phase")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for url in args.url:
+        result = asyncio.run(run_against(url, args.connections, args.ramp, args.seconds, args.timeout))
+        results.append(result)
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from collections import Counter
+
+
+def percentiles(samples_ms):
+    """Latency summary of samples in milliseconds: count, p50/p90/p99 and max (None without samples)."""
+    ordered = sorted(samples_ms)
+    summary = {'count': len(ordered)}
+    for name, q in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p99_ms', 0.99)):
+        summary[name] = round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 3) if ordered else None
+    summary['max_ms'] = round(ordered[-1], 3) if ordered else None
+    return summary
+
+
+class RecordingTransport:
+    """
+    Stands in for the Socket.IO server under VotingService. Keeps room membership the way
+    python-socketio does: a SID is its own room from its first join until it disconnects, and
+    leaves all its rooms then. Counts emits per event and keeps the ones listed in KEPT_EVENTS.
+
+    With `packets`, each emit is also encoded once and the packet written to every SID in the
+    room, as python-socketio sends it; `per_sid` expands each room emit into one emit per member,
+    the way the broadcasts were sent before rooms. spawn() is handed to `spawn` if given (so a
+    run can wait for the tallies the service triggers), otherwise runs on a new thread.
+    """
+
+    KEPT_EVENTS = ('vote_update', 'votes_tallied')
+
+    def __init__(self, spawn=None, packets=False, per_sid=False):
+        self._spawn = spawn
+        self.packets = packets
+        self.per_sid = per_sid
+        self.lock = threading.Lock()
+        self.rooms = {} # room -> SIDs
+        self.sid_rooms = {} # SID -> rooms, for disconnect()
+        self.counts = Counter()
+        self.kept = {event: [] for event in self.KEPT_EVENTS} # (room, data)
+        self.created = {} # Admin SID -> session_id from its session_created
+        self.sockets = {} # SID -> packets written to it
+        self.emits = 0 # Packets encoded
+        self.send_seconds = 0.0 # Time spent encoding and writing packets
+
+    def emit(self, event, data, room):
+        with self.lock:
+            self.counts[event] += 1
+            if event in self.kept:
+                self.kept[event].append((room, data))
+            elif event == 'session_created':
+                self.created[room] = data['session_id']
+            if not self.packets:
+                return
+            started = time.perf_counter()
+            members = self.rooms.get(room) or ((room,) if room in self.sid_rooms else ())
+            if self.per_sid:
+                for sid in list(members):
+                    self._send(event, data, [sid])
+            else:
+                self._send(event, data, members)
+            self.send_seconds += time.perf_counter() - started
+
+    def join_room(self, sid, room):
+        with self.lock:
+            self.rooms.setdefault(room, set()).add(sid)
+            self.sid_rooms.setdefault(sid, set()).add(room)
+
+    def leave_room(self, sid, room):
+        with self.lock:
+            self._leave(sid, room)
+            rooms = self.sid_rooms.get(sid)
+            if rooms is not None:
+                rooms.discard(room)
+
+    def disconnect(self, sid):
+        with self.lock:
+            for room in self.sid_rooms.pop(sid, ()):
+                self._leave(sid, room)
+
+    def members(self, room):
+        with self.lock:
+            return set(self.rooms.get(room, ()))
+
+    def spawn(self, function, *args):
+        if self._spawn:
+            self._spawn(function, *args)
+        else:
+            threading.Thread(target=function, args=args, daemon=True).start()
+
+    def _send(self, event, data, sids):
+        self.emits += 1
+        packet = '42' + json.dumps([event, data], separators=(',', ':'))
+        for sid in sids:
+            self.sockets.setdefault(sid, []).append(packet)
+
+    def _leave(self, sid, room):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self.rooms[room]
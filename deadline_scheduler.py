@@ -0,0 +1,141 @@
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """A scheduled call; cancel() it like a threading.Timer."""
+    __slots__ = ('deadline', 'callback', 'args', '_scheduler', '_tick', '_slot')
+
+    def __init__(self, scheduler, deadline, callback, args):
+        self.deadline = deadline # time.monotonic() value
+        self.callback = callback
+        self.args = args
+        self._scheduler = scheduler
+        self._tick = None
+        self._slot = None # Wheel slot while pending; None once fired or cancelled
+
+    def cancel(self):
+        """Returns True if the call was still pending and will not run."""
+        return self._scheduler._cancel(self)
+
+
+class DeadlineScheduler:
+    """
+    Runs calls after a delay from one thread, using a hashed timing wheel: `wheel_size` slots
+    of `tick` seconds each, a call going into the slot of the tick it is due in (calls more
+    than one rotation away wait there for their turn). Scheduling and cancelling are O(1), and
+    the thread sleeps until the next slot holding a call, so a lone periodic call (e.g. the
+    session sweep) wakes it once per period rather than every tick. Calls run at most one tick
+    late. Due calls are handed to `spawn(callback, *args)` if given, so a slow callback does
+    not hold up the others; without it they run on the scheduler thread.
+    """
+
+    def __init__(self, tick=0.1, wheel_size=1024, spawn=None):
+        self.tick = tick
+        self.wheel_size = wheel_size
+        self.spawn = spawn
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._wheel = [set() for _ in range(wheel_size)]
+        self._origin = time.monotonic()
+        self._next_tick = 0 # First tick whose slot has not been processed yet
+        self._wake_tick = None # Tick the thread is sleeping until; None while nothing is pending
+        self._counters = {'pending': 0, 'scheduled': 0, 'fired': 0, 'cancelled': 0, 'wakeups': 0}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='deadline-scheduler', daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, callback, *args):
+        """Schedules callback(*args) in `delay` seconds. Returns its TimerHandle."""
+        handle = TimerHandle(self, time.monotonic() + delay, callback, args)
+        with self._lock:
+            if not self._counters['pending']:
+                self._skip_idle_ticks()
+            handle._tick = max(math.ceil((handle.deadline - self._origin) / self.tick), self._next_tick)
+            handle._slot = handle._tick % self.wheel_size
+            self._wheel[handle._slot].add(handle)
+            self._counters['pending'] += 1
+            self._counters['scheduled'] += 1
+            if self._wake_tick is None or handle._tick < self._wake_tick:
+                self._wakeup.notify() # Due before the thread would next wake
+        return handle
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def stop(self):
+        """Stops the thread; pending calls do not run."""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+
+    def _cancel(self, handle):
+        with self._lock:
+            if handle._slot is None:
+                return False
+            self._wheel[handle._slot].discard(handle)
+            handle._slot = None
+            self._counters['pending'] -= 1
+            self._counters['cancelled'] += 1
+            return True
+
+    def _skip_idle_ticks(self):
+        # With nothing pending there are no slots to visit up to now
+        self._next_tick = max(self._next_tick, int((time.monotonic() - self._origin) / self.tick) + 1)
+
+    def _next_occupied_tick(self):
+        # Called with the lock held while calls are pending: the first tick from _next_tick whose
+        # slot is not empty (its calls may still be a rotation or more away)
+        for tick in range(self._next_tick, self._next_tick + self.wheel_size):
+            if self._wheel[tick % self.wheel_size]:
+                return tick
+        return self._next_tick + self.wheel_size
+
+    def _collect_due(self):
+        # Called with the lock held
+        if not self._counters['pending']:
+            self._skip_idle_ticks()
+            return []
+        now_tick = int((time.monotonic() - self._origin) / self.tick)
+        due = []
+        while self._next_tick <= now_tick:
+            slot = self._wheel[self._next_tick % self.wheel_size]
+            if slot:
+                ready = [handle for handle in slot if handle._tick <= self._next_tick]
+                for handle in ready:
+                    slot.discard(handle)
+                    handle._slot = None
+                due.extend(ready)
+            self._next_tick += 1
+        self._counters['pending'] -= len(due)
+        self._counters['fired'] += len(due)
+        return due
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due = self._collect_due()
+                while not due and not self._stopped:
+                    timeout = None
+                    self._wake_tick = self._next_occupied_tick() if self._counters['pending'] else None
+                    if self._wake_tick is not None:
+                        timeout = max(0.0, self._origin + self._wake_tick * self.tick - time.monotonic())
+                    self._wakeup.wait(timeout)
+                    self._counters['wakeups'] += 1
+                    due = self._collect_due()
+                self._wake_tick = None
+                if self._stopped:
+                    return
+            for handle in due:
+                try:
+                    if self.spawn:
+                        self.spawn(handle.callback, *handle.args)
+                    else:
+                        handle.callback(*handle.args)
+                except Exception as e:
+                    logger.error("Deadline scheduler: call to %s failed: %s", getattr(handle.callback, '__name__', handle.callback), e)
@@ -0,0 +1,108 @@
+import argparse
+import json
+import threading
+import time
+import tracemalloc
+
+from deadline_scheduler import DeadlineScheduler
+
+
+def rss_kb():
+    """Resident set size of this process in kB, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def noop(*args):
+    pass
+
+
+def measure_pending(rounds, use_threads, delay):
+    """Threads and memory with `rounds` round timers pending, then the time to cancel them all."""
+    threads_before, rss_before = threading.active_count(), rss_kb()
+    tracemalloc.start()
+    scheduler = None if use_threads else DeadlineScheduler()
+    started = time.perf_counter()
+    timers = []
+    for i in range(rounds):
+        if use_threads:
+            timer = threading.Timer(delay, noop, args=[f"session_{i}"])
+            timer.start()
+        else:
+            timer = scheduler.call_later(delay, noop, f"session_{i}")
+        timers.append(timer)
+    schedule_us = (time.perf_counter() - started) / rounds * 1e6
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        'rounds': rounds,
+        'threads': threading.active_count() - threads_before,
+        'rss_kb': rss_kb() - rss_before if rss_before is not None else None,
+        'python_heap_kb': round(allocated / 1024),
+        'schedule_us': round(schedule_us, 2),
+    }
+    started = time.perf_counter()
+    for timer in timers:
+        timer.cancel()
+    result['cancel_us'] = round((time.perf_counter() - started) / rounds * 1e6, 2)
+    if use_threads:
+        for timer in timers:
+            timer.join()
+    else:
+        scheduler.stop()
+        scheduler._thread.join() # So the next measurement's thread count starts clean
+    return result
+
+
+def measure_lateness(count, delay, tick):
+    """How late `count` calls due over `delay` seconds run after their deadline, in ms."""
+    scheduler = DeadlineScheduler(tick=tick)
+    lateness = []
+    done = threading.Event()
+
+    def record(deadline):
+        lateness.append((time.monotonic() - deadline) * 1000)
+        if len(lateness) == count:
+            done.set()
+
+    for i in range(count):
+        call_delay = delay * (i + 1) / count
+        scheduler.call_later(call_delay, record, time.monotonic() + call_delay)
+    done.wait(delay + 10)
+    scheduler.stop()
+    lateness.sort()
+    return {'calls': count, 'tick_ms': tick * 1000, 'min_ms': round(lateness[0], 2),
+            'p50_ms': round(lateness[len(lateness) // 2], 2), 'p99_ms': round(lateness[int(len(lateness) * 0.99)], 2),
+            'max_ms': round(lateness[-1], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a thread per round timer with the shared deadline scheduler.")
+    parser.add_argument("--rounds", default="100,1000,5000,10000", help="Concurrent round timers to hold pending")
+    parser.add_argument("--skip-threads", action="store_true", help="Only measure the scheduler (threading.Timer at 10k rounds is slow)")
+    parser.add_argument("--lateness-calls", type=int, default=2000)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {'pending': [], 'lateness': None}
+    for rounds in [int(r) for r in args.rounds.split(',')]:
+        entry = {'rounds': rounds, 'deadline_scheduler': measure_pending(rounds, use_threads=False, delay=300)}
+        if not args.skip_threads:
+            entry['threading_timer'] = measure_pending(rounds, use_threads=True, delay=300)
+        results['pending'].append(entry)
+        print(json.dumps(entry))
+    results['lateness'] = measure_lateness(args.lateness_calls, 2.0, 0.1)
+    print(json.dumps(results['lateness']))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over named groups of keywords. One scan of a text reports every
+    group with at least one keyword occurring in it as a substring, in time linear in the
+    text length no matter how many keywords the groups hold.
+
+    groups_by_term also serves exact lookups, e.g. of a token's lemma.
+    """
+
+    def __init__(self, keyword_groups):
+        self.keyword_groups = {group: frozenset(term.lower() for term in terms)
+                               for group, terms in keyword_groups.items()}
+        self.groups_by_term = {}
+        for group, terms in self.keyword_groups.items():
+            for term in terms:
+                self.groups_by_term.setdefault(term, set()).add(group)
+        self.groups_by_term = {term: frozenset(groups) for term, groups in self.groups_by_term.items()}
+
+        self._goto = [{}]     # state -> {char: next_state}
+        self._fail = [0]      # state -> failure state
+        self._outputs = [()]  # state -> ((group, term), ...) ending at this state
+        for term in self.groups_by_term:
+            if term:
+                self._add_term(term)
+        self._build_failure_links()
+
+    def scan(self, text):
+        """Returns {group: [matched terms in order of appearance]} for a lowercased text."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        hits = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for group, term in outputs[state]:
+                terms = hits.setdefault(group, [])
+                if term not in terms:
+                    terms.append(term)
+        return hits
+
+    def _add_term(self, term):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] = tuple((group, term) for group in sorted(self.groups_by_term[term]))
+
+    def _build_failure_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # A state also reports every keyword that is a suffix of its own
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
@@ -0,0 +1,117 @@
+import copy
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_purpose_text(text):
+    """Cache key for a purpose: lowercased, punctuation dropped, whitespace collapsed."""
+    text = _PUNCTUATION_RE.sub(" ", (text or "").lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class NLPResultCache:
+    """
+    Bounded, thread-safe LRU cache with a TTL for structured NLP results, keyed on the
+    normalized purpose text. Entries are stored and returned as deep copies, so callers can
+    modify what they get back without corrupting the cache.
+
+    If persist_path is given, entries are also written through to a SQLite file and
+    reloaded from it on startup, so the cache survives restarts.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (stored_at, structured_data); most recently used last
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS nlp_results "
+                             "(key TEXT PRIMARY KEY, stored_at REAL NOT NULL, result TEXT NOT NULL)")
+            self._db.commit()
+            self._load_persisted()
+
+    def get(self, text_purpose):
+        """Returns a copy of the cached structured dict for this purpose, or None."""
+        key = normalize_purpose_text(text_purpose)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            stored_at, structured_data = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                if self._db:
+                    self._db.commit()
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            result = copy.deepcopy(structured_data)
+        result['raw_text'] = text_purpose # Same key, but keep the caller's exact wording
+        return result
+
+    def put(self, text_purpose, structured_data):
+        if structured_data.get('error'): # Never cache failures (e.g. model not loaded)
+            return
+        key = normalize_purpose_text(text_purpose)
+        stored_at = time.time()
+        structured_data = copy.deepcopy(structured_data)
+        with self._lock:
+            self._entries[key] = (stored_at, structured_data)
+            self._entries.move_to_end(key)
+            if self._db:
+                self._db.execute("INSERT OR REPLACE INTO nlp_results (key, stored_at, result) VALUES (?, ?, ?)",
+                                 (key, stored_at, json.dumps(structured_data)))
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._counters['evictions'] += 1
+            if self._db:
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db:
+                self._db.execute("DELETE FROM nlp_results")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _remove(self, key):
+        # Caller holds self._lock and commits
+        self._entries.pop(key, None)
+        if self._db:
+            self._db.execute("DELETE FROM nlp_results WHERE key = ?", (key,))
+
+    def _load_persisted(self):
+        oldest_allowed = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM nlp_results WHERE stored_at < ?", (oldest_allowed,))
+        self._db.commit()
+        # Newest entries are loaded last so they end up as the most recently used ones
+        rows = self._db.execute("SELECT key, stored_at, result FROM nlp_results "
+                                "ORDER BY stored_at DESC LIMIT ?", (self.max_entries,)).fetchall()
+        with self._lock:
+            for key, stored_at, result in reversed(rows):
+                self._entries[key] = (stored_at, json.loads(result))
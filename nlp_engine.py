@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import nlp_module
+from nlp_module import (process_visitor_purposes_nlp_batch, nlp_unavailable_result, load_nlp_model,
+                        is_nlp_model_ready, warm_up_nlp_model, enable_nlp_profiling, NLPTierMetrics)
+from structured_logging import configure_worker_logging, start_worker_log_listener, stop_worker_log_listener
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(log_queue, log_level):
+    """Pool initializer: logs through the parent's listener, then loads the model right away."""
+    configure_worker_logging(log_queue, log_level)
+    load_nlp_model()
+
+
+def _process_batch_in_worker(texts, batch_size, profile_sample_rate):
+    """
+    Runs in an engine worker process. Returns the structured dicts plus the stage profile and
+    tier metrics recorded in this worker since its last batch, which the parent merges into its own.
+    """
+    if profile_sample_rate and (nlp_module.NLP_PROFILER is None or nlp_module.NLP_PROFILER.sample_rate != profile_sample_rate):
+        enable_nlp_profiling(profile_sample_rate)
+    results = process_visitor_purposes_nlp_batch(texts, batch_size=batch_size)
+    profile = nlp_module.NLP_PROFILER.drain() if profile_sample_rate else None
+    return results, profile, nlp_module.NLP_TIER_METRICS.drain()
+
+
+class NLPEngine:
+    """
+    Shared NLP service for all sessions. Purposes are queued and processed in micro-batches
+    (one NLP_MODEL.pipe() call per batch), either in the engine thread (num_workers=0) or in a
+    pool of worker processes that each hold their own copy of the spaCy model.
+
+    submit() never blocks on NLP work: the caller gets a Future and/or a callback that is
+    invoked with the structured NLP dict once its batch is done. Finished batches are
+    resolved on the engine's resolver threads, never on the pool's own result thread, and each
+    callback runs there on its own, so one that waits for a busy session holds up no other
+    purpose. With a result cache, hits are resolved immediately and never reach the queue.
+    """
+
+    def __init__(self, num_workers=2, max_batch_size=16, max_batch_wait=0.01, cache=None, profiler=None, start_method='spawn',
+                 resolver_threads=4):
+        self.num_workers = num_workers
+        self.cache = cache
+        # Stage profiler (from enable_nlp_profiling) that worker profiles are merged into
+        self.profiler = profiler
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait # Seconds to wait for more purposes before dispatching a batch
+
+        self._queue = queue.Queue()
+        self._pool = None
+        self._log_listener = None
+        if num_workers > 0:
+            # Workers are spawned (or started by a fork server), never forked from this process: it
+            # already runs threads whose locks a fork would copy, and a forked worker would log into
+            # this process's in-memory log queue, which nothing in the worker drains.
+            # Each worker loads its own model as soon as it starts, not on its first batch.
+            mp_context = multiprocessing.get_context(start_method)
+            self._log_listener = start_worker_log_listener(mp_context)
+            self._pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context, initializer=_init_worker,
+                                             initargs=(self._log_listener.queue, logging.getLogger().getEffectiveLevel()))
+        self._warm_up_futures = []
+        # Keep at most two batches in flight per worker; anything beyond that stays in the
+        # queue, so batches grow under bursty load instead of piling up inside the pool.
+        self._in_flight = threading.BoundedSemaphore(max(1, num_workers) * 2)
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'processed': 0, 'failed': 0, 'batches': 0}
+        # Per-tier latencies: recorded in this process by the in-process engine, merged from the workers otherwise
+        self.tier_metrics = NLPTierMetrics() if self._pool else nlp_module.NLP_TIER_METRICS
+
+        # Callbacks take session locks and write the store, so they must not hold up the pool's
+        # result handling (or the collector): batches are resolved and callbacks run on these threads
+        self._resolver = ThreadPoolExecutor(max_workers=resolver_threads, thread_name_prefix='nlp-engine-resolver')
+
+        self._collector = threading.Thread(target=self._collect_batches, name='nlp-engine-collector', daemon=True)
+        self._collector.start()
+
+    def submit(self, text_purpose, callback=None):
+        """
+        Queues a purpose for processing. Returns a Future resolving to the structured NLP dict.
+        If given, callback(structured_data) is called on a resolver thread when it is ready.
+        """
+        future = Future()
+        if callback:
+            future.add_done_callback(lambda done: self._schedule_callback(callback, done.result()))
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+        if self.cache:
+            cached = self.cache.get(text_purpose)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        self._queue.put((text_purpose, future))
+        return future
+
+    def warm_up(self):
+        """
+        Starts loading the model without blocking: in a background thread for the in-process
+        engine, or by starting the worker processes (their initializer loads the model).
+        """
+        if not self._pool:
+            warm_up_nlp_model(background=True)
+            return
+        self._warm_up_futures = [self._pool.submit(load_nlp_model) for _ in range(self.num_workers)]
+
+    def is_ready(self):
+        """
+        True once the model is loaded where batches are processed. For the worker pool that is
+        what the workers' load_nlp_model calls returned; the first check starts them if
+        warm_up() was not called.
+        """
+        if not self._pool:
+            return is_nlp_model_ready()
+        if not self._warm_up_futures:
+            self.warm_up()
+        return all(future.done() and not future.exception() and future.result() for future in self._warm_up_futures)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def shutdown(self, wait=True):
+        self._queue.put(None) # Sentinel: stop collecting
+        if wait:
+            self._collector.join()
+        if self._pool:
+            self._pool.shutdown(wait=wait)
+            if wait: # Otherwise workers may still log; the listener is stopped at exit
+                stop_worker_log_listener(self._log_listener)
+        self._resolver.shutdown(wait=wait) # After the pool, whose last batches are queued for resolving by now
+
+    def _collect_batches(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_batch_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        texts = [text for text, _ in batch]
+        if not self._pool:
+            done = Future()
+            try:
+                done.set_result((process_visitor_purposes_nlp_batch(texts, batch_size=len(texts)), None, None))
+            except Exception as e:
+                done.set_exception(e)
+            self._resolver.submit(self._resolve_done, batch, done)
+            return
+
+        self._in_flight.acquire()
+        try:
+            profile_sample_rate = self.profiler.sample_rate if self.profiler else 0
+            pool_future = self._pool.submit(_process_batch_in_worker, texts, len(texts), profile_sample_rate)
+        except Exception as e: # Pool broken or shut down
+            self._in_flight.release()
+            self._resolve_failed(batch, e)
+            return
+
+        def on_batch_done(done): # On the pool's result thread: only hands the batch over
+            self._in_flight.release()
+            self._resolver.submit(self._resolve_done, batch, done)
+        pool_future.add_done_callback(on_batch_done)
+
+    def _resolve_done(self, batch, done):
+        try:
+            if done.exception():
+                self._resolve_failed(batch, done.exception())
+                return
+            results, profile, tier_metrics = done.result()
+            if profile and self.profiler:
+                self.profiler.merge(profile)
+            if tier_metrics:
+                self.tier_metrics.merge(tier_metrics)
+            self._resolve(batch, results)
+        except Exception:
+            logger.exception("NLP engine: resolving a batch of %d purposes failed", len(batch))
+
+    def _schedule_callback(self, callback, structured_data):
+        try:
+            self._resolver.submit(self._run_callback, callback, structured_data)
+        except RuntimeError: # Shutting down: no new work for the resolver threads
+            self._run_callback(callback, structured_data)
+
+    def _run_callback(self, callback, structured_data):
+        try:
+            callback(structured_data)
+        except Exception:
+            logger.exception("NLP engine: callback %s failed", getattr(callback, '__qualname__', callback))
+
+    def _resolve(self, batch, results):
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            for structured_data in results:
+                if 'error' in structured_data: # nlp_unavailable_result: the worker has no model
+                    self._stats['failed'] += 1
+                    continue
+                self._stats['processed'] += 1
+                tier_key = f"tier_{structured_data['nlp_tier']}" # Which NLP tier (fast path or full) served it
+                self._stats[tier_key] = self._stats.get(tier_key, 0) + 1
+        for (text, future), structured_data in zip(batch, results):
+            if self.cache and 'error' not in structured_data: # A failure is not cached as the answer
+                self.cache.put(text, structured_data) # Stores its own copy
+            future.set_result(structured_data)
+
+    def _resolve_failed(self, batch, error):
+        logger.error("NLP engine: batch of %d purposes failed: %s", len(batch), error)
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['failed'] += len(batch)
+        # Like process_visitor_purpose_nlp itself, the engine reports failures as data
+        for text, future in batch:
+            future.set_result(nlp_unavailable_result(text, error=f"NLP engine error: {error}"))
@@ -1,30 +1,102 @@
-import spacy
-from spacy.matcher import Matcher
+import json
+import logging
+import threading
+import time
+
+from keyword_matcher import KeywordMatcher
+from nlp_cache import NLPResultCache
+from stage_profiler import StageProfiler, NULL_STAGE_TIMER
+
+logger = logging.getLogger(__name__)
+
+# The spaCy model is loaded lazily, on first use or by warm_up_nlp_model(), so importing this
+# module (and app.py) stays cheap. spaCy itself is only imported at that point as well.
+NLP_MODEL_NAME = "en_core_web_sm"
+# Components not to load. The rule logic below reads every component en_core_web_sm enables:
+# tok2vec, tagger and attribute_ruler (pos_), lemmatizer (lemma_), parser (dep_, children,
+# noun_chunks) and ner (ents). Its one disabled component, senter, is never run anyway, so
+# there is nothing to leave out; the setting is for other models (see configure_nlp_model).
+NLP_MODEL_EXCLUDE = ()
 
-# Load the spaCy model once when this module is imported
 NLP_MODEL = None
-try:
-    NLP_MODEL = spacy.load("en_core_web_sm")
-    print("spaCy model 'en_core_web_sm' loaded successfully by nlp_module.")
-except OSError:
-    print("ERROR in nlp_module: spaCy model 'en_core_web_sm' not found. "
-          "Please run: python -m spacy download en_core_web_sm")
-
-# Initialize Matcher only if NLP_MODEL is loaded
 matcher = None
-if NLP_MODEL:
-    matcher = Matcher(NLP_MODEL.vocab)
-    # More robust apartment/unit pattern
-    # Catches: apt 3b, apartment 3B, unit 7-A, #5, apt.4
-    apt_pattern = [
-        {"LOWER": {"IN": ["apartment", "apt", "apt.", "unit", "#", "flat"]}},
-        {"IS_PUNCT": True, "OP": "?"}, # Optional punctuation like . after apt
-        {"IS_SPACE": True, "OP": "?"}, # Optional space
-        {"TEXT": {"REGEX": "^[0-9A-Za-z]+([\\-/]?[0-9A-Za-z]+)*$"}} # Number, letter, or combo like 3B, 7-A, 101
-    ]
-    matcher.add("APARTMENT_UNIT_PATTERN", [apt_pattern])
-else:
-    print("Matcher not initialized because spaCy model failed to load.")
+_model_lock = threading.Lock()
+_model_status = {'ready': False, 'loading': False, 'error': None, 'load_seconds': None}
+
+
+def configure_nlp_model(model_name=NLP_MODEL_NAME, exclude=NLP_MODEL_EXCLUDE):
+    """Sets the model and excluded components. Only has an effect before the model is loaded."""
+    global NLP_MODEL_NAME, NLP_MODEL_EXCLUDE
+    with _model_lock:
+        if NLP_MODEL is not None:
+            logger.warning("configure_nlp_model called after the model was loaded; ignoring.")
+            return
+        NLP_MODEL_NAME = model_name
+        NLP_MODEL_EXCLUDE = tuple(exclude)
+
+
+def load_nlp_model():
+    """
+    Loads the spaCy model and builds the Matcher if that has not happened yet. Thread-safe;
+    concurrent callers wait for a single load. Returns True if the model is usable.
+    """
+    global NLP_MODEL, matcher
+    if _model_status['ready']:
+        return True
+    with _model_lock:
+        if _model_status['ready'] or _model_status['error']:
+            return _model_status['ready']
+        _model_status['loading'] = True
+        start = time.perf_counter()
+        try:
+            import spacy
+            from spacy.matcher import Matcher
+
+            nlp_model = spacy.load(NLP_MODEL_NAME, exclude=list(NLP_MODEL_EXCLUDE))
+            logger.info("spaCy model '%s' loaded successfully (pipeline: %s).", NLP_MODEL_NAME, nlp_model.pipe_names)
+        except (ImportError, OSError) as e:
+            _model_status['error'] = str(e)
+            _model_status['loading'] = False
+            logger.error("spaCy model '%s' could not be loaded (%s); Matcher not initialized. "
+                         "Please run: pip install spacy && python -m spacy download %s", NLP_MODEL_NAME, e, NLP_MODEL_NAME)
+            return False
+
+        nlp_matcher = Matcher(nlp_model.vocab)
+        # More robust apartment/unit pattern
+        # Catches: apt 3b, apartment 3B, unit 7-A, #5, apt.4
+        apt_pattern = [
+            {"LOWER": {"IN": ["apartment", "apt", "apt.", "unit", "#", "flat"]}},
+            {"IS_PUNCT": True, "OP": "?"}, # Optional punctuation like . after apt
+            {"IS_SPACE": True, "OP": "?"}, # Optional space
+            {"TEXT": {"REGEX": "^[0-9A-Za-z]+([\\-/]?[0-9A-Za-z]+)*$"}} # Number, letter, or combo like 3B, 7-A, 101
+        ]
+        nlp_matcher.add("APARTMENT_UNIT_PATTERN", [apt_pattern])
+
+        NLP_MODEL, matcher = nlp_model, nlp_matcher
+        _model_status['load_seconds'] = time.perf_counter() - start
+        _model_status['loading'] = False
+        _model_status['ready'] = True
+        return True
+
+
+def warm_up_nlp_model(background=True):
+    """Loads the model ahead of the first request, by default in a daemon thread."""
+    if not background:
+        return load_nlp_model()
+    thread = threading.Thread(target=load_nlp_model, name='nlp-model-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_nlp_model_ready():
+    return _model_status['ready']
+
+
+def nlp_model_status():
+    status = dict(_model_status)
+    status['model'] = NLP_MODEL_NAME
+    status['excluded_components'] = list(NLP_MODEL_EXCLUDE)
+    return status
 
 
 # Define lemmatized keyword lists (moved to global for clarity)
@@ -33,21 +105,302 @@ GUEST_LEMMAS = {"visit", "see", "meet", "friend", "guest", "consultation"} # Add
 SERVICE_LEMMAS = {"maintain", "maintenance", "repair", "fix", "service", "install", "check", "electrician", "plumber", "technician"}
 EMERGENCY_LEMMAS = {"emergency", "urgent", "help"} # "help" can be ambiguous, use with care
 
+# Service keywords naming a trade rather than a generic service verb (technician_role_* categories)
+SERVICE_ROLE_LEMMAS = SERVICE_LEMMAS - {"service", "repair", "fix", "check", "maintain", "maintenance"}
+FOOD_KEYWORDS = {"food", "pizza"}
+
 # Keywords for specific visitor categories (can be expanded)
 KNOWN_COURIERS_LOWER = {"dhl", "fedex", "ups", "post"}
 
+# All keyword sets are compiled into one matcher, so intent, urgency and role keywords are
+# found in a single scan of the purpose. Keyword lists can grow via extend_keyword_groups().
+KEYWORD_GROUPS = {
+    'EMERGENCY': EMERGENCY_LEMMAS,
+    'SERVICE': SERVICE_LEMMAS,
+    'SERVICE_ROLE': SERVICE_ROLE_LEMMAS, # A new trade goes into both SERVICE and SERVICE_ROLE
+    'DELIVERY': DELIVERY_LEMMAS,
+    'GUEST': GUEST_LEMMAS,
+    'FOOD': FOOD_KEYWORDS,
+    'URGENT': {"urgent"},
+    'FRIEND': {"friend"},
+}
+KEYWORD_MATCHER = KeywordMatcher(KEYWORD_GROUPS)
 
-def process_visitor_purpose_nlp(text_purpose):
-    if not NLP_MODEL or not matcher: # Check both
-        return {
-            'raw_text': text_purpose, 'intent': 'nlp_unavailable', 'visitor_category': 'unknown_visitor',
-            'entities': [], 'target_entity_text': None, 'error': "spaCy model or Matcher not loaded"
-        }
 
-    doc = NLP_MODEL(text_purpose)
-    lower_purpose = text_purpose.lower() # Define it once for reuse
+def extend_keyword_groups(extra_groups):
+    """Adds keywords ({group: [terms]}) to KEYWORD_GROUPS and recompiles the matcher."""
+    global KEYWORD_MATCHER
+    for group, terms in extra_groups.items():
+        KEYWORD_GROUPS.setdefault(group, set()).update(term.lower() for term in terms)
+    KEYWORD_MATCHER = KeywordMatcher(KEYWORD_GROUPS)
+    NLP_RESULT_CACHE.clear() # Cached results may classify differently now
+
+
+def load_keyword_groups_file(path):
+    """Extends the keyword groups from a JSON file of the form {"DELIVERY": ["courier", ...], ...}."""
+    with open(path, encoding='utf-8') as f:
+        extend_keyword_groups(json.load(f))
+
+
+def nlp_unavailable_result(text_purpose, error="spaCy model or Matcher not loaded"):
+    return {
+        'raw_text': text_purpose, 'intent': 'nlp_unavailable', 'visitor_category': 'unknown_visitor',
+        'entities': [], 'target_entity_text': None, 'error': error
+    }
+
+
+# Cache of structured results in front of process_visitor_purpose_nlp (in-memory by default)
+NLP_RESULT_CACHE = NLPResultCache()
+
+
+def configure_nlp_result_cache(max_entries=10000, ttl_seconds=3600, persist_path=None):
+    """Replaces the module's result cache, e.g. to persist it to disk. Returns the new cache."""
+    global NLP_RESULT_CACHE
+    NLP_RESULT_CACHE = NLPResultCache(max_entries=max_entries, ttl_seconds=ttl_seconds, persist_path=persist_path)
+    return NLP_RESULT_CACHE
+
+
+class NLPTierMetrics:
+    """Thread-safe counters and latency totals for the fast-path and full NLP tiers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+        self._fast_path_attempts = 0
+
+    def record(self, tier, seconds, fast_path_attempted):
+        with self._lock:
+            if fast_path_attempted:
+                self._fast_path_attempts += 1
+            tier_stats = self._tiers.setdefault(tier, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            tier_stats['count'] += 1
+            tier_stats['total_seconds'] += seconds
+            tier_stats['max_seconds'] = max(tier_stats['max_seconds'], seconds)
+
+    def drain(self):
+        """Returns the raw counters and resets them (used to ship worker data to the parent)."""
+        with self._lock:
+            drained = {'tiers': self._tiers, 'fast_path_attempts': self._fast_path_attempts}
+            self._tiers, self._fast_path_attempts = {}, 0
+        return drained
+
+    def merge(self, drained):
+        with self._lock:
+            self._fast_path_attempts += drained['fast_path_attempts']
+            for tier, other in drained['tiers'].items():
+                tier_stats = self._tiers.setdefault(tier, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                tier_stats['count'] += other['count']
+                tier_stats['total_seconds'] += other['total_seconds']
+                tier_stats['max_seconds'] = max(tier_stats['max_seconds'], other['max_seconds'])
+
+    def snapshot(self):
+        with self._lock:
+            tiers = {tier: dict(tier_stats) for tier, tier_stats in self._tiers.items()}
+            attempts = self._fast_path_attempts
+        for tier_stats in tiers.values():
+            tier_stats['mean_seconds'] = tier_stats['total_seconds'] / tier_stats['count']
+        fast_path_hits = tiers.get('fast_path', {}).get('count', 0)
+        return {'tiers': tiers, 'fast_path_attempts': attempts,
+                'fast_path_hit_rate': fast_path_hits / attempts if attempts else 0.0}
+
+    def export_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for metric, kind, description, field in (
+                ("nlp_tier_purposes_total", "counter", "Purposes classified, by NLP tier.", 'count'),
+                ("nlp_tier_seconds_total", "counter", "Time spent classifying purposes, by NLP tier.", 'total_seconds'),
+                ("nlp_tier_seconds_max", "gauge", "Slowest purpose so far, by NLP tier.", 'max_seconds')):
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+            for tier in sorted(snapshot['tiers']):
+                lines.append(f'{metric}{{tier="{tier}"}} {snapshot["tiers"][tier][field]}')
+        lines += ["# HELP nlp_fast_path_attempts_total Purposes the fast path was tried on.",
+                  "# TYPE nlp_fast_path_attempts_total counter", f"nlp_fast_path_attempts_total {snapshot['fast_path_attempts']}"]
+        return "\n".join(lines) + "\n"
+
+
+# Per-process tier metrics (worker processes of the NLP engine drain theirs into the engine's)
+NLP_TIER_METRICS = NLPTierMetrics()
+
+
+def nlp_tier_metrics():
+    return NLP_TIER_METRICS.snapshot()
+
+
+# Opt-in per-stage profiling (see enable_nlp_profiling); None means no instrumentation overhead
+NLP_PROFILER = None
+
+
+def enable_nlp_profiling(sample_rate=0.01):
+    """Profiles a sample_rate fraction of NLP calls per stage and per spaCy call. Returns the profiler."""
+    global NLP_PROFILER
+    NLP_PROFILER = StageProfiler('nlp', sample_rate=sample_rate)
+    return NLP_PROFILER
+
+
+def disable_nlp_profiling():
+    global NLP_PROFILER
+    NLP_PROFILER = None
+
+
+def _stage_timer():
+    profiler = NLP_PROFILER
+    return profiler.timer() if profiler is not None else NULL_STAGE_TIMER
 
-    structured_data = {
+
+def process_visitor_purpose_nlp(text_purpose, use_cache=True, allow_fast_path=True):
+    if use_cache:
+        cached = NLP_RESULT_CACHE.get(text_purpose)
+        if cached is not None: # Cache hit: spaCy is skipped entirely (not even loaded)
+            return cached
+
+    if not load_nlp_model(): # Loads on first use
+        return nlp_unavailable_result(text_purpose)
+
+    start = time.perf_counter()
+    timer = _stage_timer()
+    structured_data = None
+    if allow_fast_path:
+        structured_data = classify_purpose_fast_path(text_purpose, timer)
+        timer.lap('fast_path.rules')
+    if structured_data is None: # Ambiguous (or fast path disabled): escalate to the full pipeline
+        doc = NLP_MODEL(text_purpose)
+        timer.lap('spacy.parse')
+        structured_data = structure_visitor_purpose_doc(doc, text_purpose, timer)
+    timer.finish()
+    NLP_TIER_METRICS.record(structured_data['nlp_tier'], time.perf_counter() - start, allow_fast_path)
+
+    if use_cache:
+        NLP_RESULT_CACHE.put(text_purpose, structured_data)
+    return structured_data
+
+
+def process_visitor_purposes_nlp_batch(texts, batch_size=32):
+    """
+    Batched variant of process_visitor_purpose_nlp: parses all texts with a single
+    NLP_MODEL.pipe() call and returns the structured dicts in input order. The result
+    cache is not consulted here; callers batching purposes (the NLP engine) do that.
+    """
+    texts = list(texts)
+    if not load_nlp_model():
+        return [nlp_unavailable_result(text) for text in texts]
+
+    results = []
+    escalated = [] # (position in results, text) for purposes the fast path was not sure about
+    for text in texts:
+        start = time.perf_counter()
+        timer = _stage_timer()
+        structured_data = classify_purpose_fast_path(text, timer)
+        timer.lap('fast_path.rules')
+        if structured_data is None:
+            escalated.append((len(results), text))
+        else:
+            timer.finish()
+            NLP_TIER_METRICS.record('fast_path', time.perf_counter() - start, True)
+        results.append(structured_data)
+
+    if escalated:
+        start = time.perf_counter()
+        escalated_texts = [text for _, text in escalated]
+        docs = list(NLP_MODEL.pipe(escalated_texts, batch_size=batch_size))
+        if NLP_PROFILER is not None:
+            NLP_PROFILER.observe('spacy.pipe', time.perf_counter() - start) # Whole batch, one observation
+        for (position, text), doc in zip(escalated, docs):
+            timer = _stage_timer()
+            results[position] = structure_visitor_purpose_doc(doc, text, timer)
+            timer.finish()
+        per_purpose_seconds = (time.perf_counter() - start) / len(escalated)
+        for _ in escalated:
+            NLP_TIER_METRICS.record('full', per_purpose_seconds, True)
+    return results
+
+
+# --- Fast path: tokenizer + rules only ---
+# Capitalized words the fast path can explain without NER (anything else may be a name)
+FAST_PATH_NEUTRAL_WORDS = {"hi", "hello", "hey", "good", "morning", "afternoon", "evening", "please", "sorry",
+                           "delivery", "deliveries"}
+# "help" is too ambiguous to decide an emergency without the tagger
+FAST_PATH_EMERGENCY_KEYWORDS = EMERGENCY_LEMMAS - {"help"}
+# Fields a fast-path result fills differently from the full pipeline on purpose: it never parses,
+# so there is no action object, and its only entity is the courier (lemma = text, label ORG
+# because the courier name rules say so, not NER). Every other field must match the full pipeline.
+FAST_PATH_APPROXIMATE_FIELDS = ('action_object_text', 'entities')
+
+
+def classify_purpose_fast_path(text_purpose, timer=NULL_STAGE_TIMER):
+    """
+    Cheap first tier: tokenizer, keyword matcher and apartment Matcher only (no tagger, parser
+    or NER). Returns the structured dict when the purpose is trivially classifiable, i.e.
+      - a known courier name plus a delivery keyword and no other intent keywords, or
+      - an explicit emergency word and no service keywords,
+    and every capitalized word is explained by the rules (no possible person or other
+    organization names) and the target can be read off the apartment Matcher or the courier
+    name. Returns None if the purpose has to go through the full pipeline.
+    See FAST_PATH_APPROXIMATE_FIELDS for the fields that differ from the full pipeline's.
+    """
+    lower_purpose = text_purpose.lower()
+    keyword_hits = KEYWORD_MATCHER.scan(lower_purpose)
+    intent_groups = {group for group in ('EMERGENCY', 'SERVICE', 'DELIVERY', 'GUEST') if group in keyword_hits}
+    is_emergency = (intent_groups <= {'EMERGENCY', 'DELIVERY', 'GUEST'} and 'EMERGENCY' in intent_groups and
+                    set(keyword_hits['EMERGENCY']) <= FAST_PATH_EMERGENCY_KEYWORDS)
+    timer.lap('fast_path.keywords')
+    if intent_groups != {'DELIVERY'} and not is_emergency:
+        return None
+
+    doc = NLP_MODEL.make_doc(text_purpose) # Tokenizer only
+    timer.lap('spacy.make_doc')
+    location_span = None
+    for match_id, start, end in matcher(doc):
+        if NLP_MODEL.vocab.strings[match_id] == "APARTMENT_UNIT_PATTERN":
+            location_span = doc[start:end]
+            break
+    timer.lap('spacy.matcher')
+
+    courier_token = None
+    for token in doc:
+        if location_span is not None and location_span.start <= token.i < location_span.end:
+            continue
+        if not token.text[:1].isupper():
+            continue
+        if token.lower_ in KNOWN_COURIERS_LOWER:
+            if courier_token is not None and courier_token.lower_ != token.lower_:
+                return None # Two different couriers: let the full pipeline sort it out
+            courier_token = courier_token or token
+        elif not (token.is_stop or token.lower_ in FAST_PATH_NEUTRAL_WORDS or
+                  token.lower_ in KEYWORD_MATCHER.groups_by_term):
+            return None # Possible name the rules can't place
+
+    if is_emergency and courier_token is not None:
+        return None # Courier name in an emergency report: needs NER to place it
+    if not is_emergency and courier_token is None:
+        return None
+    is_visitor_org = courier_token is not None and courier_token.i > 0 and doc[courier_token.i - 1].lower_ == "from"
+    if location_span is None and (is_emergency or is_visitor_org):
+        return None # The target would come from the dependency parse
+
+    structured_data = _new_structured_data(text_purpose, 'fast_path')
+    if location_span is not None:
+        structured_data['target_location_detail'] = location_span.text
+
+    if is_emergency:
+        structured_data['intent'] = 'emergency_alert'
+        structured_data['urgency'] = 'high'
+        structured_data['action_verb_lemma'] = 'alert'
+        structured_data['visitor_category'] = 'informant_emergency'
+    else:
+        structured_data['intent'] = 'delivery_request'
+        structured_data['action_verb_lemma'] = 'deliver'
+        if 'FOOD' in keyword_hits: structured_data['urgency'] = 'medium'
+        structured_data['visitor_category'] = f'courier_{courier_token.lower_}'
+        structured_data['entities'].append({'text': courier_token.text, 'label': 'ORG', 'lemma': courier_token.text})
+        if not is_visitor_org: # "... from DHL" names the visitor's own organization, not the target
+            structured_data['target_organization'] = courier_token.text
+
+    structured_data['target_entity_text'] = structured_data['target_location_detail'] or structured_data['target_organization']
+    return structured_data
+
+
+def _new_structured_data(text_purpose, nlp_tier):
+    return {
         'raw_text': text_purpose,
         'intent': 'inquiry', # Default
         'visitor_category': 'unknown_visitor',
@@ -58,9 +411,20 @@ def process_visitor_purpose_nlp(text_purpose):
         'action_verb_lemma': None,
         'action_object_text': None,
         'target_entity_text': None,
-        'urgency': 'normal' # New field for urgency
+        'urgency': 'normal', # New field for urgency
+        'nlp_tier': nlp_tier # Which tier produced this result: 'fast_path' or 'full'
     }
 
+
+def structure_visitor_purpose_doc(doc, text_purpose, timer=NULL_STAGE_TIMER):
+    """
+    Applies the rule logic to an already parsed spaCy doc and returns the structured dict.
+    timer (from NLP_PROFILER) gets a lap at the end of each numbered stage.
+    """
+    lower_purpose = text_purpose.lower() # Define it once for reuse
+
+    structured_data = _new_structured_data(text_purpose, 'full')
+
     # --- 0. Run Matcher for specific patterns first (e.g., apartment/unit) ---
     matcher_matches = matcher(doc)
     found_locations_from_matcher = []
@@ -70,10 +434,10 @@ def process_visitor_purpose_nlp(text_purpose):
             found_locations_from_matcher.append(span.text)
             if not structured_data['target_location_detail']: # Take the first one for now
                 structured_data['target_location_detail'] = span.text
-                print(f"Matcher found APARTMENT_UNIT: {span.text}")
+                logger.debug("Matcher found APARTMENT_UNIT: %s", span.text)
                 # Add to entities if desired, or just use for target_location_detail
                 structured_data['entities'].append({'text': span.text, 'label': 'LOC_APT_CUSTOM', 'lemma': span.lemma_})
-
+    timer.lap('matcher')
 
     # --- 1. Named Entity Recognition (NER) ---
     # Store all NER entities. We'll use them for refining category and targets.
@@ -81,57 +445,70 @@ def process_visitor_purpose_nlp(text_purpose):
     for ent in doc.ents:
         # Simple title merging (can be expanded)
         text_to_add = ent.text
+        # The entity lemma is the lemma of the first token of text_to_add. It is read from the
+        # tokens already in doc instead of running the whole pipeline again on text_to_add.
+        first_token = ent[0]
         if ent.start > 0 and doc[ent.start - 1].text.lower() in ["mr.", "ms.", "mrs.", "dr."]:
             text_to_add = doc[ent.start - 1].text + " " + ent.text
+            first_token = doc[ent.start - 1]
         
         # Avoid adding if it's part of a location already fully captured by matcher
-        is_part_of_matcher_loc = False
         if structured_data['target_location_detail']:
             # Check if ent.text is a substring of the matcher location AND the matcher location is more specific
             # This simple check might need refinement if NER gives a broader LOC that contains the matcher loc
             if ent.text in structured_data['target_location_detail'] and len(ent.text) < len(structured_data['target_location_detail']):
-                 pass # Don't add if it's a less specific part of what matcher found
+                 continue # Don't add if it's a less specific part of what matcher found
             elif ent.text == structured_data['target_location_detail'] and any(e['label'] == 'LOC_APT_CUSTOM' for e in structured_data['entities']):
-                 pass # Don't add if matcher already added it as custom
-            else:
-                processed_entities.append({'text': text_to_add, 'label': ent.label_, 'lemma': NLP_MODEL(text_to_add)[0].lemma_ if text_to_add else ent.lemma_})
-        else:
-            processed_entities.append({'text': text_to_add, 'label': ent.label_, 'lemma': NLP_MODEL(text_to_add)[0].lemma_ if text_to_add else ent.lemma_})
+                 continue # Don't add if matcher already added it as custom
+        processed_entities.append({'text': text_to_add, 'label': ent.label_, 'lemma': first_token.lemma_})
 
     structured_data['entities'] = processed_entities
+    timer.lap('ner')
 
     # --- 2. Identify Main Action Verb and Initial Intent/Urgency ---
+    # One matcher scan finds every keyword group present in the text (substring match), and
+    # one pass over doc collects the verbs and "from" tokens the later stages look at.
+    keyword_matcher = KEYWORD_MATCHER
+    keyword_hits = keyword_matcher.scan(lower_purpose)
+    first_verb_by_lemma = {}
+    first_verb_by_group = {}
+    from_token_indices = []
+    for token in doc:
+        if token.pos_ == "VERB":
+            first_verb_by_lemma.setdefault(token.lemma_, token)
+            for group in keyword_matcher.groups_by_term.get(token.lemma_, ()):
+                first_verb_by_group.setdefault(group, token)
+        if token.lemma_ == "from" and token.i > 0:
+            from_token_indices.append(token.i)
+
     # Intent detection with priority: emergency > service > delivery > guest > inquiry
-    intent_set = False
-    if any(lemma in lower_purpose for lemma in EMERGENCY_LEMMAS):
+    if 'EMERGENCY' in keyword_hits:
         structured_data['intent'] = 'emergency_alert'
         structured_data['urgency'] = 'high'
         structured_data['action_verb_lemma'] = 'alert' # Default for alert
-        for token in doc: # Try to find a more specific verb
-            if token.lemma_ in EMERGENCY_LEMMAS and token.pos_ == "VERB": structured_data['action_verb_lemma'] = token.lemma_; break
-            if token.lemma_ in SERVICE_LEMMAS and token.pos_ == "VERB": structured_data['action_verb_lemma'] = token.lemma_; break # e.g. "urgent repair"
-        intent_set = True
+        # Try to find a more specific verb, e.g. "urgent repair"
+        specific_verbs = [first_verb_by_group[group] for group in ('EMERGENCY', 'SERVICE') if group in first_verb_by_group]
+        if specific_verbs:
+            structured_data['action_verb_lemma'] = min(specific_verbs, key=lambda token: token.i).lemma_
 
-    if not intent_set and any(lemma in lower_purpose for lemma in SERVICE_LEMMAS):
+    elif 'SERVICE' in keyword_hits:
         structured_data['intent'] = 'service_request'
-        structured_data['action_verb_lemma'] = next((token.lemma_ for token in doc if token.pos_ == "VERB" and token.lemma_ in SERVICE_LEMMAS), 'service')
-        if "urgent" in lower_purpose: structured_data['urgency'] = 'high'
-        intent_set = True
-    
-    if not intent_set and any(lemma in lower_purpose for lemma in DELIVERY_LEMMAS):
+        structured_data['action_verb_lemma'] = first_verb_by_group['SERVICE'].lemma_ if 'SERVICE' in first_verb_by_group else 'service'
+        if 'URGENT' in keyword_hits: structured_data['urgency'] = 'high'
+
+    elif 'DELIVERY' in keyword_hits:
         structured_data['intent'] = 'delivery_request'
         structured_data['action_verb_lemma'] = 'deliver'
-        if "food" in lower_purpose or "pizza" in lower_purpose: structured_data['urgency'] = 'medium'
-        intent_set = True
+        if 'FOOD' in keyword_hits: structured_data['urgency'] = 'medium'
 
-    if not intent_set and any(lemma in lower_purpose for lemma in GUEST_LEMMAS):
+    elif 'GUEST' in keyword_hits:
         structured_data['intent'] = 'guest_access_request'
-        structured_data['action_verb_lemma'] = next((token.lemma_ for token in doc if token.pos_ == "VERB" and token.lemma_ in GUEST_LEMMAS), 'visit')
-        intent_set = True
+        structured_data['action_verb_lemma'] = first_verb_by_group['GUEST'].lemma_ if 'GUEST' in first_verb_by_group else 'visit'
     
     # If intent is still 'inquiry' but was set to 'high' urgency, it's likely an emergency alert
     if structured_data['intent'] == 'inquiry' and structured_data['urgency'] == 'high':
         structured_data['intent'] = 'emergency_alert'
+    timer.lap('intent')
 
     # --- 3. Refine Target Person, Organization, Location (using NER and some context) ---
     # Prioritize entities found by NER for these roles
@@ -149,22 +526,22 @@ def process_visitor_purpose_nlp(text_purpose):
     # Extract visitor's name and org if "I'm X from Y" pattern
     visitor_name_identified = None
     visitor_org_identified = None
-    for i, token in enumerate(doc):
-        if token.lemma_ == "from" and i > 0:
-            prev_token_or_chunk = doc[i-1].text
-            # Check if previous token is a PERSON entity (potential visitor name)
-            for ent in structured_data['entities']:
-                if ent['text'] == prev_token_or_chunk and ent['label'] == 'PERSON':
-                    visitor_name_identified = ent['text']
-                    break
-            # Check if object of "from" is an ORG entity (visitor's org)
-            for child in token.children:
-                if child.dep_ == "pobj":
-                    for ent in structured_data['entities']:
-                        if ent['text'] == child.text and ent['label'] == 'ORG':
-                            visitor_org_identified = ent['text']
-                            break
-                    if visitor_org_identified: break
+    for i in from_token_indices:
+        token = doc[i]
+        prev_token_or_chunk = doc[i-1].text
+        # Check if previous token is a PERSON entity (potential visitor name)
+        for ent in structured_data['entities']:
+            if ent['text'] == prev_token_or_chunk and ent['label'] == 'PERSON':
+                visitor_name_identified = ent['text']
+                break
+        # Check if object of "from" is an ORG entity (visitor's org)
+        for child in token.children:
+            if child.dep_ == "pobj":
+                for ent in structured_data['entities']:
+                    if ent['text'] == child.text and ent['label'] == 'ORG':
+                        visitor_org_identified = ent['text']
+                        break
+                if visitor_org_identified: break
         if visitor_name_identified and visitor_org_identified: break
     
     # If visitor identified, ensure they are not the primary target_person
@@ -174,7 +551,7 @@ def process_visitor_purpose_nlp(text_purpose):
     # If an ORG was identified as visitor's ORG, it's not the target_organization for the visit itself
     if visitor_org_identified and structured_data['target_organization'] == visitor_org_identified:
         structured_data['target_organization'] = None
-
+    timer.lap('targets')
 
     # --- 4. Refine Visitor Category based on Intent and Entities ---
     if structured_data['intent'] == 'delivery_request':
@@ -185,7 +562,7 @@ def process_visitor_purpose_nlp(text_purpose):
                 is_known_courier = True
                 break
         if not is_known_courier:
-            if "food" in lower_purpose or "pizza" in lower_purpose: # Check again for food
+            if 'FOOD' in keyword_hits:
                  structured_data['visitor_category'] = 'food_delivery_generic'
                  if structured_data['target_organization']: # e.g. "Pizza Place"
                      structured_data['visitor_category'] = f'food_delivery_{structured_data["target_organization"].replace(" ","_").lower()}'
@@ -193,7 +570,7 @@ def process_visitor_purpose_nlp(text_purpose):
                  structured_data['visitor_category'] = 'courier_generic'
 
     elif structured_data['intent'] == 'guest_access_request':
-        if "friend" in lower_purpose:
+        if 'FRIEND' in keyword_hits:
             structured_data['visitor_category'] = 'guest_friend'
         elif structured_data['target_person']:
             structured_data['visitor_category'] = 'guest_for_person'
@@ -205,17 +582,13 @@ def process_visitor_purpose_nlp(text_purpose):
         for ent in structured_data['entities']:
             if ent['label'] == 'ORG': # Could be visitor's ORG
                 # A simple check: if "from [ORG]" or ORG name is near service keywords
-                if f"from {ent['text'].lower()}" in lower_purpose or any(lemma in ent['text'].lower() for lemma in SERVICE_LEMMAS):
+                if f"from {ent['text'].lower()}" in lower_purpose or ('SERVICE' in keyword_matcher.scan(ent['text'].lower())):
                     service_org = ent['text']
                     break
         if service_org:
             structured_data['visitor_category'] = f'technician_{service_org.replace(" ", "_").lower()}'
         else: # Check for explicit roles like "electrician" if no ORG found
-            found_role_keyword = None
-            for lemma in SERVICE_LEMMAS:
-                if lemma in lower_purpose and lemma not in {"service", "repair", "fix", "check", "maintain", "maintenance"}: # avoid generic service verbs
-                    found_role_keyword = lemma
-                    break
+            found_role_keyword = keyword_hits['SERVICE_ROLE'][0] if 'SERVICE_ROLE' in keyword_hits else None # First role in the text
             if found_role_keyword:
                 structured_data['visitor_category'] = f'technician_role_{found_role_keyword}'
             else:
@@ -225,16 +598,11 @@ def process_visitor_purpose_nlp(text_purpose):
          structured_data['visitor_category'] = 'informant_emergency' # Person reporting
     elif structured_data['intent'] == 'emergency_access':
          structured_data['visitor_category'] = 'emergency_services' # Assumed actual services
-
+    timer.lap('category')
 
     # --- 5. Refine Action Object and Consolidate Target Entity Text ---
     # This part attempts to find the object of the main action verb if identified.
-    action_verb_node = None
-    if structured_data['action_verb_lemma']:
-        for token in doc:
-            if token.lemma_ == structured_data['action_verb_lemma'] and token.pos_ == "VERB":
-                action_verb_node = token
-                break
+    action_verb_node = first_verb_by_lemma.get(structured_data['action_verb_lemma'])
     
     if action_verb_node:
         for child in action_verb_node.children:
@@ -313,7 +681,7 @@ def process_visitor_purpose_nlp(text_purpose):
         if structured_data['intent'] == 'guest_access_request' and any(e['label']=='PERSON' for e in structured_data['entities']):
             structured_data['target_entity_text'] = next((e['text'] for e in structured_data['entities'] if e['label']=='PERSON'), None)
         # Add more fallbacks if needed
+    timer.lap('action_object')
 
-
-    print(f"Refined NLP Processed: {structured_data}")
+    logger.debug("Refined NLP Processed: %s", structured_data)
     return structured_data
\ No newline at end of file
@@ -0,0 +1,527 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+import spacy
+from spacy.attrs import DEP, HEAD
+from spacy.language import Language
+
+import nlp_module
+from benchmark_helpers import percentiles
+from keyword_matcher import KeywordMatcher
+from nlp_module import (process_visitor_purpose_nlp, process_visitor_purposes_nlp_batch, load_nlp_model,
+                        classify_purpose_fast_path, structure_visitor_purpose_doc, KEYWORD_GROUPS,
+                        FAST_PATH_APPROXIMATE_FIELDS)
+from nlp_module_test import TEST_PHRASES
+
+RESULTS_SCHEMA_VERSION = 1
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nlp_golden.json")
+# Compared per purpose against the golden file, and between the fast path and the full pipeline
+GOLDEN_FIELDS = ('intent', 'visitor_category', 'urgency', 'target_person', 'target_organization',
+                 'target_location_detail', 'target_entity_text', 'action_verb_lemma')
+
+# Purposes grouped by the number of named entities spaCy typically finds in them
+PURPOSES_BY_ENTITY_COUNT = {
+    0: ["Here about the thing.",
+        "I have a package to drop off."],
+    1: ["Hello, I'm here to visit Sandra Müller.",
+        "Pizza for Mark, order number 123."],
+    2: ["Hi, DHL delivery for Sarah Walker.",
+        "Dropping off some documents for Mr. Harrison from FedEx."],
+    4: ["Mike from ACME Plumbing and Anna from FedEx are here to see Sarah Walker and Tom Becker.",
+        "I'm supposed to meet Sarah Walker and Lisa Brown from Google with John Smith for a consultation."],
+    6: ["Mike from ACME Plumbing, Anna from FedEx, Tom from UPS and Lisa from DHL are here to see Sarah Walker and John Smith."],
+}
+
+
+def legacy_entity_lemma_cost(text):
+    """Parse plus one full pipeline run per entity, which is what the old NER stage cost."""
+    doc = nlp_module.NLP_MODEL(text)
+    for ent in doc.ents:
+        nlp_module.NLP_MODEL(ent.text)[0].lemma_
+    return len(doc.ents)
+
+
+def run_entity_count_benchmark(iterations):
+    print(f"{'entities':>8} | {'docs/sec':>10} | {'legacy docs/sec':>15} | {'found':>5}")
+    print("-" * 48)
+    for entity_count, purposes in PURPOSES_BY_ENTITY_COUNT.items():
+        start = time.perf_counter()
+        found_entities = 0
+        for _ in range(iterations):
+            for purpose in purposes:
+                found_entities = len(process_visitor_purpose_nlp(purpose, use_cache=False, allow_fast_path=False)['entities'])
+        docs_per_sec = (iterations * len(purposes)) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for purpose in purposes:
+                legacy_entity_lemma_cost(purpose)
+        legacy_docs_per_sec = (iterations * len(purposes)) / (time.perf_counter() - start)
+
+        print(f"{entity_count:>8} | {docs_per_sec:>10.1f} | {legacy_docs_per_sec:>15.1f} | {found_entities:>5}")
+
+
+# Each startup measurement runs in a fresh interpreter so nothing is already imported or loaded
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import nlp_module
+imported = time.perf_counter()
+nlp_module.configure_nlp_model(exclude={exclude!r})
+ready = nlp_module.load_nlp_model()
+loaded = time.perf_counter()
+if ready:
+    nlp_module.process_visitor_purpose_nlp("Hi, DHL delivery for apartment 3B.", use_cache=False, allow_fast_path=False)
+first = time.perf_counter()
+print(imported - start, loaded - imported, first - loaded, int(ready))
+"""
+
+
+def run_startup_benchmark(runs, exclude=()):
+    configurations = {'full pipeline': ()}
+    if exclude:
+        configurations['without ' + ','.join(exclude)] = exclude
+    print(f"{'configuration':>18} | {'import ms':>9} | {'load ms':>9} | {'first call ms':>13}")
+    print("-" * 60)
+    for name, exclude in configurations.items():
+        timings = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(exclude=tuple(exclude))],
+                                    capture_output=True, text=True, check=True).stdout
+            import_s, load_s, first_s, ready = output.strip().splitlines()[-1].split()
+            if ready != "1":
+                print("spaCy model failed to load. Startup benchmark cannot proceed.")
+                return
+            timings.append((float(import_s), float(load_s), float(first_s)))
+        import_ms, load_ms, first_ms = (1000 * min(values) for values in zip(*timings))
+        print(f"{name:>18} | {import_ms:>9.1f} | {load_ms:>9.1f} | {first_ms:>13.1f}")
+
+
+def run_keyword_scaling_benchmark(iterations):
+    """Keyword scan cost as the keyword sets grow: compiled matcher vs one substring test per keyword."""
+    purpose = "hi, dhl delivery for apartment 3b, and an urgent repair of the heating for mr. smith".lower()
+    rng = random.Random(7)
+    print(f"{'keywords':>8} | {'matcher us/scan':>15} | {'substring us/scan':>17}")
+    print("-" * 48)
+    for extra_terms in (0, 100, 1000, 5000):
+        groups = {group: set(terms) for group, terms in KEYWORD_GROUPS.items()}
+        groups['EXTRA'] = {''.join(rng.choice(string.ascii_lowercase) for _ in range(8)) for _ in range(extra_terms)}
+        keyword_matcher = KeywordMatcher(groups)
+        keyword_count = sum(len(terms) for terms in groups.values())
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            keyword_matcher.scan(purpose)
+        matcher_us = 1e6 * (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            {group for group, terms in groups.items() if any(term in purpose for term in terms)}
+        substring_us = 1e6 * (time.perf_counter() - start) / iterations
+
+        print(f"{keyword_count:>8} | {matcher_us:>15.1f} | {substring_us:>17.1f}")
+
+
+# --- Synthetic corpus: templates with the intent/category each one is meant to produce ---
+CORPUS_SLOTS = {
+    'courier': ["DHL", "FedEx", "UPS", "Post"],
+    'apartment': ["apartment 3B", "apt 12", "unit 7A", "#5", "flat 2C", "Apt 104"],
+    'name': ["Sarah Walker", "Mark", "Mr. Smith", "Lisa Brown", "Tom Becker", "Dr. Patel"],
+    'urgency': ["Emergency", "Urgent"],
+    'role': ["electrician", "plumber", "technician"],
+    'number': ["12", "123", "4711"],
+}
+
+CORPUS_TEMPLATES = [
+    # (template, expected intent, expected visitor_category; both may use slot placeholders)
+    ("Hi, {courier} delivery for {apartment}.", 'delivery_request', 'courier_{courier_lower}'),
+    ("{courier} package for {name} in {apartment}.", 'delivery_request', 'courier_{courier_lower}'),
+    ("Parcel from {courier} for {apartment}, please.", 'delivery_request', 'courier_{courier_lower}'),
+    ("Pizza for {name}, order number {number}.", 'delivery_request', 'food_delivery_generic'),
+    ("Hello, I'm here to visit {name}.", 'guest_access_request', 'guest_for_person'),
+    ("Is this where {name} lives? I'm a friend.", 'guest_access_request', 'guest_friend'),
+    ("The {role} is here to fix the heating in {apartment}.", 'service_request', 'technician_role_{role}'),
+    ("{urgency}! Water is leaking near {apartment}.", 'emergency_alert', 'informant_emergency'),
+    ("Here about the thing.", 'inquiry', 'unknown_visitor'),
+]
+
+
+def generate_purpose_corpus(size, seed=42):
+    """
+    Deterministic corpus of `size` purposes: the nlp_module_test phrases followed by purposes
+    filled in from CORPUS_TEMPLATES. Each item records the template's expected labels.
+    """
+    rng = random.Random(seed)
+    corpus = [{'text': phrase, 'template': None, 'expected_intent': None, 'expected_category': None}
+              for phrase in TEST_PHRASES]
+    while len(corpus) < size:
+        template, intent, category = rng.choice(CORPUS_TEMPLATES)
+        values = {slot: rng.choice(options) for slot, options in CORPUS_SLOTS.items()}
+        values.update({f"{slot}_lower": value.lower() for slot, value in list(values.items())})
+        corpus.append({'text': template.format(**values), 'template': template,
+                       'expected_intent': intent, 'expected_category': category.format(**values)})
+    return corpus[:size]
+
+
+# --- Rule-based stand-in for a trained spaCy model ---
+# Lets the golden check run where en_core_web_sm cannot be installed: a blank English pipeline
+# whose POS tags, lemmas, dependency arcs and entities come from the word lists below (they
+# cover the corpus). The reference and the current classifier both load it, so it tells whether
+# the rule logic still classifies the same annotations the same way. How either behaves with a
+# trained model is checked by that model's own golden entry.
+RULE_MODEL_NAME = "purpose_rules"
+RULE_MODEL_VERSION = "1.0.0"
+RULE_MODEL_POS = {}
+for pos, words in {
+    'VERB': ["dropping", "visit", "see", "meet", "fix", "perform", "speak", "leaking", "lives", "got", "supposed",
+             "need", "have", "deliver", "repairing"],
+    'AUX': ["is", "'s", "'m", "are", "can", "be"],
+    'ADP': ["for", "from", "in", "to", "about", "near", "with", "of", "at", "off"],
+    'DET': ["the", "a", "an", "this", "some", "that"],
+    'PRON': ["i", "it", "there", "someone", "me", "you"],
+    'ADV': ["here", "immediately", "rapidly", "also", "where"],
+    'INTJ': ["hi", "hello", "please"],
+    'ADJ': ["good", "quick", "scheduled", "urgent", "broken", "main", "electrical"],
+    'CCONJ': ["and", "or"],
+    'NOUN': ["emergency", "water", "pizza", "parcel", "apartment", "apt", "unit", "flat", "delivery", "package",
+             "pakage", "thing", "morning", "friend", "documents", "consultation", "building", "manager", "site",
+             "window", "hallway", "lobby", "heating", "maintenance", "number", "electrician", "plumber",
+             "technician"],
+}.items():
+    RULE_MODEL_POS.update((word, pos) for word in words)
+# Nouns by default, verbs after one of RULE_MODEL_VERB_CUES ("to check it" against "electrical check")
+RULE_MODEL_AMBIGUOUS = {"check", "repair", "order", "report", "drop", "service", "install"}
+RULE_MODEL_VERB_CUES = {"to", "i", "also", "please", "can"}
+RULE_MODEL_PARTICLES = {"off"} # "drop off": the particle, not a preposition
+RULE_MODEL_LEMMAS = {"dropping": "drop", "lives": "live", "leaking": "leak", "is": "be", "'s": "be", "'m": "be",
+                     "are": "be", "got": "get", "supposed": "suppose", "documents": "document", "repairing": "repair"}
+RULE_MODEL_ENTITIES = {
+    'ORG': ["DHL", "FedEx", "UPS", "Post", "ACME Plumbing", "Google"],
+    'PERSON': ["Sarah Walker", "Sarah", "Mark", "Smith", "Lisa Brown", "Lisa", "Tom Becker", "Tom", "Patel",
+               "Sandra Müller", "Mike", "Anna", "John Smith", "Harrison", "Anderson", "Smoth"],
+}
+
+
+def _rule_noun_phrase(doc, start, end, heads, deps):
+    # Attaches the noun phrase starting at `start` to its head word; returns (phrase end, head index or None)
+    stop = start
+    while stop < end and doc[stop].pos_ in ('DET', 'ADJ', 'NUM', 'NOUN', 'PROPN', 'PRON'):
+        stop += 1
+    nominals = [i for i in range(start, stop) if doc[i].pos_ in ('NOUN', 'PROPN', 'PRON')]
+    head = nominals[-1] if nominals else (stop - 1 if stop > start else None)
+    for i in range(start, stop):
+        if i != head:
+            heads[i] = head
+            deps[i] = {'DET': 'det', 'ADJ': 'amod', 'NUM': 'nummod'}.get(doc[i].pos_, 'compound')
+    return stop, head
+
+
+def _rule_sentence(doc, start, end, heads, deps):
+    tokens = range(start, end)
+    root = next((i for i in tokens if doc[i].pos_ == 'VERB'), next((i for i in tokens if doc[i].pos_ == 'AUX'), start))
+    for i in tokens:
+        heads[i], deps[i] = root, 'punct' if doc[i].pos_ == 'PUNCT' else 'dep'
+    deps[root] = 'ROOT'
+    last_verb = None
+    i = start
+    while i < end:
+        token = doc[i]
+        if token.pos_ == 'VERB':
+            last_verb = i
+            if i != root:
+                deps[i] = 'xcomp'
+            if i + 1 < end and doc[i + 1].lower_ in RULE_MODEL_PARTICLES:
+                heads[i + 1], deps[i + 1] = i, 'prt'
+                i += 1
+            stop, head = _rule_noun_phrase(doc, i + 1, end, heads, deps)
+            if head is not None:
+                heads[head], deps[head] = last_verb, 'dobj'
+            i = max(stop, i + 1)
+        elif token.pos_ == 'ADP':
+            if i != root:
+                heads[i], deps[i] = (last_verb if last_verb is not None else root), 'prep'
+            stop, head = _rule_noun_phrase(doc, i + 1, end, heads, deps)
+            if head is not None:
+                heads[head], deps[head] = i, 'pobj'
+            i = max(stop, i + 1)
+        else:
+            i += 1
+
+
+@Language.component("purpose_rule_annotator")
+def purpose_rule_annotator(doc):
+    """POS tags, lemmas and a shallow dependency parse from the RULE_MODEL_* word lists."""
+    for token in doc:
+        lower = token.lower_
+        if token.is_punct or lower == "#":
+            pos = 'PUNCT'
+        elif token.like_num or lower[:1].isdigit():
+            pos = 'NUM'
+        elif lower in RULE_MODEL_AMBIGUOUS:
+            pos = 'VERB' if token.i > 0 and doc[token.i - 1].lower_ in RULE_MODEL_VERB_CUES else 'NOUN'
+        elif lower in RULE_MODEL_POS:
+            pos = RULE_MODEL_POS[lower]
+        else:
+            pos = 'PROPN' if token.text[:1].isupper() else 'NOUN'
+        token.pos_ = pos
+        token.lemma_ = token.text if pos == 'PROPN' else RULE_MODEL_LEMMAS.get(lower, lower)
+    heads, deps = list(range(len(doc))), ['ROOT'] * len(doc)
+    start = 0
+    for token in doc:
+        if token.text in (".", "!", "?") or token.i == len(doc) - 1:
+            _rule_sentence(doc, start, token.i + 1, heads, deps)
+            start = token.i + 1
+    if len(doc):
+        # HEAD holds the offset to the head, stored unsigned like the rest of a spaCy attribute array
+        arcs = [[(head - i) % 2 ** 64, doc.vocab.strings.add(dep)] for i, (head, dep) in enumerate(zip(heads, deps))]
+        doc.from_array([HEAD, DEP], numpy.array(arcs, dtype='uint64'))
+    return doc
+
+
+def build_rule_model(directory):
+    """Saves the rule-based stand-in pipeline to `directory`; spacy.load(directory) loads it."""
+    nlp = spacy.blank("en")
+    nlp.meta['name'], nlp.meta['version'] = RULE_MODEL_NAME, RULE_MODEL_VERSION
+    nlp.add_pipe("purpose_rule_annotator")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([{'label': label, 'pattern': text} for label, texts in RULE_MODEL_ENTITIES.items() for text in texts])
+    nlp.to_disk(directory)
+    return directory
+
+
+def model_key(nlp_model):
+    """Names a loaded model and its version, e.g. en_core_web_sm-3.8.0; golden entries are per model."""
+    return f"{nlp_model.meta['lang']}_{nlp_model.meta['name']}-{nlp_model.meta['version']}"
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB on Linux
+
+
+def run_corpus_benchmark(size, seed, batch_size):
+    corpus = generate_purpose_corpus(size, seed)
+    texts = [item['text'] for item in corpus]
+
+    # Per-stage latencies, measured outside the module so every stage is timed separately
+    stage_samples = {'fast_path': [], 'parse': [], 'rules': [], 'total': []}
+    outputs = []
+    fast_path_mismatches, fast_path_checked = [], set()
+    for text in texts:
+        start = time.perf_counter()
+        structured_data = classify_purpose_fast_path(text)
+        fast_path_done = time.perf_counter()
+        stage_samples['fast_path'].append(fast_path_done - start)
+        if structured_data is not None and text not in fast_path_checked:
+            # What the full pipeline would have said (untimed); only FAST_PATH_APPROXIMATE_FIELDS may differ
+            fast_path_checked.add(text)
+            full = structure_visitor_purpose_doc(nlp_module.NLP_MODEL(text), text)
+            differing = {field: {'fast_path': structured_data[field], 'full': full[field]} for field in full
+                         if field not in FAST_PATH_APPROXIMATE_FIELDS + ('nlp_tier',) and structured_data[field] != full[field]}
+            if differing:
+                fast_path_mismatches.append({'text': text, 'fields': differing})
+        if structured_data is None:
+            doc = nlp_module.NLP_MODEL(text)
+            parsed = time.perf_counter()
+            structured_data = structure_visitor_purpose_doc(doc, text)
+            stage_samples['parse'].append(parsed - fast_path_done)
+            stage_samples['rules'].append(time.perf_counter() - parsed)
+        stage_samples['total'].append(time.perf_counter() - start)
+        outputs.append(structured_data)
+
+    # Throughput: one call per purpose (no cache) vs the batched pipe() path the engine uses.
+    # The built-in stage profiler is switched on for the sequential pass to capture its histograms.
+    profiler = nlp_module.enable_nlp_profiling(sample_rate=1.0)
+    start = time.perf_counter()
+    for text in texts:
+        process_visitor_purpose_nlp(text, use_cache=False)
+    sequential_docs_per_sec = len(texts) / (time.perf_counter() - start)
+    nlp_module.disable_nlp_profiling()
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        process_visitor_purposes_nlp_batch(texts[offset:offset + batch_size], batch_size=batch_size)
+    batched_docs_per_sec = len(texts) / (time.perf_counter() - start)
+
+    # Accuracy against the labels the templates were written for
+    labelled = [(item, output) for item, output in zip(corpus, outputs) if item['template']]
+    intent_correct = sum(1 for item, output in labelled if output['intent'] == item['expected_intent'])
+    category_correct = sum(1 for item, output in labelled if output['visitor_category'] == item['expected_category'])
+
+    tiers = {}
+    for output in outputs:
+        tiers[output['nlp_tier']] = tiers.get(output['nlp_tier'], 0) + 1
+
+    return {
+        'schema_version': RESULTS_SCHEMA_VERSION,
+        'environment': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'spacy_model': model_key(nlp_module.NLP_MODEL),
+            'pipeline': list(nlp_module.NLP_MODEL.pipe_names),
+        },
+        'corpus': {'size': len(texts), 'seed': seed, 'batch_size': batch_size},
+        'throughput': {'sequential_docs_per_sec': sequential_docs_per_sec, 'batched_docs_per_sec': batched_docs_per_sec},
+        'latency': {stage: percentiles([1000 * seconds for seconds in samples]) for stage, samples in stage_samples.items()},
+        'tiers': tiers,
+        'fast_path_vs_full': {'checked': len(fast_path_checked), 'mismatches': fast_path_mismatches},
+        'stage_histograms': profiler.snapshot(),
+        'accuracy': {'labelled': len(labelled),
+                     'intent': intent_correct / len(labelled) if labelled else None,
+                     'visitor_category': category_correct / len(labelled) if labelled else None},
+        'peak_rss_mb': peak_rss_mb(),
+    }, {text: {field: output[field] for field in GOLDEN_FIELDS} for text, output in zip(texts, outputs)}
+
+
+def check_golden(classifications, golden_path, key):
+    """
+    Compares the GOLDEN_FIELDS per purpose against the golden entry for model `key`. Returns the
+    mismatches and how many purposes were checked.
+    """
+    with open(golden_path, encoding='utf-8') as f:
+        golden = json.load(f).get(key, {})
+    mismatches, checked = [], 0
+    for text, recorded in golden.items():
+        actual = classifications.get(text)
+        if actual is None:
+            continue
+        checked += 1
+        expected = {field: recorded[field] for field in GOLDEN_FIELDS}
+        if actual != expected:
+            mismatches.append({'text': text, 'expected': expected, 'actual': actual})
+    return mismatches, checked
+
+
+def reference_classifications(module_path, texts, model_name=None):
+    """
+    Structured output per purpose from another copy of nlp_module.py, so the golden file records the
+    classifier as it was before the optimizations rather than whatever this tree now produces.
+    `model_name` replaces whatever model the reference passes to spacy.load.
+    Returns the model key and the outputs.
+    """
+    spec = importlib.util.spec_from_file_location("nlp_module_reference", module_path)
+    reference = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(module_path))) # Its own helper modules, if it has any
+    load = spacy.load
+    if model_name:
+        spacy.load = lambda name, **kwargs: load(model_name, **kwargs)
+    try:
+        spec.loader.exec_module(reference)
+        if hasattr(reference, 'load_nlp_model'):
+            reference.load_nlp_model()
+    finally:
+        spacy.load = load
+        sys.path.pop(0)
+    if reference.NLP_MODEL is None:
+        sys.exit(f"The reference classifier at {module_path} could not load its spaCy model.")
+    classifications = {}
+    for text in texts:
+        output = dict(reference.process_visitor_purpose_nlp(text))
+        output.pop('raw_text', None) # The key already is the text
+        classifications[text] = output
+    return model_key(reference.NLP_MODEL), classifications
+
+
+def compare_results(current, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline_path} (commit {baseline['environment'].get('commit')}):")
+    for key, value in current['throughput'].items():
+        old = baseline['throughput'].get(key)
+        if old:
+            print(f"  {key}: {old:.1f} -> {value:.1f} ({100 * (value - old) / old:+.1f}%)")
+    for stage, stats in current['latency'].items():
+        old = baseline['latency'].get(stage, {}).get('p99_ms')
+        if old and stats['p99_ms'] is not None:
+            print(f"  {stage} p99: {old:.3f} ms -> {stats['p99_ms']:.3f} ms")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark process_visitor_purpose_nlp throughput and startup.")
+    parser.add_argument("--suite", choices=["corpus", "entities", "startup", "keywords"], default="corpus")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--startup-runs", type=int, default=3)
+    parser.add_argument("--exclude", default="", help="Comma-separated components to also time the startup without")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="Write corpus results as JSON to this file")
+    parser.add_argument("--compare", help="Previous --output file to compare against")
+    parser.add_argument("--golden", default=GOLDEN_FILE, help="Golden file, one entry of outputs per model")
+    parser.add_argument("--record-golden", action="store_true",
+                        help="Record the --reference classifier's output for the corpus as the golden entry for its model")
+    parser.add_argument("--rule-model", action="store_true",
+                        help="Run on the rule-based stand-in pipeline instead of en_core_web_sm (no trained model needed)")
+    parser.add_argument("--reference",
+                        help="nlp_module.py from before the optimizations, e.g. git show 2752b33:nlp_module.py > /tmp/nlp_module_reference.py")
+    args = parser.parse_args()
+    if args.record_golden and not args.reference:
+        parser.error("--record-golden needs --reference: the golden file comes from the pre-optimization classifier")
+    model_name = None
+    if args.rule_model:
+        model_name = build_rule_model(os.path.join(tempfile.mkdtemp(prefix="nlp_rule_model_"), RULE_MODEL_NAME))
+        nlp_module.configure_nlp_model(model_name=model_name)
+
+    if args.suite == "startup":
+        run_startup_benchmark(args.startup_runs, tuple(name for name in args.exclude.split(',') if name))
+    elif args.suite == "keywords":
+        run_keyword_scaling_benchmark(args.iterations * 20)
+    elif args.record_golden: # Only the reference classifier is needed
+        texts = [item['text'] for item in generate_purpose_corpus(args.corpus_size, args.seed)]
+        key, classifications = reference_classifications(args.reference, texts, model_name)
+        golden = {}
+        if os.path.exists(args.golden): # Keeps the entries recorded for other models
+            with open(args.golden, encoding='utf-8') as f:
+                golden = json.load(f)
+        golden[key] = classifications
+        with open(args.golden, 'w', encoding='utf-8') as f:
+            json.dump(golden, f, indent=1, ensure_ascii=False, sort_keys=True)
+        print(f"Recorded {len(classifications)} golden outputs for {key} from {args.reference} in {args.golden}.")
+    elif not load_nlp_model():
+        sys.exit("spaCy model failed to load. NLP benchmark cannot proceed.")
+    elif args.suite == "entities":
+        run_entity_count_benchmark(args.iterations)
+    elif not os.path.exists(args.golden):
+        sys.exit(f"No golden file at {args.golden}; record one with --record-golden --reference <pre-optimization nlp_module.py>.")
+    else:
+        results, classifications = run_corpus_benchmark(args.corpus_size, args.seed, args.batch_size)
+        key = results['environment']['spacy_model']
+        mismatches, checked = check_golden(classifications, args.golden, key)
+        if not checked:
+            sys.exit(f"None of the corpus purposes are in the {key} entry of {args.golden}; record it for this model "
+                     "with the same --corpus-size and --seed.")
+        results['golden'] = {'file': os.path.basename(args.golden), 'model': key, 'checked': checked, 'mismatches': mismatches}
+
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if args.compare:
+            compare_results(results, args.compare)
+        failed = False
+        if results['golden']['mismatches']:
+            print(f"{len(results['golden']['mismatches'])} purposes no longer match the golden file.")
+            failed = True
+        if results['fast_path_vs_full']['mismatches']:
+            print(f"{len(results['fast_path_vs_full']['mismatches'])} fast-path results differ from the full pipeline.")
+            failed = True
+        if failed:
+            sys.exit(1)
@@ -1,53 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "policy_rules.json")
+
+# Named threshold formulas a rule can use; n is the number of voters. Rules may also give a plain integer.
+THRESHOLD_FORMULAS = {
+    'zero': lambda n: 0,
+    'one': lambda n: 1,
+    'majority': lambda n: (n // 2) + 1 if n > 1 else n, # Simple majority; a single voter decides
+    'majority_plus_one': lambda n: min(n, (n // 2) + 2) if n > 1 else n,
+    'all': lambda n: n,
+}
+
+RULE_KEYS = {'name', 'intent', 'category', 'category_prefix', 'urgency', 'min_voters', 'max_voters', 'threshold', 'reason'}
+
+
+def load_policy_table(path):
+    """Reads a policy table from a .json file, or from .yaml/.yml if PyYAML is installed."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError(f"Policy table {path} is YAML, but PyYAML is not installed (pip install pyyaml).")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _as_tuple(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+def _compile_threshold(threshold, rule_name):
+    if isinstance(threshold, int) and not isinstance(threshold, bool):
+        return lambda n: threshold
+    if threshold in THRESHOLD_FORMULAS:
+        return THRESHOLD_FORMULAS[threshold]
+    raise ValueError(f"Policy rule '{rule_name}': unknown threshold {threshold!r} "
+                     f"(expected an integer or one of {sorted(THRESHOLD_FORMULAS)})")
+
+
+class _CompiledRule:
+    __slots__ = ('order', 'name', 'min_voters', 'max_voters', 'urgencies', 'threshold', 'reason')
+
+    def __init__(self, order, rule):
+        self.order = order # Position in the table: the first matching rule wins
+        self.name = rule.get('name', f"rule_{order}")
+        unknown_keys = set(rule) - RULE_KEYS
+        if unknown_keys:
+            raise ValueError(f"Policy rule '{self.name}': unknown keys {sorted(unknown_keys)}")
+        if 'category' in rule and 'category_prefix' in rule:
+            raise ValueError(f"Policy rule '{self.name}': use either 'category' or 'category_prefix', not both")
+        if 'threshold' not in rule or 'reason' not in rule:
+            raise ValueError(f"Policy rule '{self.name}': 'threshold' and 'reason' are required")
+        self.min_voters = rule.get('min_voters', 0)
+        self.max_voters = rule.get('max_voters')
+        urgencies = _as_tuple(rule.get('urgency'))
+        self.urgencies = frozenset(urgencies) if urgencies else None
+        self.threshold = _compile_threshold(rule['threshold'], self.name)
+        self.reason = rule['reason']
+
+    def matches(self, urgency, num_voters):
+        if num_voters < self.min_voters:
+            return False
+        if self.max_voters is not None and num_voters > self.max_voters:
+            return False
+        return self.urgencies is None or urgency in self.urgencies
+
+
+class _CompiledPolicy:
+    """
+    A policy table compiled into a dict index. Each rule is filed under (intent, category key)
+    for every intent and category it names (None for "any"), where the category key is
+    ('exact', category), ('prefix', prefix) or ('any', None). A lookup probes the exact
+    category, each of its '_'-separated prefixes and the wildcards, so its cost depends on the
+    category's length, not on the number of rules.
+    """
+
+    def __init__(self, table, memo_size):
+        self.default_threshold = _compile_threshold(table.get('default', {}).get('threshold', 'majority'), 'default')
+        self.default_reason = table.get('default', {}).get('reason', "Default policy: Simple majority")
+        self.rule_count = len(table.get('rules', []))
+        self.memo_size = memo_size
+        self.memo = OrderedDict() # (intent, category, urgency, num_voters) -> (t_threshold, policy_reason); most recently used last
+        self._memo_lock = threading.Lock()
+
+        self._index = {}
+        for order, rule in enumerate(table.get('rules', [])):
+            compiled = _CompiledRule(order, rule)
+            if 'category' in rule:
+                category_keys = [('exact', category) for category in _as_tuple(rule['category'])]
+            elif 'category_prefix' in rule:
+                category_keys = [('prefix', prefix) for prefix in _as_tuple(rule['category_prefix'])]
+            else:
+                category_keys = [('any', None)]
+            for intent in _as_tuple(rule.get('intent')) or (None,):
+                for category_key in category_keys:
+                    self._index.setdefault((intent, category_key), []).append(compiled)
+
+    def candidates(self, intent, category):
+        """Rules that can apply to this intent and category, in table order."""
+        category_keys = [('exact', category), ('any', None), ('prefix', category)]
+        separator = category.find('_')
+        while separator != -1:
+            category_keys.append(('prefix', category[:separator]))
+            separator = category.find('_', separator + 1)
+        found = []
+        for rule_intent in (intent, None):
+            for category_key in category_keys:
+                found.extend(self._index.get((rule_intent, category_key), ()))
+        found.sort(key=lambda rule: rule.order)
+        return found
+
+    def evaluate(self, intent, category, urgency, num_voters):
+        key = (intent, category, urgency, num_voters)
+        with self._memo_lock:
+            decision = self.memo.get(key)
+            if decision is not None:
+                self.memo.move_to_end(key)
+                return decision
+
+        threshold, reason = self.default_threshold, self.default_reason
+        for rule in self.candidates(intent, category):
+            if rule.matches(urgency, num_voters):
+                threshold, reason = rule.threshold, rule.reason.format(intent=intent, category=category, urgency=urgency)
+                break
+
+        # Ensure t_threshold is valid
+        t_threshold = max(1, min(threshold(num_voters), num_voters)) if num_voters > 0 else 0
+
+        decision = (t_threshold, reason)
+        with self._memo_lock:
+            self.memo[key] = decision
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False) # Least recently used
+        return decision
+
+
+class PolicyEngine:
+    """
+    Evaluates a declarative policy table: rules match on intent, category (exact or prefix at
+    '_' boundaries), urgency and voter count, and name a threshold formula. The first
+    matching rule in table order wins; otherwise the default applies. Decisions are memoized
+    per (intent, category, urgency, num_voters), keeping the memo_size most recently used.
+
+    With a rules_path, the file is re-read when its modification time changes (checked at
+    most every reload_interval seconds). A table that fails to load is logged and the
+    previous one stays in effect.
+    """
+
+    def __init__(self, rules_path=None, table=None, reload_interval=2.0, memo_size=4096):
+        self.rules_path = rules_path
+        self.reload_interval = reload_interval
+        self.memo_size = memo_size
+        self._reload_lock = threading.Lock()
+        self._mtime = None
+        self._next_reload_check = 0.0
+        if table is None:
+            self._mtime = os.path.getmtime(rules_path)
+            table = load_policy_table(rules_path)
+        self._policy = _CompiledPolicy(table, memo_size)
+        self._next_reload_check = time.monotonic() + reload_interval
+
+    def evaluate(self, intent, category, urgency, num_voters):
+        """Returns (t_threshold, policy_reason)."""
+        if self.rules_path and time.monotonic() >= self._next_reload_check:
+            self.reload_if_changed()
+        return self._policy.evaluate(intent, category, urgency, num_voters)
+
+    def reload_if_changed(self):
+        """Re-reads the rules file if it was modified. Returns True if a new table was loaded."""
+        with self._reload_lock:
+            self._next_reload_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.path.getmtime(self.rules_path)
+                if mtime == self._mtime:
+                    return False
+                policy = _CompiledPolicy(load_policy_table(self.rules_path), self.memo_size)
+            except Exception as e:
+                logger.error("Policy Module: Could not reload %s, keeping the current rules: %s", self.rules_path, e)
+                return False
+            self._mtime = mtime
+            self._policy = policy # Swapped in whole, together with its empty memo
+            logger.info("Policy Module: Reloaded %d rules from %s", policy.rule_count, self.rules_path)
+            return True
+
+    def stats(self):
+        policy = self._policy
+        return {'rules': policy.rule_count, 'memoized_decisions': len(policy.memo)}
+
+
+POLICY_ENGINE = PolicyEngine(rules_path=DEFAULT_POLICY_RULES_PATH)
+
+
+def configure_policy_engine(rules_path=DEFAULT_POLICY_RULES_PATH, reload_interval=2.0):
+    """Replaces the module's policy engine, e.g. to load another rules file. Returns the new engine."""
+    global POLICY_ENGINE
+    POLICY_ENGINE = PolicyEngine(rules_path=rules_path, reload_interval=reload_interval)
+    return POLICY_ENGINE
+
+
 def calculate_dynamic_voting_parameters(structured_nlp_output, num_voters):
     """
     Calculates dynamic voting threshold 't' and reason based on NLP output and number of voters.
     """
-    policy_reason = "Default policy: Simple majority"
-    
-    # Base threshold (e.g., simple majority)
-    if num_voters == 0:
-        t_threshold = 0 # No one to vote
-    elif num_voters == 1:
-        t_threshold = 1 # Single voter decides
-    else:
-        t_threshold = (num_voters // 2) + 1
-
     nlp_intent = structured_nlp_output.get('intent', 'inquiry')
     nlp_category = structured_nlp_output.get('visitor_category', 'unknown_visitor')
+    urgency = structured_nlp_output.get('urgency', 'normal')
+
+    t_threshold, policy_reason = POLICY_ENGINE.evaluate(nlp_intent, nlp_category, urgency, num_voters)
 
-    if nlp_intent == 'delivery_request' and 'courier' in nlp_category:
-        if num_voters >= 1:
-            t_threshold = 1 # Trusted courier, low threshold
-            policy_reason = f"Policy: Recognized courier ({nlp_category}), low threshold."
-        else:
-            t_threshold = 0 # No voters, auto-allow for PoC (or could be auto-deny)
-            policy_reason = "Policy: Recognized courier, no voters available (auto-decision)."
-    
-    elif nlp_intent == 'guest_access_request' and nlp_category in ['guest_general', 'unknown_visitor']:
-        if num_voters >= 2:
-            # Increase threshold slightly for unknown guests, but not more than num_voters
-            t_threshold = min(num_voters, ((num_voters // 2) + 1) + 1 if num_voters > 1 else 1)
-            policy_reason = "Policy: General/Unknown guest, slightly increased threshold."
-        # else (1 voter), default majority (which is 1) is fine
-    
-    elif nlp_intent == 'service_request' and 'technician' in nlp_category:
-        if num_voters >= 1:
-            t_threshold = 1 # Assume scheduled/verified service personnel
-            policy_reason = f"Policy: Assumed verified service personnel ({nlp_category}), low threshold."
-        else:
-            t_threshold = 0
-            policy_reason = "Policy: Service personnel, no voters available (auto-decision)."
-
-    elif nlp_intent == 'emergency_access' or nlp_intent == 'emergency_alert':
-        t_threshold = 1 if num_voters > 0 else 0 # Minimal threshold for emergency
-        policy_reason = "Policy: Emergency indicated, minimal threshold."
-
-    # Ensure t_threshold is valid
-    if num_voters > 0:
-        t_threshold = max(1, min(t_threshold, num_voters))
-    elif num_voters == 0: # Explicitly handle no voters
-        t_threshold = 0 
-
-
-    print(f"Policy Module: Intent='{nlp_intent}', Category='{nlp_category}', Voters={num_voters} -> t={t_threshold}, Reason='{policy_reason}'")
+    logger.debug("Policy Module: Intent='%s', Category='%s', Voters=%s -> t=%s, Reason='%s'",
+                 nlp_intent, nlp_category, num_voters, t_threshold, policy_reason)
     return {'t_threshold': t_threshold, 'policy_reason': policy_reason}
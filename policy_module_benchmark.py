@@ -0,0 +1,159 @@
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+from policy_module import PolicyEngine, load_policy_table, DEFAULT_POLICY_RULES_PATH
+
+INTENTS = ['delivery_request', 'guest_access_request', 'service_request', 'emergency_access',
+           'emergency_alert', 'inquiry', 'nlp_unavailable']
+CATEGORIES = ['courier_dhl', 'courier_generic', 'food_delivery_generic', 'food_delivery_pizza_palace',
+              'guest_friend', 'guest_for_person', 'guest_general', 'unknown_visitor', 'technician_acme_plumbing',
+              'technician_role_plumber', 'service_personnel_generic', 'informant_emergency', 'emergency_services']
+URGENCIES = ['normal', 'medium', 'high']
+
+
+def legacy_calculate(nlp_intent, nlp_category, num_voters):
+    """The hardcoded if/elif chain the policy table replaced, kept as the reference."""
+    policy_reason = "Default policy: Simple majority"
+    if num_voters == 0:
+        t_threshold = 0
+    elif num_voters == 1:
+        t_threshold = 1
+    else:
+        t_threshold = (num_voters // 2) + 1
+
+    if nlp_intent == 'delivery_request' and 'courier' in nlp_category:
+        if num_voters >= 1:
+            t_threshold = 1
+            policy_reason = f"Policy: Recognized courier ({nlp_category}), low threshold."
+        else:
+            t_threshold = 0
+            policy_reason = "Policy: Recognized courier, no voters available (auto-decision)."
+    elif nlp_intent == 'guest_access_request' and nlp_category in ['guest_general', 'unknown_visitor']:
+        if num_voters >= 2:
+            t_threshold = min(num_voters, ((num_voters // 2) + 1) + 1 if num_voters > 1 else 1)
+            policy_reason = "Policy: General/Unknown guest, slightly increased threshold."
+    elif nlp_intent == 'service_request' and 'technician' in nlp_category:
+        if num_voters >= 1:
+            t_threshold = 1
+            policy_reason = f"Policy: Assumed verified service personnel ({nlp_category}), low threshold."
+        else:
+            t_threshold = 0
+            policy_reason = "Policy: Service personnel, no voters available (auto-decision)."
+    elif nlp_intent == 'emergency_access' or nlp_intent == 'emergency_alert':
+        t_threshold = 1 if num_voters > 0 else 0
+        policy_reason = "Policy: Emergency indicated, minimal threshold."
+
+    if num_voters > 0:
+        t_threshold = max(1, min(t_threshold, num_voters))
+    elif num_voters == 0:
+        t_threshold = 0
+    return t_threshold, policy_reason
+
+
+def check_against_legacy(max_voters):
+    """Evaluates the shipped table on every intent/category/urgency/voter combination."""
+    engine = PolicyEngine(rules_path=DEFAULT_POLICY_RULES_PATH)
+    mismatches = []
+    for intent, category, urgency, num_voters in itertools.product(INTENTS, CATEGORIES, URGENCIES, range(max_voters + 1)):
+        expected = legacy_calculate(intent, category, num_voters)
+        got = engine.evaluate(intent, category, urgency, num_voters)
+        if got != expected:
+            mismatches.append({'intent': intent, 'category': category, 'urgency': urgency,
+                               'num_voters': num_voters, 'expected': expected, 'got': got})
+    return mismatches
+
+
+def synthetic_table(rule_count, seed):
+    """The shipped rules preceded by rule_count rules for made-up intents and categories."""
+    rng = random.Random(seed)
+    table = load_policy_table(DEFAULT_POLICY_RULES_PATH)
+    extra = []
+    for i in range(rule_count):
+        rule = {'name': f"synthetic_{i}", 'intent': f"intent_{i % 50}",
+                'threshold': rng.choice(['one', 'majority', 'majority_plus_one', 'all']),
+                'reason': f"Synthetic rule {i} ({{category}})"}
+        if i % 2:
+            rule['category_prefix'] = f"category_{i}"
+        else:
+            rule['category'] = [f"category_{i}_exact", f"category_{i}_other"]
+        if i % 3 == 0:
+            rule['urgency'] = 'high'
+        if i % 5 == 0:
+            rule['min_voters'] = 2
+        extra.append(rule)
+    table['rules'] = extra + table['rules']
+    return table
+
+
+def time_lookups(engine, queries, memoized):
+    policy = engine._policy
+    started = time.perf_counter()
+    for query in queries:
+        if not memoized:
+            policy.memo.clear()
+        engine.evaluate(*query)
+    return (time.perf_counter() - started) / len(queries) * 1e6
+
+
+def random_query(rng, rule_count):
+    if rule_count and rng.random() < 0.5:
+        i = rng.randrange(rule_count)
+        category = f"category_{i}_exact" if i % 2 == 0 else f"category_{i}_sub_{rng.randrange(3)}"
+        return (f"intent_{i % 50}", category, rng.choice(URGENCIES), rng.randrange(8))
+    return (rng.choice(INTENTS), rng.choice(CATEGORIES), rng.choice(URGENCIES), rng.randrange(8))
+
+
+def run_scaling_benchmark(rule_counts, lookups, distinct, seed):
+    """
+    Lookups are drawn from a pool of distinct queries no larger than the memo, as a building's
+    traffic repeats a few intent/category pairs, so the memoized column is all hits.
+    """
+    rng = random.Random(seed)
+    results = []
+    for rule_count in rule_counts:
+        engine = PolicyEngine(table=synthetic_table(rule_count, seed))
+        pool = list({random_query(rng, rule_count) for _ in range(distinct)})
+        queries = [rng.choice(pool) for _ in range(lookups)]
+        uncached = time_lookups(engine, queries, memoized=False)
+        time_lookups(engine, queries, memoized=True) # Fill the memo
+        results.append({
+            'rules': engine.stats()['rules'],
+            'distinct_queries': len(pool),
+            'uncached_us_per_lookup': round(uncached, 3),
+            'memoized_us_per_lookup': round(time_lookups(engine, queries, memoized=True), 3),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the policy table against the legacy rules and benchmark lookups.")
+    parser.add_argument("--rule-counts", default="0,50,200,500,1000")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--distinct", type=int, default=2000,
+                        help="Distinct queries the lookups are drawn from (the engine memoizes 4096)")
+    parser.add_argument("--max-voters", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    mismatches = check_against_legacy(args.max_voters)
+    results = {
+        'legacy_mismatches': mismatches,
+        'scaling': run_scaling_benchmark([int(c) for c in args.rule_counts.split(',')], args.lookups, args.distinct,
+                                         args.seed),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if mismatches:
+        print(f"{len(mismatches)} decisions differ from the legacy policy.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
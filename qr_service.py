@@ -0,0 +1,144 @@
+import hashlib
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import qrcode
+
+logger = logging.getLogger(__name__)
+
+# Output formats: 'svg' is a run-length path (no PIL needed, scales cleanly), 'png' is the
+# classic 10px-per-module image, 'compact' is a 1px-per-module PNG the browser scales up.
+QR_FORMATS = {'svg': 'image/svg+xml', 'png': 'image/png', 'compact': 'image/png'}
+
+
+class RenderedQRCode:
+    __slots__ = ('body', 'mimetype', 'etag')
+
+    def __init__(self, body, mimetype):
+        self.body = body # bytes
+        self.mimetype = mimetype
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _qr_code(data, box_size=1):
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=box_size, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def _svg_path(matrix):
+    # One subpath per horizontal run of dark modules instead of one per module
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                parts.append(f"M{start},{y}h{x - start}v1h{start - x}z")
+            else:
+                x += 1
+    return ''.join(parts)
+
+
+def render_qr_code(data, fmt='svg'):
+    """Renders `data` (a join URL) as a QR code in one of QR_FORMATS. Returns a RenderedQRCode."""
+    if fmt == 'svg':
+        matrix = _qr_code(data).get_matrix() # Quiet zone included
+        size = len(matrix)
+        body = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" width="{size * 8}" height="{size * 8}" '
+                f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+                f'<path d="{_svg_path(matrix)}" fill="#000"/></svg>').encode()
+    elif fmt in ('png', 'compact'):
+        buf = io.BytesIO()
+        _qr_code(data, box_size=10 if fmt == 'png' else 1).make_image().save(buf, format='PNG', optimize=(fmt == 'compact'))
+        body = buf.getvalue()
+    else:
+        raise ValueError(f"Unknown QR code format '{fmt}'; expected one of {sorted(QR_FORMATS)}")
+    return RenderedQRCode(body, QR_FORMATS[fmt])
+
+
+class QRCodeService:
+    """
+    Renders session QR codes on a small thread pool and keeps the results in a bounded LRU
+    cache keyed by (join URL, format), so the Socket.IO handler creating a session only queues
+    the render and the image is served over HTTP (see http_cache_headers). Concurrent requests
+    for a code still being rendered share the one render.
+    """
+
+    def __init__(self, max_workers=2, max_entries=1024, default_format='svg'):
+        if default_format not in QR_FORMATS:
+            raise ValueError(f"Unknown QR code format '{default_format}'; expected one of {sorted(QR_FORMATS)}")
+        self.default_format = default_format
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='qr-render')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # (join_url, fmt) -> Future of RenderedQRCode; most recently used last
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'render_seconds': 0.0}
+
+    def get(self, join_url, fmt=None):
+        """Returns a Future resolving to the RenderedQRCode, rendering it in the background on a miss."""
+        key = (join_url, fmt or self.default_format)
+        if key[1] not in QR_FORMATS:
+            raise ValueError(f"Unknown QR code format '{key[1]}'; expected one of {sorted(QR_FORMATS)}")
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return future
+            self._counters['misses'] += 1
+            future = Future()
+            self._entries[key] = future
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+        self._executor.submit(self._render, key, future)
+        return future
+
+    def prerender(self, join_url):
+        # Called when a session is created so the code is ready before the admin page asks for it
+        self.get(join_url)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _render(self, key, future):
+        started = time.perf_counter()
+        try:
+            future.set_result(render_qr_code(*key))
+        except Exception as e:
+            logger.error("QR code for %s could not be rendered: %s", key[0], e)
+            with self._lock:
+                if self._entries.get(key) is future: # Let the next request try again
+                    del self._entries[key]
+            future.set_exception(e)
+        with self._lock:
+            self._counters['render_seconds'] += time.perf_counter() - started
+
+
+def http_cache_headers(rendered, max_age):
+    """
+    Response headers for a rendered code. A join URL's code never changes, so browsers may keep
+    it for `max_age` seconds and revalidate with If-None-Match after that.
+    """
+    return {'Content-Type': rendered.mimetype, 'ETag': rendered.etag,
+            'Cache-Control': f"private, max-age={max_age}"}
+
+
+def etag_matches(rendered, if_none_match):
+    # If-None-Match may list several ETags, or be '*'
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or rendered.etag in tags or ('W/' + rendered.etag) in tags
@@ -0,0 +1,83 @@
+import argparse
+import base64
+import io
+import json
+import time
+import uuid
+
+import qrcode
+
+from benchmark_helpers import percentiles
+from qr_service import QR_FORMATS, QRCodeService, etag_matches, render_qr_code
+
+
+def join_urls(count):
+    return [f"http://doorphone.local:5001/join/{str(uuid.uuid4())[:8]}" for _ in range(count)]
+
+
+def legacy_base64_png(join_url):
+    """What session creation did before qr_service: PNG rendered and base64-encoded on the event thread."""
+    buf = io.BytesIO()
+    qrcode.make(join_url).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def measure_legacy(urls):
+    handler_ms, socket_bytes = [], 0
+    for url in urls:
+        started = time.perf_counter()
+        payload = legacy_base64_png(url)
+        handler_ms.append((time.perf_counter() - started) * 1000)
+        socket_bytes += len(payload)
+    return {'event_thread': percentiles(handler_ms), 'socket_bytes_per_session': socket_bytes // len(urls)}
+
+
+def measure_service(urls, fmt, workers):
+    """Time the creating handler spends (queueing the render), time until every code is ready, then cached serving."""
+    service = QRCodeService(max_workers=workers, max_entries=len(urls), default_format=fmt)
+    handler_ms = []
+    started = time.perf_counter()
+    for url in urls:
+        queued = time.perf_counter()
+        service.prerender(url)
+        handler_ms.append((time.perf_counter() - queued) * 1000)
+    rendered = [service.get(url).result() for url in urls]
+    all_ready = time.perf_counter() - started
+
+    hit_ms, not_modified = [], 0
+    for url, code in zip(urls, rendered):
+        served = time.perf_counter()
+        cached = service.get(url).result()
+        not_modified += etag_matches(cached, code.etag) # A browser revalidating gets a 304
+        hit_ms.append((time.perf_counter() - served) * 1000)
+    stats = service.stats()
+    service.shutdown()
+    return {'workers': workers, 'event_thread': percentiles(handler_ms),
+            'render_ms_per_code': round(stats['render_seconds'] / len(urls) * 1000, 3),
+            'codes_per_second': round(len(urls) / all_ready),
+            'http_bytes_per_code': sum(len(code.body) for code in rendered) // len(urls),
+            'cache_hit': percentiles(hit_ms), 'not_modified': not_modified, 'socket_bytes_per_session': 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session QR codes: base64 PNG on the event thread against the cached, offloaded QR service.")
+    parser.add_argument("--sessions", type=int, default=500, help="Sessions created (distinct join URLs)")
+    parser.add_argument("--workers", type=int, default=2, help="QR render threads")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    urls = join_urls(args.sessions)
+    render_qr_code(urls[0]) # Imports and first-use setup outside the measurements
+    legacy_base64_png(urls[0])
+    results = {'sessions': args.sessions, 'legacy_base64_png': measure_legacy(urls)}
+    print(json.dumps({'legacy_base64_png': results['legacy_base64_png']}))
+    for fmt in QR_FORMATS:
+        results[f"qr_service_{fmt}"] = measure_service(urls, fmt, args.workers)
+        print(json.dumps({f"qr_service_{fmt}": results[f"qr_service_{fmt}"]}))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import collections
+import functools
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Shamir's Secret Sharing over GF(2^128), share-compatible with Crypto.Protocol.SecretSharing.Shamir:
+# elements are 128-bit integers (bit i is the coefficient of x^i) reduced modulo
+# x^128 + x^7 + x^2 + x + 1, encoded as 16 big-endian bytes, and shares are (index, bytes)
+# for indices 1..n.
+_MASK = (1 << 128) - 1
+_MODULUS = (1 << 128) | 0x87
+
+
+def _reduce(product):
+    # x^128 = x^7 + x^2 + x + 1, so the bits above 127 fold back in as four shifted copies
+    high = product >> 128
+    product = (product & _MASK) ^ high ^ (high << 1) ^ (high << 2) ^ (high << 7)
+    high = product >> 128
+    return (product & _MASK) ^ high ^ (high << 1) ^ (high << 2) ^ (high << 7)
+
+
+def _nibble_table(a):
+    """Carry-less multiples a*0 .. a*15, so a product can be built four bits at a time."""
+    a2, a4, a8 = a << 1, a << 2, a << 3
+    return (0, a, a2, a2 ^ a, a4, a4 ^ a, a4 ^ a2, a4 ^ a2 ^ a,
+            a8, a8 ^ a, a8 ^ a2, a8 ^ a2 ^ a, a8 ^ a4, a8 ^ a4 ^ a, a8 ^ a4 ^ a2, a8 ^ a4 ^ a2 ^ a)
+
+
+def _mul_table(table, b):
+    product = 0
+    for byte in b.to_bytes(16, 'big'):
+        product = (((product << 4) ^ table[byte >> 4]) << 4) ^ table[byte & 15]
+    return _reduce(product)
+
+
+def gf_mul(a, b):
+    """Product of two field elements."""
+    return _mul_table(_nibble_table(a), b)
+
+
+def _mul_small(a, small):
+    # Share indices are small, so only a handful of shifted copies of a are needed
+    product = 0
+    shift = 0
+    while small:
+        if small & 1:
+            product ^= a << shift
+        small >>= 1
+        shift += 1
+    return _reduce(product)
+
+
+def gf_inverse(a):
+    """Multiplicative inverse, by the extended Euclidean algorithm on binary polynomials."""
+    if not a:
+        raise ValueError("Zero has no inverse in GF(2^128)")
+    u, v = a, _MODULUS
+    g1, g2 = 1, 0
+    while u != 1:
+        shift = u.bit_length() - v.bit_length()
+        if shift < 0:
+            u, v = v, u
+            g1, g2 = g2, g1
+            shift = -shift
+        u ^= v << shift
+        g1 ^= g2 << shift
+    return g1
+
+
+def _gf_pow_small(a, exponent):
+    result = 1
+    for _ in range(exponent):
+        result = _mul_small(result, a)
+    return result
+
+
+def _evaluate_shares(coefficients, n):
+    """Values at x = 1..n of the polynomial with coefficients highest degree first (Horner)."""
+    values = []
+    for index in range(1, n + 1):
+        value = 0
+        for coefficient in coefficients:
+            value = _mul_small(value, index) ^ coefficient
+        values.append(value)
+    return values
+
+
+def _random_zero_sharing(k, n):
+    """Shares of a random degree k-1 polynomial with constant term 0; XOR a secret in to use them."""
+    coefficients = [secrets.randbits(128) for _ in range(k - 1)]
+    coefficients.append(0)
+    return _evaluate_shares(coefficients, n)
+
+
+@functools.lru_cache(maxsize=1024)
+def lagrange_tables_at_zero(indices):
+    """
+    Lagrange basis coefficients at x = 0 for a sorted tuple of share indices, as nibble
+    tables ready for multiplication. In GF(2^128) subtraction is XOR, so the coefficient of
+    x_j is the product over m != j of x_m / (x_j + x_m).
+    """
+    tables = {}
+    for x_j in indices:
+        numerator = 1
+        denominator = 1
+        for x_m in indices:
+            if x_m != x_j:
+                numerator = _mul_small(numerator, x_m)
+                denominator = _mul_small(denominator, x_j ^ x_m)
+        tables[x_j] = _nibble_table(gf_mul(numerator, gf_inverse(denominator)))
+    return tables
+
+
+@functools.lru_cache(maxsize=4096)
+def _inverse_table(a):
+    # Neville steps divide by x_i + x_j, which for share indices is a small number
+    return _nibble_table(gf_inverse(a))
+
+
+class ShareAccumulator:
+    """
+    Reconstructs a secret one share at a time, so the work of Shamir.combine is spread over
+    a round's Allow votes and the secret is known as soon as the k-th share arrives.
+
+    Uses Neville's scheme at x = 0: _row[i] is the value at 0 of the polynomial through
+    shares i..m, and adding share m + 1 updates the row in O(m). Shares after the k-th are
+    ignored, like the first k shares being passed to combine.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._indices = []
+        self._row = []
+
+    @property
+    def complete(self):
+        return len(self._indices) >= self.k
+
+    def add(self, index, share):
+        """Folds in one share (index, 16-byte share). Returns True once k shares have been added."""
+        if self.complete:
+            return True
+        if index in self._indices:
+            raise ValueError("Duplicate share")
+        if len(share) != 16:
+            raise ValueError("Shares must be 16 bytes long")
+        new_row = [int.from_bytes(share, 'big')]
+        for i in range(len(self._indices) - 1, -1, -1):
+            x_i = self._indices[i]
+            new_row.append(_mul_table(_inverse_table(x_i ^ index),
+                                      _mul_small(self._row[i], index) ^ _mul_small(new_row[-1], x_i)))
+        new_row.reverse()
+        self._indices.append(index)
+        self._row = new_row
+        return self.complete
+
+    def secret(self):
+        """The reconstructed 16-byte secret, or None before k shares have been added."""
+        if not self.complete:
+            return None
+        return self._row[0].to_bytes(16, 'big')
+
+
+class SharePool:
+    """
+    Keeps up to `depth` pre-generated zero-constant sharings per (k, n) pair, refilled by a
+    background thread. A pair is refilled once it has been requested, plus any pairs passed
+    in `pairs` up front; at most `max_pairs` pairs are kept, dropping the least recently
+    used. Each sharing is handed out exactly once.
+    """
+
+    def __init__(self, pairs=(), depth=4, max_pairs=32):
+        self.depth = depth
+        self.max_pairs = max_pairs
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._sharings = collections.OrderedDict() # (k, n) -> deque of zero sharings; most recently used last
+        self._counters = {'hits': 0, 'misses': 0, 'generated': 0}
+        for k, n in pairs:
+            self._sharings[(k, n)] = collections.deque()
+        self._stopped = False
+        self._filler = threading.Thread(target=self._fill, name='share-pool-filler', daemon=True)
+        self._filler.start()
+        self._wanted.set()
+
+    def take(self, k, n):
+        """Returns a pre-generated zero sharing for (k, n), or None if none is ready."""
+        with self._lock:
+            sharings = self._sharings.get((k, n))
+            if sharings is None:
+                sharings = self._sharings[(k, n)] = collections.deque()
+                while len(self._sharings) > self.max_pairs:
+                    self._sharings.popitem(last=False)
+            self._sharings.move_to_end((k, n))
+            sharing = sharings.popleft() if sharings else None
+            self._counters['hits' if sharing else 'misses'] += 1
+        self._wanted.set()
+        return sharing
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pairs'] = {f"{k}/{n}": len(sharings) for (k, n), sharings in self._sharings.items()}
+        return stats
+
+    def stop(self):
+        self._stopped = True
+        self._wanted.set()
+
+    def _fill(self):
+        while not self._stopped:
+            self._wanted.wait()
+            self._wanted.clear()
+            while not self._stopped:
+                with self._lock:
+                    # Most recently requested pairs first
+                    pending = [pair for pair, sharings in reversed(self._sharings.items()) if len(sharings) < self.depth]
+                if not pending:
+                    break
+                k, n = pending[0]
+                try:
+                    sharing = _random_zero_sharing(k, n)
+                except Exception as e:
+                    logger.error("SSS: Share pool could not generate a sharing for k=%s, n=%s: %s", k, n, e)
+                    break
+                with self._lock:
+                    sharings = self._sharings.get((k, n))
+                    if sharings is not None:
+                        sharings.append(sharing)
+                        self._counters['generated'] += 1
+
+
+SHARE_POOL = None
+
+
+def configure_share_pool(pairs=(), depth=4, max_pairs=32):
+    """Starts a background share pool that Shamir.split draws from. Returns the pool."""
+    global SHARE_POOL
+    if SHARE_POOL is not None:
+        SHARE_POOL.stop()
+    SHARE_POOL = SharePool(pairs=pairs, depth=depth, max_pairs=max_pairs)
+    return SHARE_POOL
+
+
+class Shamir:
+    """
+    Drop-in replacement for Crypto.Protocol.SecretSharing.Shamir: same calls, same share
+    format, and shares from either implementation combine in the other.
+    """
+
+    @staticmethod
+    def split(k, n, secret, ssss=False):
+        """Splits a 16-byte secret into n shares [(index, 16-byte share)], any k of which recover it."""
+        if len(secret) != 16:
+            raise ValueError("The secret must be 16 bytes long")
+        if not 1 <= k <= n:
+            raise ValueError(f"Invalid threshold k={k} for n={n} shares")
+        secret_value = int.from_bytes(secret, 'big')
+        sharing = SHARE_POOL.take(k, n) if SHARE_POOL else None
+        if sharing is None:
+            sharing = _random_zero_sharing(k, n)
+        shares = []
+        for index, value in enumerate(sharing, start=1):
+            value ^= secret_value
+            if ssss:
+                value ^= _gf_pow_small(index, k)
+            shares.append((index, value.to_bytes(16, 'big')))
+        return shares
+
+    @staticmethod
+    def combine(shares, ssss=False):
+        """Recovers the secret from shares [(index, 16-byte share)]; all given shares are used."""
+        k = len(shares)
+        values = {}
+        for index, share in shares:
+            if index in values:
+                raise ValueError("Duplicate share")
+            if len(share) != 16:
+                raise ValueError("Shares must be 16 bytes long")
+            value = int.from_bytes(share, 'big')
+            if ssss:
+                value ^= _gf_pow_small(index, k)
+            values[index] = value
+        tables = lagrange_tables_at_zero(tuple(sorted(values)))
+        result = 0
+        for index, value in values.items():
+            result ^= _mul_table(tables[index], value)
+        return result.to_bytes(16, 'big')
+
+
+def derive_round_token(group_key, context):
+    """Per-round 16-byte access token derived from a group's long-lived key with HMAC-SHA256."""
+    return hmac.new(group_key, context.encode('utf-8'), hashlib.sha256).digest()[:16]
+
+
+class GroupKeyShares:
+    """A long-lived 16-byte group key split once among a fixed resident set."""
+    __slots__ = ('key', 'k', 'shares_by_member', 'rounds')
+
+    def __init__(self, key, k, shares_by_member):
+        self.key = key
+        self.k = k
+        self.shares_by_member = shares_by_member # member -> (index, 16-byte share)
+        self.rounds = 0
+
+
+class GroupKeyCache:
+    """
+    Hybrid mode: instead of splitting a fresh secret every round, a random group key is split
+    once per (session, resident set, k) and each round's token is derived from it with
+    derive_round_token. Rounds with the same residents and threshold reuse the shares; any
+    change to either gets a new key. A key is retired after max_rounds_per_key rounds, and
+    at most max_entries keys are kept, dropping the least recently used.
+    """
+
+    def __init__(self, max_rounds_per_key=100, max_entries=1024):
+        self.max_rounds_per_key = max_rounds_per_key
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._groups = collections.OrderedDict() # (session_id, frozenset(members), k) -> GroupKeyShares
+        self._counters = {'splits': 0, 'reuses': 0}
+
+    def shares_for(self, session_id, members, k):
+        """Returns (GroupKeyShares, reused) for this round; members are in share-assignment order."""
+        cache_key = (session_id, frozenset(members), k)
+        with self._lock:
+            group = self._groups.get(cache_key)
+            if group is not None and group.rounds < self.max_rounds_per_key:
+                self._groups.move_to_end(cache_key)
+                group.rounds += 1
+                self._counters['reuses'] += 1
+                return group, True
+        group_key = secrets.token_bytes(16)
+        shares = Shamir.split(k, len(members), group_key)
+        group = GroupKeyShares(group_key, k, dict(zip(members, shares)))
+        group.rounds = 1
+        with self._lock:
+            self._groups[cache_key] = group
+            self._groups.move_to_end(cache_key)
+            while len(self._groups) > self.max_entries:
+                self._groups.popitem(last=False)
+            self._counters['splits'] += 1
+        return group, False
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for cache_key in [cache_key for cache_key in self._groups if cache_key[0] == session_id]:
+                del self._groups[cache_key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['groups'] = len(self._groups)
+        return stats
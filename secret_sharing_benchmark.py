@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import json
+import random
+import secrets
+import time
+
+import secret_sharing
+from secret_sharing import Shamir, ShareAccumulator, GroupKeyCache, configure_share_pool, derive_round_token
+
+try:
+    from Crypto.Protocol.SecretSharing import Shamir as PyCryptodomeShamir
+except ImportError:
+    PyCryptodomeShamir = None
+
+
+def majority(n):
+    return (n // 2) + 1 if n > 1 else n
+
+
+def time_call(function, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - started)
+    return result, sorted(samples)[len(samples) // 2] * 1000 # Median, ms
+
+
+def wait_for_pool(pool, k, n, depth):
+    deadline = time.monotonic() + 120
+    while pool.stats()['pairs'].get(f"{k}/{n}", 0) < depth and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def time_incremental(selected, k):
+    """Total time to fold in k shares one by one, and the time of the k-th (round-closing) share."""
+    accumulator = ShareAccumulator(k)
+    started = last_started = time.perf_counter()
+    for index, share in selected:
+        last_started = time.perf_counter()
+        accumulator.add(index, share)
+    finished = time.perf_counter()
+    return accumulator.secret(), (finished - started) * 1000, (finished - last_started) * 1000
+
+
+def check_compatibility(k, n):
+    """Shares from each implementation must combine in the other."""
+    if PyCryptodomeShamir is None:
+        return None
+    secret = secrets.token_bytes(16)
+    ours = Shamir.split(k, n, secret)
+    theirs = PyCryptodomeShamir.split(k, n, secret)
+    return (PyCryptodomeShamir.combine(random.sample(ours, k)) == secret and
+            Shamir.combine(random.sample(theirs, k)) == secret)
+
+
+def run_benchmark(voter_counts, repeats):
+    results = []
+    for n in voter_counts:
+        k = majority(n)
+        secret = secrets.token_bytes(16)
+        secret_sharing.SHARE_POOL = None
+        shares, split_ms = time_call(lambda: Shamir.split(k, n, secret), repeats)
+        selected = random.sample(shares, k)
+        secret_sharing.lagrange_tables_at_zero.cache_clear()
+        recovered, combine_cold_ms = time_call(lambda: Shamir.combine(selected), 1)
+        assert recovered == secret
+        _, combine_warm_ms = time_call(lambda: Shamir.combine(selected), repeats)
+        recovered, incremental_total_ms, incremental_last_share_ms = time_incremental(selected, k)
+        assert recovered == secret
+
+        pool = configure_share_pool(pairs=[(k, n)], depth=repeats)
+        wait_for_pool(pool, k, n, repeats)
+        _, pooled_split_ms = time_call(lambda: Shamir.split(k, n, secret), repeats)
+        pool.stop()
+        secret_sharing.SHARE_POOL = None
+
+        entry = {'n': n, 'k': k, 'split_ms': round(split_ms, 3), 'pooled_split_ms': round(pooled_split_ms, 3),
+                 'combine_cold_ms': round(combine_cold_ms, 3), 'combine_warm_ms': round(combine_warm_ms, 3),
+                 'incremental_total_ms': round(incremental_total_ms, 3),
+                 'incremental_last_share_ms': round(incremental_last_share_ms, 3),
+                 'pycryptodome_compatible': check_compatibility(k, n)}
+        if PyCryptodomeShamir is not None:
+            _, entry['pycryptodome_split_ms'] = time_call(lambda: PyCryptodomeShamir.split(k, n, secret), 1)
+            _, entry['pycryptodome_combine_ms'] = time_call(lambda: PyCryptodomeShamir.combine(selected), 1)
+        results.append(entry)
+        print(json.dumps(entry))
+    return results
+
+
+def per_round_start(members, k, round_number):
+    """What handle_start_voting_round does per round in the default 'per_round' mode."""
+    secret = hashlib.sha256(f"ACCESS_GRANTED_TOKEN_FOR_visitor_{round_number}".encode('utf-8')).digest()[:16]
+    return secret, dict(zip(members, Shamir.split(k, len(members), secret)))
+
+
+def hybrid_round_start(group_keys, members, k, round_number):
+    """The same in 'hybrid' mode: shares come from the group key, the token from HMAC."""
+    group, _ = group_keys.shares_for('benchmark', members, k)
+    token = derive_round_token(group.key, f"benchmark:ACCESS_GRANTED_TOKEN_FOR_visitor_{round_number}")
+    return token, dict(group.shares_by_member)
+
+
+def run_hybrid_benchmark(voter_counts, rounds):
+    """Per-round CPU time of both modes for repeated rounds with an unchanged resident set."""
+    results = []
+    for n in voter_counts:
+        k = majority(n)
+        members = [f"sid_{i}" for i in range(n)]
+        secret_sharing.SHARE_POOL = None
+
+        started = time.process_time()
+        for round_number in range(rounds):
+            per_round_start(members, k, round_number)
+        per_round_ms = (time.process_time() - started) / rounds * 1000
+
+        group_keys = GroupKeyCache()
+        started = time.process_time()
+        for round_number in range(rounds):
+            token, shares_map = hybrid_round_start(group_keys, members, k, round_number)
+        hybrid_ms = (time.process_time() - started) / rounds * 1000
+
+        # The last round's shares must still open its token
+        accumulator = ShareAccumulator(k)
+        for member in random.sample(members, k):
+            accumulator.add(*shares_map[member])
+        assert derive_round_token(accumulator.secret(),
+                                  f"benchmark:ACCESS_GRANTED_TOKEN_FOR_visitor_{rounds - 1}") == token
+
+        entry = {'n': n, 'k': k, 'rounds': rounds, 'per_round_cpu_ms': round(per_round_ms, 3),
+                 'hybrid_cpu_ms': round(hybrid_ms, 3), 'group_keys': group_keys.stats()}
+        results.append(entry)
+        print(json.dumps(entry))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark round-start (split) and tally (combine) latency of secret_sharing.")
+    parser.add_argument("--suite", choices=["latency", "hybrid"], default="latency")
+    parser.add_argument("--voters", default="3,10,50,100,300,500")
+    parser.add_argument("--rounds", type=int, default=20, help="Rounds per resident set for --suite hybrid")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    voter_counts = [int(n) for n in args.voters.split(',')]
+    if args.suite == "hybrid":
+        results = run_hybrid_benchmark(voter_counts, args.rounds)
+    else:
+        results = run_benchmark(voter_counts, args.repeats)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'suite': args.suite, 'results': results, 'pycryptodome': PyCryptodomeShamir is not None}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
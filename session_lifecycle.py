@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from session_model import SessionStatus
+
+EVICTION_POLICIES = ('lru', 'reject')
+
+
+class SessionLifecycle:
+    """
+    Idle expiry and a cap on live sessions, for the sessions created in this process. Tracks
+    each session's status and when it was last active, least recently active first, so a sweep
+    only looks at sessions old enough to have expired and stops at the first younger one.
+    Times are wall clock (Session.last_active), so a session kept active through another
+    process sharing the store is recognized when the sweep rechecks it.
+
+    `ttls` maps each SessionStatus to the seconds a session may sit idle in it (None: never
+    expires). At `max_sessions`, admit() makes room with the eviction policy: 'lru' evicts the
+    least recently active session that is not voting (the least recently active of all if
+    every session is voting), 'reject' refuses the new session.
+    """
+
+    def __init__(self, ttls, max_sessions=10000, eviction='lru', clock=time.time):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown session eviction policy {eviction!r}; expected one of {EVICTION_POLICIES}")
+        self.ttls = ttls
+        self.max_sessions = max_sessions
+        self.eviction = eviction
+        self.clock = clock
+        self._min_ttl = min((ttl for ttl in ttls.values() if ttl is not None), default=None)
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict() # session_id -> [last_active, SessionStatus]; least recently active first
+        self._counters = {'admitted': 0, 'expired': 0, 'evicted': 0, 'rejected': 0}
+
+    def admit(self, session_id):
+        """
+        Starts tracking a new session. Returns (admitted, evicted_session_id): the caller closes
+        the evicted session, if any; a session that was not admitted must not be created.
+        """
+        with self._lock:
+            evicted = None
+            if len(self._sessions) >= self.max_sessions:
+                if self.eviction == 'reject':
+                    self._counters['rejected'] += 1
+                    return False, None
+                evicted = self._eviction_candidate()
+                del self._sessions[evicted]
+                self._counters['evicted'] += 1
+            self._sessions[session_id] = [self.clock(), SessionStatus.ROLE_ASSIGNMENT]
+            self._counters['admitted'] += 1
+            return True, evicted
+
+    def touch(self, session_id, status, last_active):
+        # Called after every update of the session; sessions not tracked here are ignored
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[0] = last_active
+                entry[1] = status
+                self._sessions.move_to_end(session_id)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def expired(self):
+        """Session IDs idle for longer than the TTL of their status, least recently active first."""
+        if self._min_ttl is None:
+            return []
+        now = self.clock()
+        with self._lock:
+            due = []
+            for session_id, (last_active, status) in self._sessions.items():
+                if now - last_active <= self._min_ttl:
+                    break # Everything after this was active even more recently
+                ttl = self.ttls.get(status)
+                if ttl is not None and now - last_active > ttl:
+                    due.append(session_id)
+            return due
+
+    def is_idle(self, status, last_active):
+        # The sweep's recheck, against the stored session, in case it was active since expired() looked
+        ttl = self.ttls.get(status)
+        return ttl is not None and self.clock() - last_active > ttl
+
+    def record_expiry(self, session_id):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._counters['expired'] += 1
+
+    def snapshot(self):
+        """Live sessions per status label, and the admission/expiry/eviction counters."""
+        with self._lock:
+            by_status = {status.label: 0 for status in SessionStatus}
+            for _, status in self._sessions.values():
+                by_status[status.label] += 1
+            return {'live': by_status, 'total': len(self._sessions), 'max_sessions': self.max_sessions,
+                    'counters': dict(self._counters)}
+
+    def export_prometheus(self):
+        snapshot = self.snapshot()
+        lines = ["# HELP voting_sessions_live Live sessions created in this process, by status.",
+                 "# TYPE voting_sessions_live gauge"]
+        for status, count in snapshot['live'].items():
+            lines.append(f'voting_sessions_live{{status="{status}"}} {count}')
+        lines += ["# HELP voting_sessions_max Cap on live sessions.", "# TYPE voting_sessions_max gauge",
+                  f"voting_sessions_max {snapshot['max_sessions']}"]
+        for counter, count in snapshot['counters'].items():
+            metric = f"voting_sessions_{counter}_total"
+            lines += [f"# HELP {metric} Sessions {counter} since startup.", f"# TYPE {metric} counter", f"{metric} {count}"]
+        return "\n".join(lines) + "\n"
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _eviction_candidate(self):
+        # Called with the lock held and at least one session tracked
+        for session_id, (_, status) in self._sessions.items():
+            if status != SessionStatus.VOTING:
+                return session_id
+        return next(iter(self._sessions))
@@ -0,0 +1,268 @@
+import enum
+import hashlib
+import hmac
+import time
+from array import array
+
+
+class SessionStatus(enum.IntEnum):
+    ROLE_ASSIGNMENT = 0
+    WAITING_FOR_PURPOSE = 1
+    PROCESSING_PURPOSE = 2
+    READY_FOR_VOTING = 3
+    VOTING = 4
+    TALLIED = 5
+
+    @property
+    def label(self):
+        """The name clients see, e.g. 'role_assignment'."""
+        return self.name.lower()
+
+
+class VoteChoice(enum.IntEnum):
+    ALLOW = 0
+    DENY = 1
+    ABSTAIN = 2
+    NO_RESPONSE = 3
+
+    @property
+    def label(self):
+        return self.name.lower()
+
+    @classmethod
+    def from_label(cls, label):
+        """VoteChoice for a client's vote_type ('allow', 'deny' or 'abstain'); ValueError otherwise."""
+        try:
+            choice = cls[str(label).upper()]
+        except KeyError:
+            raise ValueError(f"Unknown vote type: {label!r}")
+        if choice is cls.NO_RESPONSE:
+            raise ValueError("'no_response' cannot be cast as a vote")
+        return choice
+
+
+class Role(enum.IntEnum):
+    UNASSIGNED = 0
+    RESIDENT = 1
+    VISITOR = 2
+    ADMIN = 3 # Only in the SID index; the admin is not one of a session's users
+
+    @property
+    def label(self):
+        return self.name.lower()
+
+
+class Voter:
+    """A connected (non-admin) user of a session."""
+    __slots__ = ('nickname', 'role')
+
+    def __init__(self, nickname, role=Role.UNASSIGNED):
+        self.nickname = nickname
+        self.role = role
+
+
+class Round:
+    """
+    Everything that belongs to one visitor's request: who the visitor is, the NLP result and
+    policy, the voters, their votes and the secret sharing state. Resetting a round means
+    replacing it with a new Round.
+    """
+    __slots__ = ('visitor_sid', 'visitor_nickname', 'purpose_raw', 'structured_nlp_output',
+                 'nlp_summary_for_display', 'extracted_info_display_string', 'policy_applied_reason',
+                 'residents_voting', 'n_voters', 't_threshold', 'timer_duration', 'votes', 'vote_counts',
+                 'outcome', 'sss_actual_secret_bytes', 'sss_secret_digest', 'sss_descriptive_secret', 'sss_round_context',
+                 'sss_shares_map', 'contributed_shares_sids', 'sss_status_log', 'sss_final_status_log')
+
+    def __init__(self):
+        self.visitor_sid = None
+        self.visitor_nickname = None
+        self.purpose_raw = ''
+        self.structured_nlp_output = None # Full NLP output, used by the policy
+        self.nlp_summary_for_display = None
+        self.extracted_info_display_string = ''
+        self.policy_applied_reason = ''
+        self.residents_voting = {} # sid -> nickname of the residents who vote in this round
+        self.start_voting(0, 0)
+
+    def start_voting(self, n_voters, timer_duration):
+        """Clears the votes and secret sharing state of a previous vote on the same request."""
+        self.n_voters = n_voters
+        self.t_threshold = 0
+        self.timer_duration = timer_duration
+        self.votes = {} # sid -> VoteChoice
+        self.vote_counts = array('I', [0, 0, 0, n_voters]) # Indexed by VoteChoice
+        self.outcome = ''
+        self.sss_actual_secret_bytes = None
+        self.sss_secret_digest = None # SHA-256 of the secret, hex: all a round rebuilt from the vote journal has of it
+        self.sss_descriptive_secret = None
+        self.sss_round_context = None # Set in hybrid mode: input for the round token
+        self.sss_shares_map = {} # sid -> (idx_int, share_bytes); None if SSS is not used this round
+        self.contributed_shares_sids = set()
+        self.sss_status_log = ''
+        self.sss_final_status_log = ''
+
+    def set_secret(self, secret_bytes):
+        self.sss_actual_secret_bytes = secret_bytes
+        self.sss_secret_digest = hashlib.sha256(secret_bytes).hexdigest()
+
+    def secret_matches(self, reconstructed_bytes):
+        """Whether the shares reconstructed the round's secret; checked against its digest only."""
+        return self.sss_secret_digest is not None and \
+            hmac.compare_digest(hashlib.sha256(reconstructed_bytes).hexdigest(), self.sss_secret_digest)
+
+    def record_vote(self, sid, choice):
+        self.votes[sid] = choice
+        self.vote_counts[choice] += 1
+        if self.vote_counts[VoteChoice.NO_RESPONSE] > 0:
+            self.vote_counts[VoteChoice.NO_RESPONSE] -= 1
+
+    @property
+    def all_votes_in(self):
+        return self.n_voters > 0 and len(self.votes) == self.n_voters
+
+    def vote_counts_payload(self):
+        """Vote counts as sent to clients: {'allow': .., 'deny': .., 'abstain': .., 'no_response': ..}."""
+        return {choice.label: self.vote_counts[choice] for choice in VoteChoice}
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['votes'] = {sid: int(choice) for sid, choice in self.votes.items()}
+        data['vote_counts'] = list(self.vote_counts)
+        data['contributed_shares_sids'] = list(self.contributed_shares_sids)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        round_ = cls.__new__(cls)
+        for name in cls.__slots__:
+            if name != 'sss_secret_digest':
+                setattr(round_, name, data[name])
+        round_.sss_secret_digest = data.get('sss_secret_digest') # Absent in rounds stored before it was added
+        if round_.sss_secret_digest is None and round_.sss_actual_secret_bytes:
+            round_.set_secret(round_.sss_actual_secret_bytes)
+        round_.votes = {sid: VoteChoice(choice) for sid, choice in data['votes'].items()}
+        round_.vote_counts = array('I', data['vote_counts'])
+        round_.contributed_shares_sids = set(data['contributed_shares_sids'])
+        return round_
+
+
+class Session:
+    """
+    One doorphone session: its admin, the connected users and the current round.
+    timer_object and sss_combiner belong to the process running the round and are not
+    part of to_dict(). `seq` numbers the incremental updates sent to the admin (see
+    next_seq and snapshot_payload).
+    """
+    __slots__ = ('session_id', 'admin_sid', 'users', 'nicknames', 'status', 'round', 'seq', 'last_active',
+                 'timer_object', 'sss_combiner')
+
+    TRANSIENT_FIELDS = ('timer_object', 'sss_combiner')
+
+    def __init__(self, session_id, admin_sid):
+        self.session_id = session_id
+        self.admin_sid = admin_sid
+        self.users = {} # sid -> Voter, for everyone but the admin; add and remove through add_user/remove_user
+        self.nicknames = set() # Nicknames in users, for the uniqueness check on join
+        self.status = SessionStatus.ROLE_ASSIGNMENT
+        self.round = Round()
+        self.seq = 0 # Last update sequence number sent to the admin
+        self.last_active = time.time() # Wall clock, so every process sharing a store can compare it
+        self.timer_object = None
+        self.sss_combiner = None # ShareAccumulator for the current round
+
+    def reset_round(self):
+        """Starts over with role assignment: a new Round, and every user unassigned."""
+        self.round = Round()
+        self.status = SessionStatus.ROLE_ASSIGNMENT
+        self.sss_combiner = None
+        for voter in self.users.values():
+            voter.role = Role.UNASSIGNED
+
+    def transition(self, expected, new):
+        """
+        Compare-and-set of the status: moves to `new` only if the status is `expected`, and
+        returns whether it did. Called while the session is being updated in the store, so of
+        several concurrent callers (e.g. the timer and the last vote both tallying) exactly one wins.
+        """
+        if self.status != expected:
+            return False
+        self.status = new
+        return True
+
+    def cast_vote(self, sid, choice):
+        """
+        Records sid's vote in the running vote. Returns None if it was recorded, otherwise the
+        reason it was not, as shown to the voter.
+        """
+        if self.status != SessionStatus.VOTING or sid not in self.round.residents_voting:
+            return 'Voting is not active or you are not a designated voter.'
+        if sid in self.round.votes:
+            return 'You have already voted.'
+        self.round.record_vote(sid, choice)
+        return None
+
+    def add_user(self, sid, nickname):
+        """Adds an unassigned user; the caller checks `nickname not in session.nicknames` first."""
+        voter = self.users[sid] = Voter(nickname)
+        self.nicknames.add(nickname)
+        return voter
+
+    def remove_user(self, sid):
+        """
+        Removes a disconnected user. Returns (voter, was_visitor, was_voting_resident), or None if
+        sid is not a user of this session. A leaving visitor sends the session back to role
+        assignment; votes a leaving resident already cast are kept.
+        """
+        voter = self.users.pop(sid, None)
+        if voter is None:
+            return None
+        self.nicknames.discard(voter.nickname)
+        was_visitor = sid == self.round.visitor_sid
+        was_voting_resident = self.round.residents_voting.pop(sid, None) is not None
+        if was_visitor:
+            self.round.visitor_sid = None
+            self.round.visitor_nickname = None
+            self.status = SessionStatus.ROLE_ASSIGNMENT
+        return voter, was_visitor, was_voting_resident
+
+    def users_payload(self):
+        """Connected users as sent to clients: {sid: {'nickname': .., 'role': ..}}."""
+        return {sid: {'nickname': voter.nickname, 'role': voter.role.label} for sid, voter in self.users.items()}
+
+    def next_seq(self):
+        """Sequence number for the next update to the admin; the admin page asks for a snapshot on a gap."""
+        self.seq += 1
+        return self.seq
+
+    def snapshot_payload(self):
+        """Everything the admin page builds from updates, as of update `seq`."""
+        return {
+            'seq': self.seq,
+            'status': self.status.label,
+            'all_users': self.users_payload(),
+            'visitor_sid': self.round.visitor_sid,
+            'vote_counts': self.round.vote_counts_payload(),
+            'votes_received_count': len(self.round.votes),
+        }
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'admin_sid': self.admin_sid,
+            'users': {sid: (voter.nickname, int(voter.role)) for sid, voter in self.users.items()},
+            'status': int(self.status),
+            'round': self.round.to_dict(),
+            'seq': self.seq,
+            'last_active': self.last_active,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data['session_id'], data['admin_sid'])
+        session.users = {sid: Voter(nickname, Role(role)) for sid, (nickname, role) in data['users'].items()}
+        session.nicknames = {voter.nickname for voter in session.users.values()}
+        session.status = SessionStatus(data['status'])
+        session.round = Round.from_dict(data['round'])
+        session.seq = data.get('seq', 0) # Absent in sessions stored before updates were numbered
+        session.last_active = data.get('last_active', session.last_active)
+        return session
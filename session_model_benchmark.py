@@ -0,0 +1,101 @@
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from session_model import Session, Role, SessionStatus, VoteChoice
+
+VOTE_LABELS = ['allow', 'deny', 'abstain']
+
+
+def legacy_session(session_id, users):
+    """A voting session in the nested-dict layout the session model replaced."""
+    sids = [f"{session_id}_sid_{i:04d}" for i in range(users)]
+    session = {
+        'admin_sid': f"{session_id}_admin",
+        'all_connected_users': {sid: {'nickname': f"user_{i}", 'role': 'resident'} for i, sid in enumerate(sids)},
+        'residents_voting': {},
+        'visitor_sid': sids[0],
+        'visitor_nickname': 'user_0',
+        'votes': {},
+        'visitor_purpose_raw': 'Parcel delivery for apartment 4',
+        'structured_nlp_output': None,
+        'extracted_info_display': '',
+        'n_voters': users - 1,
+        't_threshold': (users - 1) // 2 + 1,
+        'status': 'voting',
+        'vote_counts': {'allow': 0, 'deny': 0, 'abstain': 0, 'no_response': users - 1},
+        'outcome': '',
+        'timer_object': None,
+        'timer_duration': 30,
+        'policy_applied_reason': 'Default policy: Simple majority',
+        'sss_secret_bytes': None,
+        'sss_shares_map': {},
+        'sss_combiner': None,
+        'contributed_shares_sids': set(),
+    }
+    session['all_connected_users'][sids[0]]['role'] = 'visitor'
+    for i, sid in enumerate(sids[1:]):
+        session['residents_voting'][sid] = f"user_{i + 1}"
+        vote = VOTE_LABELS[i % 3]
+        session['votes'][sid] = vote
+        session['vote_counts'][vote] += 1
+        session['vote_counts']['no_response'] -= 1
+    return session
+
+
+def model_session(session_id, users):
+    """The same session as a session_model.Session."""
+    sids = [f"{session_id}_sid_{i:04d}" for i in range(users)]
+    session = Session(session_id, f"{session_id}_admin")
+    for i, sid in enumerate(sids):
+        session.add_user(sid, f"user_{i}").role = Role.RESIDENT
+    session.users[sids[0]].role = Role.VISITOR
+    session.round.visitor_sid = sids[0]
+    session.round.visitor_nickname = 'user_0'
+    session.round.purpose_raw = 'Parcel delivery for apartment 4'
+    session.round.policy_applied_reason = 'Default policy: Simple majority'
+    session.round.residents_voting = {sid: f"user_{i + 1}" for i, sid in enumerate(sids[1:])}
+    session.status = SessionStatus.VOTING
+    session.round.start_voting(users - 1, 30)
+    session.round.t_threshold = (users - 1) // 2 + 1
+    for i, sid in enumerate(sids[1:]):
+        session.round.record_vote(sid, VoteChoice(i % 3))
+    return session
+
+
+def measure(build, sessions, users):
+    """Bytes allocated per session while building `sessions` of them, and the build time."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = {f"s{i:06d}": build(f"s{i:06d}", users) for i in range(sessions)}
+    elapsed = time.perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return allocated / sessions, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-session memory footprint of the legacy dict layout and session_model.")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=4, help="Connected users per session (one is the visitor)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {'sessions': args.sessions, 'users': args.users}
+    for name, build in (('legacy_dict', legacy_session), ('session_model', model_session)):
+        bytes_per_session, elapsed = measure(build, args.sessions, args.users)
+        results[name] = {'bytes_per_session': round(bytes_per_session), 'total_mb': round(bytes_per_session * args.sessions / 2**20, 1),
+                         'build_seconds': round(elapsed, 3)}
+    results['reduction'] = round(1 - results['session_model']['bytes_per_session'] / results['legacy_dict']['bytes_per_session'], 3)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import contextlib
+import pickle
+import sqlite3
+import threading
+
+from session_model import Session
+
+
+class SessionStore:
+    """
+    Interface for where sessions live. Sessions are session_model.Session objects; every
+    change to one goes through `with store.update(session_id) as session:`, which yields the
+    session (or None if there is none) and saves it when the block exits, atomically with
+    respect to other updates of the same session. update() is reentrant: a nested update of
+    the same session in the same thread yields the same object.
+    """
+
+    def create(self, session_id, session):
+        raise NotImplementedError
+
+    def get(self, session_id):
+        """A snapshot of the session for reading, or None. Changes to it are not saved."""
+        raise NotImplementedError
+
+    def update(self, session_id):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """Removes the session; may be called inside an update() of it."""
+        raise NotImplementedError
+
+    def session_ids(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessions in a dict of this process. Each session has its own reentrant lock, held for the
+    whole of an update(), so updates of different sessions run in parallel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock() # Guards the dicts below; never held while waiting for a session lock
+        self._sessions = {}
+        self._session_locks = {}
+
+    def create(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = session
+            self._session_locks.setdefault(session_id, threading.RLock())
+
+    def get(self, session_id):
+        session_lock = self._session_lock(session_id)
+        if session_lock is None:
+            return None
+        with session_lock:
+            session = self._session(session_id)
+            return Session.from_dict(session.to_dict()) if session is not None else None
+
+    @contextlib.contextmanager
+    def update(self, session_id):
+        session_lock = self._session_lock(session_id)
+        if session_lock is None:
+            yield None
+            return
+        with session_lock:
+            yield self._session(session_id) # None if deleted while waiting; changes are made in place
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+
+    def session_ids(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def _session_lock(self, session_id):
+        with self._lock:
+            return self._session_locks.get(session_id)
+
+    def _session(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions (their to_dict() form) pickled into a SQLite database in WAL mode, shared by
+    every process that opens the same file. update() holds a write transaction (BEGIN IMMEDIATE) for the whole block,
+    so updates from different processes and threads are serialized. Each thread uses its
+    own connection. Session.TRANSIENT_FIELDS stay in the process that set them.
+    """
+
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._transient_lock = threading.Lock()
+        self._transient = {} # session_id -> {field: value} for Session.TRANSIENT_FIELDS
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+
+    def create(self, session_id, session):
+        db = self._connection()
+        with db:
+            db.execute("INSERT OR REPLACE INTO sessions (session_id, data) VALUES (?, ?)",
+                       (session_id, self._dump(session_id, session)))
+
+    def get(self, session_id):
+        active = self._active_updates().get(session_id)
+        if active is not None and active['session'] is not None:
+            return Session.from_dict(active['session'].to_dict())
+        row = self._connection().execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return self._load(session_id, row[0]) if row else None
+
+    @contextlib.contextmanager
+    def update(self, session_id):
+        active_updates = self._active_updates()
+        active = active_updates.get(session_id)
+        if active is not None: # Nested update of the same session in this thread
+            yield active['session']
+            return
+
+        db = self._connection()
+        outermost = not active_updates # Other sessions already updated in this thread share the transaction
+        if outermost:
+            db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        session = self._load(session_id, row[0]) if row else None
+        active_updates[session_id] = {'session': session, 'deleted': False}
+        try:
+            yield session
+            if session is not None and not active_updates[session_id]['deleted']:
+                db.execute("UPDATE sessions SET data = ? WHERE session_id = ?", (self._dump(session_id, session), session_id))
+        except BaseException:
+            del active_updates[session_id]
+            if outermost:
+                db.rollback()
+            raise
+        del active_updates[session_id]
+        if outermost:
+            db.commit()
+
+    def delete(self, session_id):
+        active = self._active_updates().get(session_id)
+        if active is not None:
+            active['deleted'] = True
+            self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        else:
+            db = self._connection()
+            with db:
+                db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        with self._transient_lock:
+            self._transient.pop(session_id, None)
+
+    def session_ids(self):
+        return [row[0] for row in self._connection().execute("SELECT session_id FROM sessions")]
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # isolation_level=None: transactions are begun explicitly in update()
+            db = self._local.db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.active_updates = {}
+        return db
+
+    def _active_updates(self):
+        self._connection()
+        return self._local.active_updates
+
+    def _dump(self, session_id, session):
+        with self._transient_lock:
+            self._transient[session_id] = {field: getattr(session, field) for field in Session.TRANSIENT_FIELDS}
+        return pickle.dumps(session.to_dict(), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, session_id, data):
+        session = Session.from_dict(pickle.loads(data))
+        with self._transient_lock:
+            transient = self._transient.get(session_id, {})
+        for field in Session.TRANSIENT_FIELDS:
+            setattr(session, field, transient.get(field))
+        return session
+
+
+class SidIndex:
+    """
+    Reverse index of this process's Socket.IO connections: SID -> (session_id, Role), so a
+    disconnect finds its session without scanning every session. A connection only exists in
+    the process that holds it, so the index is process-local whatever the session store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_sid = {}
+        self._by_session = {} # session_id -> set of SIDs, for drop_session()
+
+    def bind(self, sid, session_id, role):
+        with self._lock:
+            previous = self._by_sid.get(sid)
+            if previous is not None and previous[0] != session_id:
+                self._discard_from_session(previous[0], sid)
+            self._by_sid[sid] = (session_id, role)
+            self._by_session.setdefault(session_id, set()).add(sid)
+
+    def set_role(self, sid, role):
+        with self._lock:
+            located = self._by_sid.get(sid)
+            if located is not None:
+                self._by_sid[sid] = (located[0], role)
+
+    def lookup(self, sid):
+        """(session_id, Role) of the SID, or None."""
+        with self._lock:
+            return self._by_sid.get(sid)
+
+    def unbind(self, sid):
+        with self._lock:
+            located = self._by_sid.pop(sid, None)
+            if located is not None:
+                self._discard_from_session(located[0], sid)
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for sid in self._by_session.pop(session_id, ()):
+                self._by_sid.pop(sid, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_sid)
+
+    def _discard_from_session(self, session_id, sid):
+        sids = self._by_session.get(session_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._by_session[session_id]
+
+
+def create_session_store(backend='memory', path=None):
+    """Session store for the SESSION_STORE setting: 'memory', or 'sqlite' with a database path."""
+    if backend == 'memory':
+        return InMemorySessionStore()
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("The 'sqlite' session store needs SESSION_STORE_PATH")
+        return SQLiteSessionStore(path)
+    raise ValueError(f"Unknown session store backend: {backend!r}")
@@ -0,0 +1,392 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_helpers import RecordingTransport
+from session_lifecycle import SessionLifecycle
+from session_model import Role, SessionStatus, VoteChoice
+from session_store import create_session_store
+from settings import SETTINGS
+from structured_logging import configure_logging
+from vote_journal import in_flight_records, read_journal
+from voting_service import VotingService, create_voting_service, role_room, users_room
+
+
+def benchmark_config(backend, directory, max_sessions):
+    config = dict(SETTINGS)
+    config.update({'SESSION_STORE': backend, 'SESSION_STORE_PATH': os.path.join(directory, 'sessions.sqlite3'),
+                   'SESSION_MAX_LIVE': max_sessions, 'NLP_WARM_UP_ON_START': False, 'SSS_SHARE_POOL_DEPTH': 0,
+                   'ROUND_TIMER_MAX': 3600}) # Rounds are started with an hour on the clock; run() fires the timers
+    return config
+
+
+class StressRun:
+    """
+    Plays many sessions up to voting through VotingService, then fires every resident's vote
+    (some twice), random resident and visitor disconnects, early tallies and the round timers
+    at once from a thread pool, and records what the service accepted and tallied from what it
+    sent. Round events go to a vote journal, whose file must show every round finished.
+    """
+
+    def __init__(self, backend, directory, sessions, residents, workers, seed):
+        self.rng = random.Random(seed)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.transport = RecordingTransport(spawn=self.submit)
+        self.journal_path = os.path.join(directory, 'votes.journal')
+        config = benchmark_config(backend, directory, sessions)
+        config['VOTE_JOURNAL_PATH'] = self.journal_path
+        self.voting = create_voting_service(config, self.transport)
+        self.residents = residents
+        self.admins = {} # session_id -> admin SID
+        self.visitor_left = set()
+
+        for i in range(sessions):
+            admin_sid = f"s{i:05d}_admin"
+            self.connect(admin_sid)
+            self.voting.create_session(admin_sid, 'http://localhost:5001/')
+            session_id = self.transport.created[admin_sid]
+            self.admins[session_id] = admin_sid
+            for sid, nickname in [(f"s{i:05d}_visitor", 'visitor')] + [(f"s{i:05d}_r{j}", f"r{j}") for j in range(residents)]:
+                self.connect(sid)
+                self.voting.join_session(sid, {'session_id': session_id, 'nickname': nickname})
+            self.voting.assign_visitor_role(admin_sid, {'session_id': session_id, 'visitor_sid': f"s{i:05d}_visitor"})
+            self.voting.submit_purpose(f"s{i:05d}_visitor", {'session_id': session_id, 'purpose': 'Parcel delivery for apartment 4'})
+        for session_id, admin_sid in self.admins.items():
+            while self.voting.session_store.get(session_id).status == SessionStatus.PROCESSING_PURPOSE:
+                time.sleep(0.01)
+            self.voting.start_voting_round(admin_sid, {'session_id': session_id, 'timer_duration': 3600}) # Timers fired by run()
+
+    def connect(self, sid):
+        self.transport.join_room(sid, sid) # Every Socket.IO client is in a room of its own SID
+
+    def submit(self, function, *args):
+        future = self.executor.submit(function, *args)
+        with self.pending_lock:
+            self.pending.append(future)
+
+    def disconnect(self, sid):
+        self.transport.disconnect(sid)
+        self.voting.disconnect(sid)
+
+    def run(self):
+        events = []
+        for session_id in self.admins:
+            prefix = self.admins[session_id][:-len('admin')]
+            for i in range(self.residents):
+                sid = f"{prefix}r{i}"
+                events.append((self.voting.submit_vote, sid, {'session_id': session_id, 'vote_type': VoteChoice(self.rng.randrange(3)).label}))
+                if self.rng.random() < 0.2: # Double submit
+                    events.append((self.voting.submit_vote, sid, {'session_id': session_id, 'vote_type': VoteChoice(self.rng.randrange(3)).label}))
+                if self.rng.random() < 0.1:
+                    events.append((self.disconnect, sid))
+            if self.rng.random() < 0.05: # Ends the round, tallied or not
+                events.append((self.disconnect, f"{prefix}visitor"))
+                self.visitor_left.add(session_id)
+            events.append((self.voting.tally_votes, session_id)) # Round timer, may fire before all votes are in
+        self.rng.shuffle(events)
+
+        started = time.perf_counter()
+        for function, *args in events:
+            self.submit(function, *args)
+        while True: # Tallies triggered by votes are spawned while the pool runs
+            with self.pending_lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                break
+            for future in pending:
+                future.result()
+        elapsed = time.perf_counter() - started
+        self.executor.shutdown()
+        self.voting.vote_journal.close() # Writes out what is queued
+        return len(events), elapsed
+
+    def shutdown(self):
+        self.voting.round_timers.stop()
+        self.voting.nlp_engine.shutdown()
+        self.voting.qr_service.shutdown()
+
+    def accepted_votes(self):
+        """session_id -> [(sid, choice label)] of the votes the admin was told about."""
+        session_ids = {admin_sid: session_id for session_id, admin_sid in self.admins.items()}
+        accepted = {session_id: [] for session_id in self.admins}
+        for room, data in self.transport.kept['vote_update']:
+            accepted[session_ids[room]].append((data['sid'], next(iter(data['vote_counts']))))
+        return accepted
+
+    def check(self):
+        """
+        Consistency violations: a session tallied more than once (or not at all, unless its
+        visitor left), a vote lost, doubled or recorded after the tally, or a round the vote
+        journal still has in flight.
+        """
+        violations = []
+        accepted = self.accepted_votes()
+        tallies = {session_id: [] for session_id in self.admins}
+        session_ids = {admin_sid: session_id for session_id, admin_sid in self.admins.items()}
+        for room, data in self.transport.kept['votes_tallied']:
+            tallies[session_ids[room]].append(data['vote_counts'])
+        in_flight = in_flight_records(read_journal(self.journal_path)[0])
+        for session_id in self.admins:
+            session = self.voting.session_store.get(session_id)
+            votes = {sid: choice.label for sid, choice in session.round.votes.items()}
+            problems = []
+            if len(tallies[session_id]) > 1:
+                problems.append(f"tallied {len(tallies[session_id])} times")
+            elif not tallies[session_id] and session_id not in self.visitor_left:
+                problems.append(f"never tallied, status {session.status.label}")
+            elif tallies[session_id] and tallies[session_id][0] != session.round.vote_counts_payload():
+                problems.append("votes changed after the tally")
+            if len(accepted[session_id]) != len(votes) or dict(accepted[session_id]) != votes:
+                problems.append(f"{len(accepted[session_id])} votes accepted, {len(votes)} stored")
+            counts = session.round.vote_counts
+            for choice in (VoteChoice.ALLOW, VoteChoice.DENY, VoteChoice.ABSTAIN):
+                if counts[choice] != sum(1 for c in session.round.votes.values() if c is choice):
+                    problems.append(f"{choice.label} count {counts[choice]} does not match the votes")
+            if sum(counts) != session.round.n_voters:
+                problems.append(f"counts add up to {sum(counts)}, not n={session.round.n_voters}")
+            if session_id in in_flight:
+                problems.append("round still in flight in the vote journal")
+            if problems:
+                violations.append({'session_id': session_id, 'problems': problems})
+        return violations
+
+
+class NoQRCodes:
+    # Creating a session queues its join QR code; the churn has no pages to show it on
+    def prerender(self, join_url):
+        pass
+
+
+class ChurnRun:
+    """
+    Many sessions with users joining, leaving, being assigned roles and reset, and admins
+    leaving and new sessions starting, all through VotingService, whose handlers keep the
+    SidIndex, nickname sets and role rooms. After each step the touched session is checked
+    against them. Disconnects are timed both through the service and with the scan over every
+    session that handle_disconnect used to do.
+    """
+
+    def __init__(self, store, sessions, users, seed):
+        self.transport = RecordingTransport(spawn=lambda function, *args: function(*args))
+        config = dict(SETTINGS)
+        lifecycle = SessionLifecycle({status: None for status in SessionStatus}, max_sessions=sessions * 2)
+        self.voting = VotingService(config, self.transport, store, None, NoQRCodes(), lifecycle)
+        self.store = store
+        self.index = self.voting.sid_index
+        self.rng = random.Random(seed)
+        self.next_id = 0
+        self.session_ids = []
+        self.admins = {} # session_id -> admin SID
+        self.user_sids = [] # Connected non-admin SIDs, for picking who leaves
+        self.user_positions = {} # sid -> position in user_sids, for O(1) removal
+        self.violations = []
+        for _ in range(sessions):
+            session_id = self.create_session()
+            for _ in range(users):
+                self.join(session_id)
+
+    def new_sid(self):
+        self.next_id += 1
+        sid = f"sid_{self.next_id}"
+        self.transport.join_room(sid, sid) # Every Socket.IO client is in a room of its own SID
+        return sid
+
+    def create_session(self):
+        admin_sid = self.new_sid()
+        self.voting.create_session(admin_sid, 'http://localhost:5001/')
+        session_id = self.transport.created[admin_sid]
+        self.admins[session_id] = admin_sid
+        self.session_ids.append(session_id)
+        self.check_session('create_session', session_id)
+        return session_id
+
+    def join(self, session_id):
+        sid = self.new_sid()
+        nickname = f"user_{self.rng.randrange(1000)}" # Collides now and then
+        self.voting.join_session(sid, {'session_id': session_id, 'nickname': nickname})
+        if self.index.lookup(sid) is not None:
+            self.user_positions[sid] = len(self.user_sids)
+            self.user_sids.append(sid)
+        self.check_session('join', session_id)
+
+    def assign_visitor(self, session_id):
+        session = self.store.get(session_id)
+        if session is None or not session.users:
+            return
+        visitor_sid = self.rng.choice(list(session.users))
+        self.voting.assign_visitor_role(self.admins[session_id], {'session_id': session_id, 'visitor_sid': visitor_sid})
+        self.check_session('assign_visitor', session_id)
+
+    def reset(self, session_id):
+        self.voting.reset_round(self.admins[session_id], {'session_id': session_id})
+        self.check_session('reset', session_id)
+
+    def forget_user(self, sid):
+        position = self.user_positions.pop(sid)
+        last = self.user_sids.pop()
+        if last != sid:
+            self.user_sids[position] = last
+            self.user_positions[last] = position
+
+    def disconnect(self, sid):
+        session_id, role = self.index.lookup(sid)
+        gone = [sid]
+        if role is Role.ADMIN: # Closes the session; its users stay connected, on a page saying so
+            gone += list(self.store.get(session_id).users)
+            for user_sid in gone[1:]:
+                self.forget_user(user_sid)
+        else:
+            self.forget_user(sid)
+        self.transport.disconnect(sid)
+        self.voting.disconnect(sid)
+        self.check_session('disconnect', session_id, gone)
+
+    def check_session(self, step, session_id, gone=()):
+        """After a step: the session's SIDs, nicknames and role rooms agree with the stored session, or are gone with it."""
+        problems = [f"{sid} still indexed as {self.index.lookup(sid)}" for sid in gone if self.index.lookup(sid) is not None]
+        session = self.store.get(session_id)
+        if session is not None:
+            expected = {session.admin_sid: (session_id, Role.ADMIN)}
+            expected.update((sid, (session_id, voter.role)) for sid, voter in session.users.items())
+            problems += [f"{sid} indexed as {self.index.lookup(sid)}, expected {located}"
+                         for sid, located in expected.items() if self.index.lookup(sid) != located]
+            if session.nicknames != {voter.nickname for voter in session.users.values()}:
+                problems.append('nickname set out of date')
+            if self.transport.members(users_room(session_id)) != set(session.users):
+                problems.append('users room out of date')
+            for role in (Role.RESIDENT, Role.VISITOR):
+                if self.transport.members(role_room(session_id, role)) != {sid for sid, voter in session.users.items() if voter.role == role}:
+                    problems.append(f"{role.label} room out of date")
+        else: # Closed: its users are still connected but must have left every room of it
+            for room in (session_id, users_room(session_id), role_room(session_id, Role.RESIDENT), role_room(session_id, Role.VISITOR)):
+                if self.transport.members(room):
+                    problems.append(f"{room} still has members after the session closed")
+        if problems:
+            self.violations.append({'step': step, 'session_id': session_id, 'problems': problems})
+
+    def scan_for(self, sid):
+        """The lookup handle_disconnect did before the index: every session, until one has the SID."""
+        for session_id in self.store.session_ids():
+            with self.store.update(session_id) as session:
+                if session is not None and (sid == session.admin_sid or sid in session.users):
+                    return session_id
+        return None
+
+    def run(self, events, scan_samples):
+        counts = {'join': 0, 'disconnect': 0, 'assign_visitor': 0, 'reset': 0, 'admin_disconnect': 0}
+        disconnect_seconds = 0.0
+        started = time.perf_counter()
+        for _ in range(events):
+            roll = self.rng.random()
+            if roll < 0.4 or not self.user_sids:
+                counts['join'] += 1
+                self.join(self.rng.choice(self.session_ids))
+            elif roll < 0.8:
+                counts['disconnect'] += 1
+                sid = self.rng.choice(self.user_sids)
+                disconnect_started = time.perf_counter()
+                self.disconnect(sid)
+                disconnect_seconds += time.perf_counter() - disconnect_started
+            elif roll < 0.9:
+                counts['assign_visitor'] += 1
+                self.assign_visitor(self.rng.choice(self.session_ids))
+            elif roll < 0.99:
+                counts['reset'] += 1
+                self.reset(self.rng.choice(self.session_ids))
+            else:
+                counts['admin_disconnect'] += 1
+                position = self.rng.randrange(len(self.session_ids))
+                session_id = self.session_ids[position]
+                self.session_ids[position] = self.session_ids[-1]
+                self.session_ids.pop()
+                self.disconnect(self.admins.pop(session_id))
+                self.create_session()
+        elapsed = time.perf_counter() - started
+
+        scan_seconds = 0.0
+        for sid in self.rng.sample(self.user_sids, min(scan_samples, len(self.user_sids))):
+            scan_started = time.perf_counter()
+            self.scan_for(sid)
+            scan_seconds += time.perf_counter() - scan_started
+        self.voting.round_timers.stop()
+        return {
+            'events': counts, 'seconds': round(elapsed, 3), 'events_per_second': round(events / elapsed),
+            'rejected_nicknames': self.transport.counts['nickname_taken_error'],
+            'indexed_disconnect_us': round(disconnect_seconds / max(counts['disconnect'], 1) * 1e6, 2),
+            'scan_disconnect_us': round(scan_seconds / max(scan_samples, 1) * 1e6, 2),
+        }
+
+    def check(self):
+        """The violations found after each step, then index entries that disagree with the stored sessions."""
+        violations = list(self.violations)
+        expected = {}
+        for session_id in self.store.session_ids():
+            session = self.store.get(session_id)
+            expected[session.admin_sid] = (session_id, Role.ADMIN)
+            for sid, voter in session.users.items():
+                expected[sid] = (session_id, voter.role)
+        for sid, located in expected.items():
+            if self.index.lookup(sid) != located:
+                violations.append({'sid': sid, 'problem': f"indexed as {self.index.lookup(sid)}, expected {located}"})
+        if len(self.index) != len(expected):
+            violations.append({'problem': f"{len(self.index)} SIDs indexed, {len(expected)} connected"})
+        return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress a session store: concurrent votes, disconnects and tallies (stress), "
+                                                 "or session and user churn through the SID index (churn); both check consistency.")
+    parser.add_argument("--suite", choices=["stress", "churn"], default="stress")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--sessions", type=int, help="Default: 200 for stress, 50000 for churn")
+    parser.add_argument("--residents", type=int, default=25, help="Residents per session (stress)")
+    parser.add_argument("--workers", type=int, default=32, help="Threads (stress)")
+    parser.add_argument("--users", type=int, default=3, help="Users per session at the start (churn)")
+    parser.add_argument("--events", type=int, default=200000, help="Churn events (churn)")
+    parser.add_argument("--scan-samples", type=int, default=20, help="Disconnects timed with the old scan (churn)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    configure_logging(level='ERROR') # The service warns about every refused tally and vote
+    directory = tempfile.mkdtemp()
+    if args.suite == "churn":
+        path = os.path.join(directory, "sessions.sqlite3") if args.backend == "sqlite" else None
+        store = create_session_store(args.backend, path)
+        sessions = args.sessions or 50000
+        churn = ChurnRun(store, sessions, args.users, args.seed)
+        results = {'suite': 'churn', 'backend': args.backend, 'sessions': sessions, 'users': args.users}
+        results.update(churn.run(args.events, args.scan_samples))
+        violations = results['violations'] = churn.check()
+    else:
+        sessions = args.sessions or 200
+        stress = StressRun(args.backend, directory, sessions, args.residents, args.workers, args.seed)
+        events, elapsed = stress.run()
+        violations = stress.check()
+        stress.shutdown()
+        results = {
+            'suite': 'stress', 'backend': args.backend, 'sessions': sessions, 'residents': args.residents, 'workers': args.workers,
+            'events': events, 'seconds': round(elapsed, 3), 'events_per_second': round(events / elapsed),
+            'votes_recorded': sum(len(accepted) for accepted in stress.accepted_votes().values()),
+            'visitor_disconnects': len(stress.visitor_left),
+            'violations': violations,
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if violations:
+        print(f"{len(violations)} sessions are inconsistent.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Server settings shared by the Flask (app.py) and asyncio (async_app.py) entry points.
+# Entry points copy them into their own config; change a setting here or override it there.
+from policy_module import DEFAULT_POLICY_RULES_PATH
+
+SETTINGS = {}
+# NLP engine: purposes from all sessions are micro-batched through NLP_MODEL.pipe()
+SETTINGS['NLP_ENGINE_WORKERS'] = 2 # Worker processes; 0 runs batches in the engine thread
+SETTINGS['NLP_ENGINE_START_METHOD'] = 'spawn' # Or 'forkserver' (not on Windows); never 'fork', the server already runs threads
+SETTINGS['NLP_ENGINE_MAX_BATCH_SIZE'] = 16
+SETTINGS['NLP_ENGINE_MAX_BATCH_WAIT'] = 0.01 # Seconds
+SETTINGS['NLP_ENGINE_RESOLVER_THREADS'] = 4 # Threads that run the callbacks of finished purposes (they take session locks)
+SETTINGS['NLP_WARM_UP_ON_START'] = True # Load the spaCy model in the background right away instead of on first purpose
+# Cache of structured NLP results keyed on normalized purpose text
+SETTINGS['NLP_CACHE_MAX_ENTRIES'] = 10000
+SETTINGS['NLP_CACHE_TTL'] = 3600 # Seconds
+SETTINGS['NLP_CACHE_PATH'] = None # e.g. 'nlp_cache.sqlite3' to keep the cache across restarts
+SETTINGS['NLP_PROFILING_SAMPLE_RATE'] = 0.0 # Fraction of NLP calls profiled per stage; 0 disables profiling
+# Session store: 'memory' (this process only) or 'sqlite' (shared by every worker using SESSION_STORE_PATH)
+SETTINGS['SESSION_STORE'] = 'memory'
+SETTINGS['SESSION_STORE_PATH'] = None # e.g. 'sessions.sqlite3'
+# Session lifecycle: sessions idle longer than the TTL of their status are closed by a periodic sweep
+SETTINGS['SESSION_IDLE_TTLS'] = { # Seconds per status; None never expires. 'voting' must outlast the longest round timer
+    'role_assignment': 3600, 'waiting_for_purpose': 900, 'processing_purpose': 300,
+    'ready_for_voting': 900, 'voting': 900, 'tallied': 900,
+}
+SETTINGS['SESSION_SWEEP_INTERVAL'] = 30.0 # Seconds
+SETTINGS['SESSION_MAX_LIVE'] = 10000 # Per process
+SETTINGS['SESSION_EVICTION'] = 'lru' # At the cap: 'lru' closes the least recently active session (not voting, if any); 'reject' refuses new ones
+# Vote journal: round events appended and fsynced so rounds in flight survive a restart. None disables it;
+# one file per server process
+SETTINGS['VOTE_JOURNAL_PATH'] = None
+SETTINGS['VOTE_JOURNAL_COMMIT_DELAY'] = 0.0 # Seconds the writer waits for more records to share an fsync
+SETTINGS['VOTE_JOURNAL_COMPACT_BYTES'] = 64 * 2**20 # File size that triggers rewriting it with just the rounds in flight
+# app.py only: Flask debug mode (debugger and reloader); never on a reachable host
+SETTINGS['DEBUG'] = False
+# app.py serves with Werkzeug's development server unless eventlet or gevent is installed, which
+# Flask-SocketIO refuses to run outside debug mode unless this is set
+SETTINGS['ALLOW_UNSAFE_WERKZEUG'] = True
+# Message queue URL (e.g. 'redis://') so several Socket.IO workers can emit to each other's clients
+SETTINGS['SOCKETIO_MESSAGE_QUEUE'] = None
+# Socket.IO packet encoding: 'default' (JSON text) or 'msgpack' (binary MessagePack; needs the msgpack
+# package, and the pages then load the socket.io client bundle with the msgpack parser)
+SETTINGS['SOCKETIO_SERIALIZER'] = 'default'
+# Voting policy table (JSON, or YAML with PyYAML); edits are picked up without a restart
+SETTINGS['POLICY_RULES_PATH'] = DEFAULT_POLICY_RULES_PATH
+SETTINGS['POLICY_RELOAD_INTERVAL'] = 2.0 # Seconds between checks of the rules file's modification time
+# Secret sharing: zero-constant sharings are generated in the background for recently used (k, n) pairs
+SETTINGS['SSS_SHARE_POOL_DEPTH'] = 4 # Sharings kept ready per (k, n); 0 splits on demand only
+SETTINGS['SSS_SHARE_POOL_PAIRS'] = [(2, 3), (3, 5)] # (k, n) pairs to prepare before their first round
+# 'per_round': split a fresh secret every round. 'hybrid': split a group key once per resident set and
+# threshold, and derive each round's token from it, so repeated rounds reuse the shares.
+SETTINGS['SSS_MODE'] = 'per_round'
+SETTINGS['SSS_GROUP_KEY_MAX_ROUNDS'] = 100 # Rounds before a group key is replaced (hybrid mode)
+# Round timers: all rounds share one scheduler thread (a timing wheel) instead of a thread per round
+SETTINGS['ROUND_TIMER_TICK'] = 0.1 # Seconds; a round's tally may start up to one tick after its timer ends
+SETTINGS['ROUND_TIMER_WHEEL_SIZE'] = 1024 # Slots; rounds longer than WHEEL_SIZE * TICK still work
+SETTINGS['ROUND_TIMER_MAX'] = 600 # Seconds; longest timer_duration an admin may start a round with (below the 'voting' idle TTL)
+# Join QR codes: rendered on their own threads when a session is created, cached and served from /qr/<session_id>
+SETTINGS['QR_FORMAT'] = 'svg' # 'svg', 'png' or 'compact' (1px per module PNG, scaled up by the browser); ?format= overrides
+SETTINGS['QR_RENDER_WORKERS'] = 2
+SETTINGS['QR_CACHE_MAX_ENTRIES'] = 1024 # Rendered codes kept, keyed by join URL and format
+SETTINGS['QR_HTTP_MAX_AGE'] = 3600 # Seconds browsers may reuse a code before revalidating its ETag
+# async_app.py only: threads the Socket.IO events are handled on (they take session locks and some split
+# or reconstruct secrets), so the event loop only does I/O
+SETTINGS['ASYNC_EXECUTOR_WORKERS'] = 4
+# Logging: records are handed to a background thread; per-session correlation IDs, repeats rate limited
+SETTINGS['LOG_LEVEL'] = 'INFO' # DEBUG adds per-vote, SSS and NLP details
+SETTINGS['LOG_JSON'] = True # One JSON object per line; False for plain text
+SETTINGS['LOG_RATE_LIMIT_BURST'] = 20 # Max records per message template per interval; 0 disables
+SETTINGS['LOG_RATE_LIMIT_INTERVAL'] = 10.0 # Seconds
@@ -0,0 +1,125 @@
+import bisect
+import json
+import random
+import threading
+import time
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class _NullStageTimer:
+    """Timer handed out for calls that are not sampled: every method is a no-op."""
+    __slots__ = ()
+
+    def lap(self, stage):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_STAGE_TIMER = _NullStageTimer()
+
+
+class _StageTimer:
+    """Lap timer for one profiled call: lap(stage) attributes the time since the previous lap to stage."""
+    __slots__ = ('_profiler', '_start', '_last', '_laps')
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+        self._start = self._last = time.perf_counter()
+        self._laps = []
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self._laps.append((stage, now - self._last))
+        self._last = now
+
+    def finish(self):
+        self._laps.append(('total', time.perf_counter() - self._start))
+        self._profiler.observe_many(self._laps)
+
+
+class StageProfiler:
+    """
+    Sampling wall-time profiler with one histogram per stage. A sampled call gets a lap timer
+    from timer(); unsampled calls get NULL_STAGE_TIMER, so the instrumented code pays one
+    random() call and a few no-op method calls. Histograms are exported as JSON or in the
+    Prometheus text format, and can be drained and merged across processes.
+    """
+
+    def __init__(self, name, sample_rate=1.0, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {} # stage -> {'counts': [per bucket, +Inf last], 'sum': seconds, 'count': n}
+
+    def timer(self):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return _StageTimer(self)
+        return NULL_STAGE_TIMER
+
+    def observe(self, stage, seconds):
+        self.observe_many(((stage, seconds),))
+
+    def observe_many(self, observations):
+        with self._lock:
+            for stage, seconds in observations:
+                histogram = self._histograms.get(stage)
+                if histogram is None:
+                    histogram = self._histograms[stage] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+                histogram['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram['sum'] += seconds
+                histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {stage: {'counts': list(h['counts']), 'sum': h['sum'], 'count': h['count']}
+                          for stage, h in self._histograms.items()}
+        return {'name': self.name, 'sample_rate': self.sample_rate, 'buckets': list(self.buckets), 'stages': histograms}
+
+    def drain(self):
+        """Returns the snapshot and resets all histograms (used to ship worker data to the parent)."""
+        with self._lock:
+            snapshot = {'name': self.name, 'sample_rate': self.sample_rate, 'buckets': list(self.buckets),
+                        'stages': self._histograms}
+            self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        if tuple(snapshot['buckets']) != self.buckets:
+            raise ValueError("Cannot merge profiles with different histogram buckets")
+        with self._lock:
+            for stage, other in snapshot['stages'].items():
+                histogram = self._histograms.setdefault(stage, {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0})
+                histogram['counts'] = [mine + theirs for mine, theirs in zip(histogram['counts'], other['counts'])]
+                histogram['sum'] += other['sum']
+                histogram['count'] += other['count']
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def export_json(self):
+        snapshot = self.snapshot()
+        for histogram in snapshot['stages'].values():
+            histogram['mean_seconds'] = histogram['sum'] / histogram['count'] if histogram['count'] else 0.0
+        return json.dumps(snapshot, sort_keys=True)
+
+    def export_prometheus(self):
+        snapshot = self.snapshot()
+        metric = f"{self.name}_stage_seconds"
+        lines = [f"# HELP {metric} Wall time per {self.name} stage, sampled at rate {self.sample_rate}.",
+                 f"# TYPE {metric} histogram"]
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for stage in sorted(snapshot['stages']):
+            histogram = snapshot['stages'][stage]
+            cumulative = 0
+            for bound, count in zip(bounds, histogram['counts']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Correlation ID of the session whose work is being done in the current thread/context
+_current_session_id = contextvars.ContextVar('session_id', default=None)
+
+
+class session_log_context:
+    """Context manager that tags every log record emitted inside it with session_id."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_session_id.set(self.session_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_session_id.reset(self._token)
+        return False
+
+
+def bind_log_session_id(session_id):
+    """Tags the rest of the current context (e.g. a handler that just created the session)."""
+    _current_session_id.set(session_id)
+
+
+def with_session_log_context(handler):
+    """
+    Decorator for Socket.IO event handlers: runs the handler in the context of
+    data['session_id'], data being the first dict argument (the event data).
+    """
+    @functools.wraps(handler)
+    def wrapper(*args):
+        data = next((arg for arg in args if isinstance(arg, dict)), {})
+        with session_log_context(data.get('session_id')):
+            return handler(*args)
+    return wrapper
+
+
+class SessionContextFilter(logging.Filter):
+    def filter(self, record):
+        if not hasattr(record, 'session_id'): # Records from worker processes arrive already tagged
+            record.session_id = _current_session_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records with the same logger, level and message template through per
+    `interval` seconds. The first record after a suppressed window carries the number of
+    records that were dropped in record.suppressed.
+    """
+
+    def __init__(self, burst=20, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._windows = {} # (logger, level, template) -> [window_start, passed, suppressed]
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000: # Bound memory if templates are dynamic
+                    self._windows = {key: self._windows[key]}
+                record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                record.suppressed = 0
+                return True
+            window[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'session_id': getattr(record, 'session_id', None),
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed_repeats'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _LocalLoggerHandler(logging.Handler):
+    # Hands a record from a worker process to the logger of the same name in this process
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+_listener = None
+_worker_listeners = []
+
+
+def configure_logging(level=logging.INFO, json_output=True, rate_limit_burst=20, rate_limit_interval=10.0, stream=None):
+    """
+    Routes all logging through a QueueHandler, so the calling thread only enqueues the record.
+    A QueueListener thread formats and writes it. Records are tagged with the session
+    correlation ID and rate limited per message template. Safe to call again to reconfigure.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output_handler = logging.StreamHandler(stream)
+    output_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [session=%(session_id)s] %(message)s"))
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SessionContextFilter())
+    if rate_limit_burst:
+        queue_handler.addFilter(RateLimitFilter(burst=rate_limit_burst, interval=rate_limit_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def start_worker_log_listener(mp_context):
+    """
+    For a pool of worker processes: returns a started QueueListener whose `queue` (from
+    mp_context) the workers log to through configure_worker_logging. Its thread passes their
+    records to this process's loggers, so they are filtered and written like local ones.
+    Stop it with stop_worker_log_listener once the pool has shut down.
+    """
+    listener = logging.handlers.QueueListener(mp_context.Queue(), _LocalLoggerHandler())
+    listener.start()
+    _worker_listeners.append(listener)
+    return listener
+
+
+def stop_worker_log_listener(listener):
+    """Writes what the workers logged so far and stops the listener thread."""
+    if listener in _worker_listeners:
+        _worker_listeners.remove(listener)
+        listener.stop()
+
+
+def configure_worker_logging(log_queue, level=logging.INFO):
+    """Worker process side of start_worker_log_listener, e.g. in the pool initializer."""
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SessionContextFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+
+@atexit.register
+def _flush_log_queue():
+    for listener in list(_worker_listeners):
+        stop_worker_log_listener(listener)
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from session_model import Role, Session, SessionStatus, VoteChoice
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct('>II') # Payload length, CRC-32 of the payload
+
+# Record kinds, each a JSON object. A round is in flight from 'round_started' until 'round_tallied' or 'round_abandoned'.
+ROUND_STARTED = 'round_started' # round_started_fields() as voting starts (k, n, shares), deadline: wall clock
+VOTE_CAST = 'vote_cast' # sid, choice: int(VoteChoice), share_contributed: whether an Allow share was folded in
+ROUND_TALLIED = 'round_tallied' # outcome, vote_counts
+ROUND_ABANDONED = 'round_abandoned' # Reset or session closed mid-round
+
+
+class RecoveredRound:
+    """A round that was in flight when the journal ends: the session as of its last record, and its timer deadline."""
+    __slots__ = ('session', 'deadline')
+
+    def __init__(self, session, deadline):
+        self.session = session
+        self.deadline = deadline # time.time() value
+
+
+def _frame(record):
+    payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def round_started_fields(session):
+    """
+    What a 'round_started' record keeps of a session as voting starts: just what recover_rounds
+    needs to rebuild the round. Not the round's secret, only its digest (the tally checks the
+    reconstruction against that), so the secret is never on disk next to its shares.
+    """
+    round_ = session.round
+    shares = round_.sss_shares_map
+    return {
+        'admin_sid': session.admin_sid,
+        'users': {sid: [voter.nickname, int(voter.role)] for sid, voter in session.users.items()},
+        'visitor_sid': round_.visitor_sid,
+        'visitor_nickname': round_.visitor_nickname,
+        'purpose_raw': round_.purpose_raw,
+        'policy_applied_reason': round_.policy_applied_reason,
+        'residents_voting': round_.residents_voting,
+        'n_voters': round_.n_voters,
+        't_threshold': round_.t_threshold,
+        'timer_duration': round_.timer_duration,
+        'sss_secret_digest': round_.sss_secret_digest,
+        'sss_round_context': round_.sss_round_context,
+        'sss_status_log': round_.sss_status_log,
+        'sss_shares_map': None if shares is None else {sid: [index, share.hex()] for sid, (index, share) in shares.items()},
+    }
+
+
+def _session_from_round_started(record):
+    session = Session(record['session_id'], record['admin_sid'])
+    for sid, (nickname, role) in record['users'].items():
+        session.add_user(sid, nickname).role = Role(role)
+    session.status = SessionStatus.VOTING
+    round_ = session.round
+    round_.visitor_sid = record['visitor_sid']
+    round_.visitor_nickname = record['visitor_nickname']
+    round_.purpose_raw = record['purpose_raw']
+    round_.policy_applied_reason = record['policy_applied_reason']
+    round_.residents_voting = record['residents_voting']
+    round_.start_voting(record['n_voters'], record['timer_duration'])
+    round_.t_threshold = record['t_threshold']
+    round_.sss_secret_digest = record['sss_secret_digest']
+    round_.sss_round_context = record['sss_round_context']
+    round_.sss_status_log = record['sss_status_log']
+    shares = record['sss_shares_map']
+    round_.sss_shares_map = None if shares is None else {sid: (index, bytes.fromhex(share)) for sid, (index, share) in shares.items()}
+    return session
+
+
+def read_journal(path):
+    """
+    The records in the journal at `path`, in order, and the length of the intact part: a
+    record torn by a crash mid-write (short, or failing its CRC) ends the journal, and so does
+    one that is not JSON (a journal written before records were).
+    """
+    records, good_length = [], 0
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return records, 0
+    while good_length + _FRAME_HEADER.size <= len(data):
+        length, crc = _FRAME_HEADER.unpack_from(data, good_length)
+        start = good_length + _FRAME_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        try:
+            records.append(json.loads(payload))
+        except ValueError:
+            logger.warning("Vote journal: %s has a record that is not JSON at offset %s; ignoring it and the rest.",
+                           path, good_length)
+            break
+        good_length = start + length
+    return records, good_length
+
+
+def _track_round(live, record):
+    # live: session_id -> records of its round in flight, from 'round_started' on
+    session_id = record['session_id']
+    if record['kind'] == ROUND_STARTED:
+        live[session_id] = [record]
+    elif record['kind'] in (ROUND_TALLIED, ROUND_ABANDONED):
+        live.pop(session_id, None)
+    elif session_id in live:
+        live[session_id].append(record)
+
+
+def in_flight_records(records):
+    """The records of rounds still in flight, in order: from each one's 'round_started' on."""
+    live = {}
+    for record in records:
+        _track_round(live, record)
+    return live
+
+
+def recover_rounds(records):
+    """Rebuilds the rounds in flight: session_id -> RecoveredRound."""
+    recovered = {}
+    for session_id, round_records in in_flight_records(records).items():
+        started = round_records[0]
+        session = _session_from_round_started(started)
+        for record in round_records[1:]:
+            if record['kind'] == VOTE_CAST and record['sid'] not in session.round.votes:
+                session.round.record_vote(record['sid'], VoteChoice(record['choice']))
+                if record['share_contributed']:
+                    session.round.contributed_shares_sids.add(record['sid'])
+        recovered[session_id] = RecoveredRound(session, started['deadline'])
+    return recovered
+
+
+class VoteJournal:
+    """
+    Append-only, checksummed journal of round events, for crash recovery and audit. append()
+    only queues the record: one writer thread writes and fsyncs whatever has queued up since its
+    last fsync in one go (group commit), then calls each record's on_durable. The journal keeps
+    the records of rounds in flight, and once the file grows past `compact_bytes` rewrites it
+    with just those, so it stays about as large as the rounds in progress.
+
+    A batch that cannot be written is cut back off the file and retried, ahead of newer records,
+    with a growing delay (up to `max_retry_delay` seconds), so its on_durable callbacks are late
+    rather than lost. Only close() gives up, after `close_retries` more attempts.
+
+    Open it after recovering from the existing file (see recover_rounds); opening compacts it.
+    """
+
+    def __init__(self, path, commit_delay=0.0, compact_bytes=64 * 2**20, max_retry_delay=5.0, close_retries=3):
+        self.path = path
+        self.commit_delay = commit_delay
+        self.compact_bytes = compact_bytes
+        self.max_retry_delay = max_retry_delay
+        self.close_retries = close_retries
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = [] # (frame, record, on_durable) not yet written
+        self._stopped = False
+        self._counters = {'records': 0, 'commits': 0, 'compactions': 0, 'write_errors': 0, 'fsync_seconds': 0.0}
+
+        records, _ = read_journal(path)
+        self._live = in_flight_records(records) # Kept up to date by the writer thread, for compaction
+        self._file = None
+        self._compact() # Drops finished rounds and any torn tail
+        self._thread = threading.Thread(target=self._run, name='vote-journal', daemon=True)
+        self._thread.start()
+
+    def append(self, kind, session_id, on_durable=None, **fields):
+        """Queues a record; on_durable() is called from the writer thread once it is on disk."""
+        record = dict(fields, kind=kind, session_id=session_id, ts=time.time())
+        frame = _frame(record)
+        with self._lock:
+            self._pending.append((frame, record, on_durable))
+            if len(self._pending) == 1:
+                self._wakeup.notify()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, live_rounds=len(self._live), pending=len(self._pending))
+
+    def close(self):
+        """Writes what is queued, then stops the writer thread."""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        failures = failures_closing = 0
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopped:
+                    self._wakeup.wait()
+                if not self._pending and self._stopped:
+                    return
+            if self.commit_delay and not failures:
+                time.sleep(self.commit_delay) # Let more records join this commit
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if self._commit(batch):
+                failures = 0
+                continue
+            failures += 1
+            with self._lock:
+                self._pending[:0] = batch # Retried first, so the journal keeps each session's records in order
+                failures_closing += self._stopped
+                if failures_closing > self.close_retries:
+                    logger.critical("Vote journal: closing with %s records that could not be written to %s; they are lost.",
+                                    len(self._pending), self.path)
+                    self._pending = []
+                    return
+            time.sleep(min(0.1 * 2 ** failures, self.max_retry_delay))
+
+    def _commit(self, batch):
+        # Returns whether the batch is on disk; if not, the file is cut back to where the batch started
+        offset = None
+        try:
+            offset = self._file.tell()
+            self._file.write(b''.join(frame for frame, _, _ in batch))
+            self._file.flush()
+            started = time.perf_counter()
+            os.fsync(self._file.fileno())
+            fsync_seconds = time.perf_counter() - started
+        except (OSError, ValueError) as e: # ValueError: the file could not be reopened after an earlier failure
+            logger.error("Vote journal: could not write %s records to %s, will retry: %s", len(batch), self.path, e)
+            with self._lock:
+                self._counters['write_errors'] += 1
+            self._truncate_to(offset)
+            return False
+        for _, record, _ in batch:
+            _track_round(self._live, record)
+        with self._lock:
+            self._counters['records'] += len(batch)
+            self._counters['commits'] += 1
+            self._counters['fsync_seconds'] += fsync_seconds
+        for _, record, on_durable in batch:
+            if on_durable:
+                try:
+                    on_durable()
+                except Exception as e:
+                    logger.error("Vote journal: callback for %s record failed: %s", record['kind'], e)
+        if self._file.tell() > self.compact_bytes:
+            try:
+                self._compact()
+            except OSError as e: # The records are safe in the uncompacted file; try again after the next commit
+                logger.error("Vote journal: could not compact %s: %s", self.path, e)
+                if self._file.closed:
+                    self._truncate_to(None)
+        return True
+
+    def _truncate_to(self, offset):
+        # A partly written batch would read as a torn tail and hide every record after it
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        try:
+            if offset is not None:
+                os.truncate(self.path, offset)
+            self._file = open(self.path, 'ab')
+        except OSError as e:
+            logger.error("Vote journal: could not reopen %s: %s", self.path, e)
+
+    def _compact(self):
+        # Rewrites the journal with only the rounds in flight; the rename makes the switch atomic
+        compacted_path = self.path + '.compact'
+        with open(compacted_path, 'wb') as f:
+            for round_records in self._live.values():
+                f.write(b''.join(_frame(record) for record in round_records))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file:
+            self._file.close()
+        os.replace(compacted_path, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self._file = open(self.path, 'ab')
+        with self._lock:
+            self._counters['compactions'] += 1
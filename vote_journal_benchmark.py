@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from benchmark_helpers import percentiles
+from session_model import Session, VoteChoice
+from vote_journal import ROUND_STARTED, VOTE_CAST, VoteJournal, _frame, read_journal, recover_rounds, round_started_fields
+
+
+def vote_records(rounds, voters):
+    # A round_started per round, then each voter's vote, rounds interleaved as concurrent sessions would be
+    records = []
+    for r in range(rounds):
+        session = Session(f"s{r:05d}", 'admin')
+        session.round.start_voting(voters, 300)
+        records.append((ROUND_STARTED, session.session_id, dict(round_started_fields(session), deadline=time.time() + 300)))
+    for v in range(voters):
+        for r in range(rounds):
+            records.append((VOTE_CAST, f"s{r:05d}", {'sid': f"u{v:04d}", 'choice': int(VoteChoice.ALLOW), 'share_contributed': False}))
+    return records
+
+
+def measure_fsync_per_vote(path, records, threads):
+    """What a synchronous journal would cost: each handler writes and fsyncs its own record, one at a time."""
+    lock, handler_ms = threading.Lock(), []
+    with open(path, 'ab') as f:
+        def handle(chunk):
+            for kind, session_id, fields in chunk:
+                started = time.perf_counter()
+                with lock:
+                    f.write(_frame(dict(fields, kind=kind, session_id=session_id, ts=time.time())))
+                    f.flush()
+                    os.fsync(f.fileno())
+                handler_ms.append((time.perf_counter() - started) * 1000)
+        elapsed = run_threads(handle, records, threads)
+    return {'handler': percentiles(handler_ms), 'records_per_second': round(len(records) / elapsed), 'fsyncs': len(records)}
+
+
+def measure_group_commit(path, records, threads, commit_delay):
+    """Handlers only queue; the confirmation latency is until on_durable runs."""
+    journal = VoteJournal(path, commit_delay=commit_delay)
+    handler_ms, durable_ms = [], []
+
+    def handle(chunk):
+        for kind, session_id, fields in chunk:
+            started = time.perf_counter()
+            journal.append(kind, session_id, lambda started=started: durable_ms.append((time.perf_counter() - started) * 1000),
+                           **fields)
+            handler_ms.append((time.perf_counter() - started) * 1000)
+    elapsed = run_threads(handle, records, threads)
+    journal.close()
+    stats = journal.stats()
+    return {'commit_delay': commit_delay, 'handler': percentiles(handler_ms), 'durable': percentiles(durable_ms),
+            'records_per_second': round(len(records) / elapsed), 'fsyncs': stats['commits'],
+            'records_per_fsync': round(stats['records'] / stats['commits'], 1)}
+
+
+def run_threads(handle, records, threads):
+    chunks = [records[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=handle, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def measure_recovery(path):
+    started = time.perf_counter()
+    records, good_length = read_journal(path)
+    recovered = recover_rounds(records)
+    return {'journal_bytes': good_length, 'records': len(records), 'rounds_recovered': len(recovered),
+            'ms': round((time.perf_counter() - started) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vote journal: fsync per vote against group commit, and recovery time.")
+    parser.add_argument("--rounds", type=int, default=50, help="Rounds in flight at once")
+    parser.add_argument("--voters", type=int, default=40, help="Voters per round")
+    parser.add_argument("--threads", type=int, default=8, help="Handler threads submitting votes")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    records = vote_records(args.rounds, args.voters)
+    results = {'rounds': args.rounds, 'voters': args.voters, 'threads': args.threads, 'records': len(records)}
+    with tempfile.TemporaryDirectory() as directory:
+        results['fsync_per_vote'] = measure_fsync_per_vote(os.path.join(directory, 'sync.journal'), records, args.threads)
+        print(json.dumps({'fsync_per_vote': results['fsync_per_vote']}))
+        for commit_delay in (0.0, 0.002):
+            name = f"group_commit_{int(commit_delay * 1000)}ms"
+            path = os.path.join(directory, f"{name}.journal")
+            results[name] = measure_group_commit(path, records, args.threads, commit_delay)
+            print(json.dumps({name: results[name]}))
+        results['recovery'] = measure_recovery(path)
+        print(json.dumps({'recovery': results['recovery']}))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
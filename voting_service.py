@@ -0,0 +1,860 @@
+import contextlib
+import hashlib # For creating a 16-byte secret from our string
+import json
+import logging
+import time
+import uuid
+
+from deadline_scheduler import DeadlineScheduler
+from nlp_engine import NLPEngine
+from nlp_module import configure_nlp_result_cache, enable_nlp_profiling
+from policy_module import calculate_dynamic_voting_parameters, configure_policy_engine
+from qr_service import QRCodeService
+from secret_sharing import Shamir, ShareAccumulator, GroupKeyCache, configure_share_pool, derive_round_token
+from session_lifecycle import SessionLifecycle
+from session_model import Session, Role, SessionStatus, VoteChoice
+from session_store import create_session_store, SidIndex
+from structured_logging import session_log_context, bind_log_session_id, with_session_log_context
+from vote_journal import (ROUND_ABANDONED, ROUND_STARTED, ROUND_TALLIED, VOTE_CAST, VoteJournal, read_journal, recover_rounds,
+                          round_started_fields)
+
+logger = logging.getLogger(__name__)
+
+
+def round_secret_from_reconstruction(current_session, reconstructed_bytes):
+    # In hybrid mode the shares reconstruct the group key; the round's secret is the token derived from it
+    if current_session.round.sss_round_context:
+        return derive_round_token(reconstructed_bytes, current_session.round.sss_round_context)
+    return reconstructed_bytes
+
+
+def parse_timer_duration(value, max_seconds):
+    """Seconds for a round timer from a client's timer_duration; ValueError unless a number in (0, max_seconds]."""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid timer duration: {value!r}.")
+    if not 0 < seconds <= max_seconds: # Also false for NaN
+        raise ValueError(f"Timer duration must be more than 0 and at most {max_seconds} seconds.")
+    return int(seconds) if seconds.is_integer() else seconds
+
+
+def users_room(session_id):
+    # Every non-admin user of the session, whatever their role
+    return f"{session_id}:users"
+
+
+def role_room(session_id, role):
+    # The session's users holding `role`; kept in step by VotingService._set_user_role
+    return f"{session_id}:{role.label}"
+
+
+def compact_nlp_summary(summary):
+    """
+    The NLP display summary as sent to every resident: fields without a value ('N/A') left
+    out and entities as [text, label] pairs, e.g. {'intent': 'delivery', 'entities': [['DHL', 'ORG']]}.
+    """
+    if not summary:
+        return None
+    compact = {key: value for key, value in summary.items() if key != 'entities' and value and value != 'N/A'}
+    if summary.get('entities'):
+        compact['entities'] = [[ent['text'], ent['label']] for ent in summary['entities']]
+    return compact
+
+
+class VotingService:
+    """
+    The doorphone voting flow behind the Socket.IO events, independent of the server stack.
+    Each event has a method taking the sender's SID (and the event data); replies and
+    broadcasts go out through `transport`, which the entry point provides:
+    transport.emit(event, data, room), transport.join_room(sid, room),
+    transport.leave_room(sid, room) and transport.spawn(function, *args) to run a function in
+    the background. Broadcasts go to the session's rooms (users_room, role_room) so each is one
+    emit, serialized once, however many users receive it. Methods may be called from several
+    threads at once; session state is only changed inside session_store.update().
+    With a `vote_journal`, round events are journaled so rounds in flight survive a restart
+    (see restore_rounds).
+    """
+
+    def __init__(self, config, transport, session_store, nlp_engine, qr_service, session_lifecycle, nlp_profiler=None,
+                 vote_journal=None):
+        self.config = config
+        self.transport = transport
+        self.qr_service = qr_service # Join QR codes, rendered off the event thread and served over HTTP
+        self.session_store = session_store
+        self.nlp_engine = nlp_engine
+        self.nlp_profiler = nlp_profiler
+        self.sid_index = SidIndex() # SID -> (session_id, role) of this process's connections
+        self.sss_group_keys = GroupKeyCache(max_rounds_per_key=config['SSS_GROUP_KEY_MAX_ROUNDS'])
+        self.round_timers = DeadlineScheduler(tick=config['ROUND_TIMER_TICK'],
+                                              wheel_size=config['ROUND_TIMER_WHEEL_SIZE'],
+                                              spawn=transport.spawn) # Tallies run off the scheduler thread
+        self.session_lifecycle = session_lifecycle # Idle expiry and the cap on live sessions
+        self.vote_journal = vote_journal
+        self.round_timers.call_later(config['SESSION_SWEEP_INTERVAL'], self.sweep_sessions)
+
+    @contextlib.contextmanager
+    def _update_session(self, session_id):
+        # session_store.update() that also tells the lifecycle the session was active
+        with self.session_store.update(session_id) as current_session:
+            yield current_session
+            if current_session is not None:
+                current_session.last_active = time.time()
+                self.session_lifecycle.touch(session_id, current_session.status, current_session.last_active)
+
+    def _journal(self, kind, session_id, on_durable=None, **fields):
+        # Called inside an update of the session, so a session's records are queued in order
+        if self.vote_journal:
+            self.vote_journal.append(kind, session_id, on_durable, **fields)
+        elif on_durable:
+            on_durable() # Nothing to wait for
+
+    def _abandon_round(self, current_session):
+        # Called inside an update, before the session leaves its state: a round ending without a tally
+        # stops its timer and is journaled as finished, so it is not restored after a restart
+        if current_session.timer_object:
+            current_session.timer_object.cancel()
+            current_session.timer_object = None
+        if current_session.status == SessionStatus.VOTING:
+            self._journal(ROUND_ABANDONED, current_session.session_id)
+
+    def _close_session(self, details, message):
+        # Called inside an update of the session: tells everyone in it, then removes it everywhere
+        self._abandon_round(details)
+        self.transport.emit('error', {'message': message, 'reason': 'session_closed'}, room=details.session_id)
+        for sid, voter in details.users.items(): # Users stay connected; their rooms must not outlive the session
+            self.transport.leave_room(sid, details.session_id)
+            self.transport.leave_room(sid, users_room(details.session_id))
+            if voter.role != Role.UNASSIGNED:
+                self.transport.leave_room(sid, role_room(details.session_id, voter.role))
+        self.transport.leave_room(details.admin_sid, details.session_id)
+        self.session_store.delete(details.session_id)
+        self.session_lifecycle.forget(details.session_id)
+        self.sss_group_keys.drop_session(details.session_id)
+        self.sid_index.drop_session(details.session_id)
+
+    def sweep_sessions(self):
+        # Runs every SESSION_SWEEP_INTERVAL seconds, handed off by the round timer scheduler
+        try:
+            for session_id in self.session_lifecycle.expired():
+                with session_log_context(session_id), self.session_store.update(session_id) as details:
+                    if details is None:
+                        self.session_lifecycle.forget(session_id)
+                    elif self.session_lifecycle.is_idle(details.status, details.last_active):
+                        logger.info("Session %s expired after idling in '%s'.", session_id, details.status.label)
+                        self.session_lifecycle.record_expiry(session_id)
+                        self._close_session(details, 'Session closed after being idle for too long.')
+                    else: # Active since, e.g. through another process sharing the store
+                        self.session_lifecycle.touch(session_id, details.status, details.last_active)
+        finally:
+            self.round_timers.call_later(self.config['SESSION_SWEEP_INTERVAL'], self.sweep_sessions)
+
+    def metrics_prometheus(self):
+        # NLP stage histograms (if profiling), per-tier NLP latencies and the session gauges
+        nlp_metrics = self.nlp_profiler.export_prometheus() if self.nlp_profiler else ''
+        return nlp_metrics + self.nlp_engine.tier_metrics.export_prometheus() + self.session_lifecycle.export_prometheus()
+
+    def metrics_json(self):
+        metrics = json.loads(self.nlp_profiler.export_json()) if self.nlp_profiler else {}
+        metrics['nlp_tiers'] = self.nlp_engine.tier_metrics.snapshot()
+        metrics['sessions'] = self.session_lifecycle.snapshot()
+        if self.vote_journal:
+            metrics['vote_journal'] = self.vote_journal.stats()
+        return json.dumps(metrics, sort_keys=True)
+
+    def restore_rounds(self, recovered):
+        """
+        Puts the rounds that were in flight when the process stopped (vote_journal.recover_rounds)
+        back in play: the session is recreated unless the store kept it, the votes cast so far
+        are folded back into the share combiner, and the round timer is re-armed with the time
+        the round had left. The users' connections did not survive the restart, so a restored
+        round ends by its timer (at once if its deadline passed or its votes were already in).
+        """
+        for session_id, recovered_round in recovered.items():
+            with session_log_context(session_id):
+                if not self._admit_session(session_id): # Only with SESSION_EVICTION = 'reject'; never created, then
+                    logger.warning("Session limit of %s reached; round for session %s not restored from the vote journal.",
+                                   self.session_lifecycle.max_sessions, session_id)
+                    self._journal(ROUND_ABANDONED, session_id) # So the next restart does not try again
+                    continue
+                if session_id not in self.session_store: # A shared (SQLite) store already has it, and is authoritative
+                    self.session_store.create(session_id, recovered_round.session)
+                with self._update_session(session_id) as current_session:
+                    if current_session is None or current_session.status != SessionStatus.VOTING:
+                        continue
+                    threshold_reached = False
+                    if current_session.round.sss_shares_map and current_session.round.t_threshold > 0:
+                        current_session.sss_combiner = ShareAccumulator(current_session.round.t_threshold)
+                        for sid in current_session.round.contributed_shares_sids:
+                            threshold_reached = current_session.sss_combiner.add(*current_session.round.sss_shares_map[sid])
+                    remaining = max(0.0, recovered_round.deadline - time.time())
+                    if threshold_reached or current_session.round.all_votes_in:
+                        remaining = 0.0 # The tally was due when the process stopped
+                    current_session.timer_object = self.round_timers.call_later(remaining, self.tally_votes, session_id)
+                    logger.info("Restored round for session %s from the vote journal: %s of %s votes in, tally in %.1fs.",
+                                session_id, len(current_session.round.votes), current_session.round.n_voters, remaining)
+
+    def _admit_session(self, session_id):
+        # Starts tracking the session; returns False if the session limit refuses it
+        admitted, evicted_session_id = self.session_lifecycle.admit(session_id)
+        if evicted_session_id:
+            with session_log_context(evicted_session_id), self.session_store.update(evicted_session_id) as evicted:
+                if evicted:
+                    logger.info("Session %s evicted to stay within the session limit.", evicted_session_id)
+                    self._close_session(evicted, 'Session closed to make room for new sessions.')
+        return admitted
+
+    @staticmethod
+    def join_url(host_url, session_id):
+        # The QR route rebuilds the same URL from its request, so both hit the same cache entry
+        return host_url.rstrip('/') + '/join/' + session_id
+
+    def _set_user_role(self, current_session, sid, role):
+        # Keeps the role rooms and the SID index in step with the user's role
+        voter = current_session.users[sid]
+        if voter.role != role:
+            if voter.role != Role.UNASSIGNED:
+                self.transport.leave_room(sid, role_room(current_session.session_id, voter.role))
+            if role != Role.UNASSIGNED:
+                self.transport.join_room(sid, role_room(current_session.session_id, role))
+        voter.role = role
+        self.sid_index.set_role(sid, role)
+
+    def tally_votes(self, session_id):
+        with session_log_context(session_id), self._update_session(session_id) as current_session:
+            logger.debug("Server_tally_votes called for session %s", session_id)
+            # Compare-and-set: of concurrent tally calls (timer, last vote, admin) only the first gets past here
+            if current_session and current_session.transition(SessionStatus.VOTING, SessionStatus.TALLIED):
+
+                # Cancel the timer if it's still active
+                if current_session.timer_object:
+                    current_session.timer_object.cancel()
+                    current_session.timer_object = None
+            
+                logger.info("Session %s status changed to 'tallied'", session_id)
+
+                # --- SSS Reconstruction Logic ---
+                sss_reconstruction_log = ""
+                # Check if SSS was properly initialized for this round
+                sss_initialized_properly = (current_session.round.sss_secret_digest and \
+                                            current_session.round.sss_shares_map is not None and \
+                                            current_session.round.n_voters > 0 and \
+                                            current_session.round.t_threshold > 0)
+
+                if sss_initialized_properly:
+                    allow_voter_sids = current_session.round.contributed_shares_sids
+                    num_allow_votes = len(allow_voter_sids)
+                    threshold_k = current_session.round.t_threshold
+                    sss_reconstruction_log = f"SSS: Received {num_allow_votes} 'Allow' votes (shares). Threshold k={threshold_k}. "
+
+                    combiner = current_session.sss_combiner
+                    if combiner and combiner.complete:
+                        # The first k shares were already folded in as their Allow votes arrived
+                        reconstructed_secret_bytes = round_secret_from_reconstruction(current_session, combiner.secret())
+                        if current_session.round.secret_matches(reconstructed_secret_bytes):
+                            current_session.round.outcome = 'Access Granted'
+                            sss_reconstruction_log += "Secret RECONSTRUCTED successfully!"
+                            logger.debug("SSS: Secret for session %s reconstructed successfully!", session_id)
+                        else:
+                            current_session.round.outcome = 'Access Denied'
+                            sss_reconstruction_log += "Secret Mismatch after reconstruction!"
+                            logger.error("SSS: Reconstructed secret does not match original for session %s!", session_id)
+                    elif num_allow_votes >= threshold_k:
+                        shares_for_reconstruction_tuples = []
+                        for sid in allow_voter_sids:
+                            if sid in current_session.round.sss_shares_map:
+                                shares_for_reconstruction_tuples.append(current_session.round.sss_shares_map[sid])
+                    
+                        # Shamir.combine needs *at least* k shares.
+                        # If more are provided, it should still work (it selects k).
+                        # For strictness as per some docs ("exactly k"), we can slice:
+                        if len(shares_for_reconstruction_tuples) >= threshold_k:
+                            selected_shares = shares_for_reconstruction_tuples[:threshold_k] # Take exactly k shares if more available
+                            try:
+                                reconstructed_secret_bytes = round_secret_from_reconstruction(
+                                    current_session, Shamir.combine(selected_shares)) # ssss=False is default
+                            
+                                if current_session.round.secret_matches(reconstructed_secret_bytes):
+                                    current_session.round.outcome = 'Access Granted' 
+                                    sss_reconstruction_log += "Secret RECONSTRUCTED successfully!"
+                                    logger.debug("SSS: Secret for session %s reconstructed successfully!", session_id)
+                                else:
+                                    current_session.round.outcome = 'Access Denied'
+                                    sss_reconstruction_log += "Secret Mismatch after reconstruction!"
+                                    logger.error("SSS: Reconstructed secret does not match original for session %s!", session_id)
+                            except Exception as e: 
+                                current_session.round.outcome = 'Access Denied'
+                                sss_reconstruction_log += f"Error during SSS reconstruction: {str(e)}"
+                                logger.error("SSS: Error during reconstruction for session %s: %s", session_id, e)
+                        else: 
+                            current_session.round.outcome = 'Access Denied'
+                            sss_reconstruction_log += "Not enough distinct shares collected for reconstruction attempt."
+                    else:
+                        current_session.round.outcome = 'Access Denied'
+                        sss_reconstruction_log += "Not enough 'Allow' votes to meet SSS threshold."
+                else: # SSS not applicable or had init error, use fallback
+                    sss_reconstruction_log = current_session.round.sss_status_log + " "
+                    if current_session.round.n_voters == 0 and current_session.round.t_threshold == 0:
+                        if current_session.round.policy_applied_reason.endswith("(auto-decision)."): # Check your policy reason string
+                            current_session.round.outcome = 'Access Granted'
+                            sss_reconstruction_log += "Outcome by policy (no voters)."
+                        else:
+                            current_session.round.outcome = 'Access Denied'
+                            sss_reconstruction_log += "Outcome by policy (no voters, default deny)."
+                    elif current_session.round.vote_counts[VoteChoice.ALLOW] >= current_session.round.t_threshold:
+                         current_session.round.outcome = 'Access Granted'
+                         sss_reconstruction_log += "Outcome by simple vote tally (SSS conditions not met)."
+                    else:
+                         current_session.round.outcome = 'Access Denied'
+                         sss_reconstruction_log += "Outcome by simple vote tally (SSS conditions not met)."
+                current_session.round.sss_final_status_log = sss_reconstruction_log
+                # --- END SSS ---
+
+                logger.info("Session %s: Votes tallied. Outcome: %s. SSS Log: %s", session_id, current_session.round.outcome, sss_reconstruction_log)
+                self._journal(ROUND_TALLIED, session_id, outcome=current_session.round.outcome,
+                              vote_counts=current_session.round.vote_counts_payload())
+            
+                # Notify admin display
+                self.transport.emit('votes_tallied', {
+                    'vote_counts': current_session.round.vote_counts_payload(),
+                    'outcome': current_session.round.outcome,
+                    'n': current_session.round.n_voters, # Use n_voters
+                    't': current_session.round.t_threshold, # Use t_threshold
+                    'sss_reconstruction_log': sss_reconstruction_log # Send SSS log to admin
+                }, room=current_session.admin_sid) # Target admin specifically
+
+                # Notify residents (voters)
+                self.transport.emit('voting_ended', {
+                    'outcome': current_session.round.outcome
+                }, room=role_room(session_id, Role.RESIDENT))
+            
+                # Notify the visitor
+                if current_session.round.visitor_sid:
+                    self.transport.emit('visitor_outcome', {
+                        'outcome': current_session.round.outcome,
+                        # 'message': f"Outcome: {current_session.round.outcome}."
+                    }, room=current_session.round.visitor_sid)
+            
+                # General 'voting_ended_by_server' is good for admin log, but results are above
+                self.transport.emit('voting_ended_by_server', {'session_id': session_id, 'reason': 'Tally complete'}, room=current_session.admin_sid)
+
+            elif current_session and current_session.status == SessionStatus.TALLIED:
+                 logger.debug("Session %s already tallied. Ignoring redundant tally call.", session_id)
+            else:
+                logger.warning("Attempted to tally for %s, but session not found or not in 'voting' status. Current status: %s",
+                               session_id, current_session.status.label if current_session else None)
+
+    @with_session_log_context
+    def create_session(self, request_sid, host_url):
+        session_id = str(uuid.uuid4())[:8]
+        while session_id in self.session_store: # Eight hex digits collide now and then; never overwrite a live session
+            session_id = str(uuid.uuid4())[:8]
+        bind_log_session_id(session_id)
+        if not self._admit_session(session_id):
+            logger.warning("Session limit of %s reached; not creating a session for %s.", self.session_lifecycle.max_sessions, request_sid)
+            self.transport.emit('error', {'message': 'Too many active sessions. Please try again later.'}, room=request_sid)
+            return
+        self.session_store.create(session_id, Session(session_id, request_sid))
+        self.sid_index.bind(request_sid, session_id, Role.ADMIN)
+        self.transport.join_room(request_sid, session_id)
+        join_url = self.join_url(host_url, session_id)
+        self.qr_service.prerender(join_url) # Usually ready by the time the admin page fetches qr_code_url
+        qr_code_url = host_url.rstrip('/') + '/qr/' + session_id
+        self.transport.emit('session_created', {'session_id': session_id, 'qr_code_url': qr_code_url, 'join_url': join_url}, room=request_sid)
+        logger.info("Session %s created by admin %s. Status: role_assignment.", session_id, request_sid)
+
+    @with_session_log_context
+    def assign_visitor_role(self, request_sid, data):
+        session_id = data.get('session_id')
+        visitor_candidate_sid = data.get('visitor_sid')
+
+        with self._update_session(session_id) as current_session:
+            if current_session and current_session.admin_sid == request_sid:
+        
+                # If a visitor already exists and is different from the new candidate
+                if current_session.round.visitor_sid and current_session.round.visitor_sid != visitor_candidate_sid:
+                    old_visitor_sid = current_session.round.visitor_sid
+                    if old_visitor_sid in current_session.users:
+                         self._set_user_role(current_session, old_visitor_sid, Role.RESIDENT)
+                         self.transport.emit('role_assigned', {
+                             'your_role': 'resident', 
+                             'visitor_nickname': None # New visitor will be set shortly
+                            }, room=old_visitor_sid)
+
+                # Assign new visitor
+                if visitor_candidate_sid in current_session.users:
+                    current_session.round.visitor_sid = visitor_candidate_sid
+                    current_session.round.visitor_nickname = current_session.users[visitor_candidate_sid].nickname
+                    self._set_user_role(current_session, visitor_candidate_sid, Role.VISITOR)
+                    self._abandon_round(current_session) # A new visitor starts over
+                    current_session.status = SessionStatus.WAITING_FOR_PURPOSE
+
+                    current_session.round.residents_voting = {}
+                    for sid, user_data in current_session.users.items():
+                        if sid != current_session.admin_sid and sid != current_session.round.visitor_sid:
+                            self._set_user_role(current_session, sid, Role.RESIDENT)
+                            current_session.round.residents_voting[sid] = user_data.nickname
+
+                    self.transport.emit('role_assigned', {
+                        'your_role': 'resident',
+                        'visitor_nickname': current_session.round.visitor_nickname
+                        }, room=role_room(session_id, Role.RESIDENT))
+                    self.transport.emit('role_assigned', {
+                        'your_role': 'visitor',
+                        'visitor_nickname': current_session.round.visitor_nickname
+                        }, room=visitor_candidate_sid)
+            
+                    self.transport.emit('visitor_role_confirmed', { # To Admin; everyone else is now a resident
+                        'seq': current_session.next_seq(),
+                        'visitor_sid': current_session.round.visitor_sid,
+                        'visitor_nickname': current_session.round.visitor_nickname,
+                        'residents_for_voting_count': len(current_session.round.residents_voting)
+                    }, room=current_session.admin_sid)
+                    logger.info("Session %s: %s assigned as Visitor.", session_id, current_session.round.visitor_nickname)
+                else:
+                    self.transport.emit('error', {'message': 'Selected user for visitor role not found.'}, room=request_sid)
+            else:
+                self.transport.emit('error', {'message': 'Admin/Session error during role assignment.'}, room=request_sid)
+
+    @with_session_log_context
+    def submit_purpose(self, request_sid, data):
+        session_id = data.get('session_id')
+        purpose_text = data.get('purpose')
+
+        with self._update_session(session_id) as current_session:
+            if current_session:
+                if request_sid == current_session.round.visitor_sid and current_session.status == SessionStatus.WAITING_FOR_PURPOSE:
+                    current_session.round.purpose_raw = purpose_text
+                    current_session.status = SessionStatus.PROCESSING_PURPOSE # Blocks resubmission while the NLP engine works
+
+                    # Call NLP module via the shared engine; the submission is completed in the callback
+                    visitor_sid = request_sid
+                    self.nlp_engine.submit(purpose_text, callback=lambda structured_nlp_data_full: self._complete_purpose_submission(
+                        session_id, visitor_sid, purpose_text, structured_nlp_data_full))
+                    logger.debug("Session %s: Purpose '%s' from visitor queued for NLP processing.", session_id, purpose_text)
+                else:
+                    self.transport.emit('error', {'message': 'Not authorized or session not in correct state for purpose submission.'}, room=request_sid)
+
+    def _complete_purpose_submission(self, session_id, visitor_sid, purpose_text, structured_nlp_data_full):
+        # Runs on the NLP engine's thread once the purpose has been processed
+        with session_log_context(session_id), self._update_session(session_id) as current_session:
+            if not current_session or current_session.status != SessionStatus.PROCESSING_PURPOSE or current_session.round.visitor_sid != visitor_sid:
+                logger.info("Session %s: Dropping NLP result for '%s', session was reset or closed meanwhile.", session_id, purpose_text)
+                return
+
+            current_session.round.structured_nlp_output = structured_nlp_data_full # Store full output for policy
+
+            # --- PREPARE STRUCTURED DATA FOR DISPLAY (FOR ADMIN AND RESIDENTS) ---
+            nlp_display_summary = {
+                'intent': structured_nlp_data_full.get('intent', 'N/A'),
+                'visitor_category': structured_nlp_data_full.get('visitor_category', 'N/A'),
+                'target_entity': structured_nlp_data_full.get('target_entity_text', 'N/A'),
+                'entities': structured_nlp_data_full.get('entities', []) # Send list of {text, label} dicts
+            }
+
+            if structured_nlp_data_full.get('entities'): # entities from NLP are already {text, label, lemma}
+                nlp_display_summary['entities'] = [{'text': ent['text'], 'label': ent['label']} for ent in structured_nlp_data_full['entities']] # Select only text and label for display
+
+            current_session.round.nlp_summary_for_display = nlp_display_summary
+
+            # Create log_summary_string based on this nlp_display_summary for admin log
+            log_parts = [f"Intent: {nlp_display_summary['intent']}", f"Category: {nlp_display_summary['visitor_category']}"]
+            if nlp_display_summary.get('target_entity') and nlp_display_summary.get('target_entity') != 'N/A':
+                log_parts.append(f"Target: {nlp_display_summary['target_entity']}")
+            if nlp_display_summary.get('entities'):
+                entities_str_log = ", ".join([f"{e['text']} ({e['label']})" for e in nlp_display_summary['entities']])
+                if entities_str_log: 
+                    log_parts.append(f"Entities: {entities_str_log}")
+            current_session.round.extracted_info_display_string = " || ".join(log_parts)
+            # --- END PREPARATION ---
+
+            current_session.status = SessionStatus.READY_FOR_VOTING
+
+            self.transport.emit('purpose_received_from_visitor', {
+                'visitor_nickname': current_session.round.visitor_nickname,
+                'purpose_raw': purpose_text,
+                'nlp_summary_for_display': nlp_display_summary, # Send to admin for chip display
+                'log_summary_string': current_session.round.extracted_info_display_string
+            }, room=current_session.admin_sid)
+        
+            self.transport.emit('purpose_submission_confirmed', {'status': 'Purpose submitted, awaiting voting.'}, room=visitor_sid)
+            logger.debug("Session %s: Purpose '%s' from visitor. Stored nlp_summary: %s", session_id, purpose_text, nlp_display_summary)
+
+
+    @with_session_log_context
+    def start_voting_round(self, request_sid, data):
+        session_id = data.get('session_id')
+        try: # Before the session is touched: a bad value must not leave a round half started
+            timer_duration = parse_timer_duration(data.get('timer_duration', 30), self.config['ROUND_TIMER_MAX'])
+        except ValueError as e:
+            self.transport.emit('error', {'message': str(e), 'reason': 'invalid_timer_duration'}, room=request_sid)
+            return
+
+        with self._update_session(session_id) as current_session:
+            if current_session and current_session.admin_sid == request_sid:
+
+                if not current_session.round.visitor_sid or not current_session.round.purpose_raw: # Check raw purpose
+                    self.transport.emit('error', {'message': 'Visitor not assigned or purpose not stated.'}, room=request_sid)
+                    return
+        
+                if current_session.status not in (SessionStatus.READY_FOR_VOTING, SessionStatus.TALLIED):
+                    self.transport.emit('error', {'message': f"Cannot start voting. Current status: {current_session.status.label}"}, room=request_sid)
+                    return
+
+                if current_session.timer_object: 
+                    current_session.timer_object.cancel()
+        
+                current_session.status = SessionStatus.VOTING
+                current_session.round.start_voting(len(current_session.round.residents_voting), timer_duration) # Clears votes and SSS state
+        
+                # Call Policy Module
+                policy_result = calculate_dynamic_voting_parameters(
+                    current_session.round.structured_nlp_output, # Pass full NLP output
+                    current_session.round.n_voters
+                )
+                current_session.round.t_threshold = policy_result['t_threshold']
+                current_session.round.policy_applied_reason = policy_result['policy_reason']
+
+
+                # --- SSS: Generate Secret and Split Shares ---
+                descriptive_secret_string = f"ACCESS_GRANTED_TOKEN_FOR_{current_session.round.visitor_nickname}_{uuid.uuid4().hex[:6]}"
+                # Create a 16-byte secret by hashing the descriptive string
+                current_session.round.set_secret(hashlib.sha256(descriptive_secret_string.encode('utf-8')).digest()[:16])
+                current_session.round.sss_descriptive_secret = descriptive_secret_string # For logging/verification if needed
+                current_session.sss_combiner = None # Folds in each Allow share as it arrives
+        
+                sss_log_message = f"SSS: Generated 16-byte secret for '{current_session.round.visitor_nickname}'. "
+        
+                k_threshold_for_sss = current_session.round.t_threshold
+                n_shares_for_sss = current_session.round.n_voters
+
+                if n_shares_for_sss > 0 and k_threshold_for_sss > 0 and k_threshold_for_sss <= n_shares_for_sss and self.config['SSS_MODE'] == 'hybrid':
+                    try:
+                        group, reused = self.sss_group_keys.shares_for(session_id, list(current_session.round.residents_voting.keys()), k_threshold_for_sss)
+                        current_session.round.sss_round_context = f"{session_id}:{descriptive_secret_string}"
+                        current_session.round.set_secret(derive_round_token(group.key, current_session.round.sss_round_context))
+                        current_session.round.sss_shares_map = dict(group.shares_by_member)
+                        current_session.sss_combiner = ShareAccumulator(k_threshold_for_sss)
+                        sss_log_message = (f"SSS: Derived round token for '{current_session.round.visitor_nickname}' from the group key. "
+                                           f"{'Reused' if reused else 'Split group key into'} {n_shares_for_sss} shares "
+                                           f"(threshold k={k_threshold_for_sss}, n={n_shares_for_sss}).")
+                        logger.debug("%s", sss_log_message)
+                    except Exception as e:
+                        sss_log_message += f"Error preparing group key shares: {str(e)}. SSS might not be used this round."
+                        logger.error("%s", sss_log_message)
+                        current_session.round.sss_shares_map = None
+                elif n_shares_for_sss > 0 and k_threshold_for_sss > 0 and k_threshold_for_sss <= n_shares_for_sss:
+                    try:
+                        # Shamir.split(k, n, secret_16_bytes)
+                        shares_tuples = Shamir.split(k_threshold_for_sss, 
+                                                     n_shares_for_sss, 
+                                                     current_session.round.sss_actual_secret_bytes) 
+                                                     # ssss=False is default
+                
+                        resident_sids_list = list(current_session.round.residents_voting.keys())
+                        for i, sid in enumerate(resident_sids_list):
+                            if i < len(shares_tuples): 
+                                current_session.round.sss_shares_map[sid] = shares_tuples[i] # Share is (idx, 16_byte_share_value)
+                        current_session.sss_combiner = ShareAccumulator(k_threshold_for_sss)
+                
+                        sss_log_message += (f"Split into {len(current_session.round.sss_shares_map)} shares "
+                                            f"(threshold k={k_threshold_for_sss}, n={n_shares_for_sss}).")
+                        logger.debug("%s", sss_log_message)
+                    except Exception as e:
+                        sss_log_message += f"Error splitting secret: {str(e)}. SSS might not be used this round."
+                        logger.error("%s", sss_log_message)
+                        current_session.round.sss_shares_map = None 
+                elif n_shares_for_sss == 0:
+                    sss_log_message += "No voters, SSS not applicable."
+                    logger.debug("%s", sss_log_message)
+                else: # Invalid k or n for SSS (e.g. k=0, or k > n)
+                    sss_log_message += (f"Invalid SSS params (k={k_threshold_for_sss}, n={n_shares_for_sss}). SSS not used.")
+                    logger.warning("%s", sss_log_message)
+                    current_session.round.sss_shares_map = None # Mark SSS as not properly initialized
+                current_session.round.sss_status_log = sss_log_message
+                # --- END SSS ---
+                self._journal(ROUND_STARTED, session_id, deadline=time.time() + timer_duration, **round_started_fields(current_session))
+
+                # Data for Admin Display
+                self.transport.emit('voting_parameters_set', {
+                    'n': current_session.round.n_voters,
+                    't': current_session.round.t_threshold,
+                    'visitor_purpose': current_session.round.purpose_raw,
+                    'extracted_info_log_string': current_session.round.extracted_info_display_string, # For admin's thinking log
+                    'timer_duration': timer_duration,
+                    'visitor_nickname': current_session.round.visitor_nickname,
+                    'policy_reason': current_session.round.policy_applied_reason,
+                    'sss_status_log': sss_log_message # Send SSS status to admin
+                }, room=current_session.admin_sid)
+
+                # Data for Residents (Voters); they already have the visitor's nickname from role_assigned
+                self.transport.emit('voting_started', {
+                    'visitor_purpose_raw': current_session.round.purpose_raw, # Raw purpose
+                    'nlp_summary': compact_nlp_summary(current_session.round.nlp_summary_for_display),
+                    'timer_duration': timer_duration
+                }, room=role_room(session_id, Role.RESIDENT))
+        
+                current_session.timer_object = self.round_timers.call_later(timer_duration, self.tally_votes, session_id)
+                logger.info("Voting started. Voters: %s, Threshold: %s. SSS: %s",
+                            current_session.round.n_voters, current_session.round.t_threshold, sss_log_message)
+            else:
+                self.transport.emit('error', {'message': 'Admin/Session error or not ready for voting. '}, room=request_sid)
+
+    @with_session_log_context
+    def request_tally(self, request_sid, data):
+        session_id = data.get('session_id')
+        with self._update_session(session_id) as current_session:
+            if current_session and current_session.admin_sid == request_sid:
+                if current_session.status == SessionStatus.VOTING:
+                    logger.info("Admin manually requested tally for session %s", session_id)
+                    if current_session.timer_object:
+                        current_session.timer_object.cancel()
+                        current_session.timer_object = None
+                    self.tally_votes(session_id)
+                else:
+                    self.transport.emit('error', {'message': 'Not in voting state to tally manually.'}, room=request_sid)
+
+    @with_session_log_context
+    def reset_round(self, request_sid, data):
+        session_id = data.get('session_id')
+        with self._update_session(session_id) as current_session:
+            if current_session and current_session.admin_sid == request_sid:
+
+                logger.info("Admin resetting round for session %s", session_id)
+
+                self._abandon_round(current_session) # Cancels any running round's timer
+
+                for sid in current_session.users: # Out of the role rooms before the round forgets the roles
+                    self._set_user_role(current_session, sid, Role.UNASSIGNED)
+                current_session.reset_round() # New round; every user back to unassigned
+
+                # Notify all connected users of their reset role
+                self.transport.emit('role_assigned', {
+                    'your_role': 'unassigned',
+                    'visitor_nickname': None # No visitor assigned yet
+                }, room=users_room(session_id))
+        
+                # Notify admin that reset is done and to re-render their user list for assignment
+                self.transport.emit('round_was_reset', { # The page sets every user to unassigned itself
+                    'seq': current_session.next_seq(),
+                    'message': 'Round has been reset. Please assign roles.'
+                }, room=current_session.admin_sid)
+        
+                logger.info("Session %s reset to 'role_assignment'. All users set to 'unassigned'.", session_id)
+            else:
+                self.transport.emit('error', {'message': 'Failed to reset round. Session/Admin mismatch.'}, room=request_sid)
+
+    @with_session_log_context
+    def send_snapshot(self, request_sid, data):
+        # The admin page missed an update (a gap in seq, e.g. after reconnecting) and rebuilds from this
+        session_id = data.get('session_id')
+        with self._update_session(session_id) as current_session:
+            if current_session and current_session.admin_sid == request_sid:
+                self.transport.emit('session_snapshot', current_session.snapshot_payload(), room=request_sid)
+            else:
+                self.transport.emit('error', {'message': 'Session snapshot unavailable. Session/Admin mismatch.'}, room=request_sid)
+
+    # --- User Client Events ---
+    @with_session_log_context
+    def join_session(self, request_sid, data):
+        session_id = data.get('session_id')
+        nickname = data.get('nickname', f'User_{str(uuid.uuid4())[:4]}').strip()
+
+        if not nickname:
+            self.transport.emit('error', {'message': 'Nickname cannot be empty.'}, room=request_sid)
+            return
+
+        with self._update_session(session_id) as current_session:
+            if current_session:
+
+                if current_session.status == SessionStatus.ROLE_ASSIGNMENT:
+
+                    if request_sid in current_session.users: # Already connected (e.g. refresh)
+                        user_data = current_session.users[request_sid]
+                        self.transport.emit('joined_successfully_waiting_role', {'nickname': user_data.nickname, 'session_id': session_id, 'message': 'Reconnected.'}, room=request_sid)
+                        self.transport.emit('role_assigned', { # Resend current role
+                            'your_role': user_data.role.label,
+                            'visitor_nickname': current_session.round.visitor_nickname
+                        }, room=request_sid)
+                        return
+
+                    if nickname in current_session.nicknames:
+                        self.transport.emit('nickname_taken_error', {'message': f"Nickname '{nickname}' is already taken."}, room=request_sid)
+                        return
+            
+                    self.transport.join_room(request_sid, session_id) # User joins the general session room
+                    self.transport.join_room(request_sid, users_room(session_id))
+                    current_session.add_user(request_sid, nickname)
+                    self.sid_index.bind(request_sid, session_id, Role.UNASSIGNED)
+            
+                    self.transport.emit('user_joined_for_roles', { # To Admin; the page adds the user to its list
+                        'seq': current_session.next_seq(),
+                        'sid': request_sid,
+                        'nickname': nickname,
+                        'role': Role.UNASSIGNED.label
+                    }, room=current_session.admin_sid)
+            
+                    self.transport.emit('joined_successfully_waiting_role', {'nickname': nickname, 'session_id': session_id}, room=request_sid) # To joining client
+                    logger.info("User %s (%s) joined session %s. Awaiting role.", nickname, request_sid, session_id)
+                else:
+                    self.transport.emit('error', {
+                        'message': f"Cannot join at this time (session status is '{current_session.status.label}'). Please wait for role assignment phase.",
+                        'reason': 'session_not_ready_for_join' # Add a reason code
+                    }, room=request_sid)
+                    return
+            else:
+                self.transport.emit('error', {'message': 'Session ID not found.'}, room=request_sid)
+
+    @with_session_log_context
+    def submit_vote(self, request_sid, data):
+        session_id = data.get('session_id')
+        vote_type = data.get('vote_type') 
+        try:
+            choice = VoteChoice.from_label(vote_type)
+        except ValueError:
+            self.transport.emit('error', {'message': f"Invalid vote type: {vote_type}."}, room=request_sid)
+            return
+
+        with self._update_session(session_id) as current_session:
+            if current_session:
+                vote_error = current_session.cast_vote(request_sid, choice)
+                if vote_error is None:
+                    resident_nickname = current_session.round.residents_voting[request_sid]
+
+                    # --- SSS: Mark Share as Contributed and fold it into the reconstruction ---
+                    threshold_reached = False
+                    if choice is VoteChoice.ALLOW and request_sid in (current_session.round.sss_shares_map or {}):
+                        current_session.round.contributed_shares_sids.add(request_sid)
+                        logger.debug("SSS: Share from %s (%s) marked as contributed.", resident_nickname, request_sid)
+                        combiner = current_session.sss_combiner
+                        if combiner:
+                            try:
+                                threshold_reached = combiner.add(*current_session.round.sss_shares_map[request_sid])
+                            except ValueError as e:
+                                logger.error("SSS: Could not fold in share from %s (%s): %s", resident_nickname, request_sid, e)
+                    # --- END SSS ---
+                    # The voter's confirmation waits until the vote is in the journal (group commit, off this thread)
+                    self._journal(VOTE_CAST, session_id, lambda: self.transport.emit(
+                                      'vote_submitted_confirmation', {'status': 'Vote recorded'}, room=request_sid),
+                                  sid=request_sid, choice=int(choice),
+                                  share_contributed=request_sid in current_session.round.contributed_shares_sids)
+            
+                    self.transport.emit('vote_update', {
+                        'seq': current_session.next_seq(),
+                        'sid': request_sid, # For admin to know who voted, if needed
+                        'vote_counts': {choice.label: current_session.round.vote_counts[choice]}, # Only the count that changed
+                        'votes_received_count': len(current_session.round.votes)
+                    }, room=current_session.admin_sid)
+                    logger.debug("Session %s: Vote '%s' from %s (%s)", session_id, vote_type, resident_nickname, request_sid)
+
+                    if threshold_reached or current_session.round.all_votes_in:
+                        if threshold_reached:
+                            # k Allow votes can no longer be outvoted, so the round closes now
+                            logger.debug("Threshold of %s shares reached. Triggering early tally.", current_session.round.t_threshold)
+                        else:
+                            logger.debug("All %s votes received. Triggering early tally.", current_session.round.n_voters)
+                        if current_session.timer_object:
+                            current_session.timer_object.cancel()
+                            current_session.timer_object = None
+                        # Use background task as it was more reliable for the "last voter" issue
+                        self.transport.spawn(self.tally_votes, session_id)
+                else:
+                    self.transport.emit('error', {'message': vote_error}, room=request_sid)
+            else:
+                self.transport.emit('error', {'message': 'Session ID not found.'}, room=request_sid)
+
+    @with_session_log_context
+    def disconnect(self, request_sid):
+        logger.debug("Client disconnected: %s", request_sid)
+        located = self.sid_index.lookup(request_sid) # Which session this connection belongs to, without scanning them all
+        if located is None: # Never joined a session
+            return
+        session_id = located[0] # The role it had does not matter here
+        self.sid_index.unbind(request_sid)
+        with self._update_session(session_id) as details:
+            if details is None: # Removed by another handler meanwhile
+                return
+            if request_sid == details.admin_sid:
+                logger.info("Admin for session %s disconnected. Cleaning up session.", session_id)
+                self._close_session(details, 'Admin disconnected. Session terminated.') # Notifies the other users first
+                return
+    
+            if request_sid == details.round.visitor_sid:
+                self._abandon_round(details) # The visitor leaving ends the round
+            removed = details.remove_user(request_sid) # A leaving visitor resets the session to role assignment
+            if removed:
+                user_disconnected_data, was_visitor, was_voting_resident = removed
+                nickname = user_disconnected_data.nickname
+                logger.info("User %s (SID: %s) disconnected from session %s.", nickname, request_sid, session_id)
+
+                if was_visitor:
+                    self.transport.emit('visitor_left_role_reset', {
+                        'message': f"Visitor {nickname} disconnected. Please assign a new visitor."
+                    }, room=details.admin_sid)
+
+                # A voting resident who leaves is dropped from residents_voting (see Session.remove_user); the
+                # round keeps its n_voters, so a vote they did not cast is counted as no_response at the tally
+
+                # Notify admin about the general user disconnection to update their list
+                self.transport.emit('user_left_for_roles', { # The page drops the user from its list
+                    'seq': details.next_seq(),
+                    'sid': request_sid, # SID of the user who left
+                    'nickname': nickname
+                }, room=details.admin_sid)
+
+                # Their leaving may complete the round: every vote it expects (n_voters) is in
+                if details.status == SessionStatus.VOTING and details.round.n_voters > 0 and was_voting_resident:
+                    if len(details.round.votes) == details.round.n_voters:
+                        logger.debug("Disconnect: All %s expected votes now accounted for in session %s. Triggering early tally.",
+                                     details.round.n_voters, session_id)
+                        if details.timer_object: 
+                            details.timer_object.cancel()
+                        self.transport.spawn(self.tally_votes, session_id)
+
+
+def create_voting_service(config, transport):
+    """
+    Sets up the share pool, policy engine, NLP engine, session store and vote journal from
+    `config` (see settings.py), and restores the rounds the journal shows in flight.
+    """
+    if config['SSS_SHARE_POOL_DEPTH'] > 0:
+        configure_share_pool(pairs=config['SSS_SHARE_POOL_PAIRS'], depth=config['SSS_SHARE_POOL_DEPTH'])
+    configure_policy_engine(rules_path=config['POLICY_RULES_PATH'],
+                            reload_interval=config['POLICY_RELOAD_INTERVAL'])
+
+    nlp_result_cache = configure_nlp_result_cache(max_entries=config['NLP_CACHE_MAX_ENTRIES'],
+                                                  ttl_seconds=config['NLP_CACHE_TTL'],
+                                                  persist_path=config['NLP_CACHE_PATH'])
+    nlp_profiler = None
+    if config['NLP_PROFILING_SAMPLE_RATE'] > 0:
+        nlp_profiler = enable_nlp_profiling(config['NLP_PROFILING_SAMPLE_RATE'])
+    nlp_engine = NLPEngine(num_workers=config['NLP_ENGINE_WORKERS'],
+                           max_batch_size=config['NLP_ENGINE_MAX_BATCH_SIZE'],
+                           max_batch_wait=config['NLP_ENGINE_MAX_BATCH_WAIT'],
+                           cache=nlp_result_cache,
+                           profiler=nlp_profiler,
+                           start_method=config['NLP_ENGINE_START_METHOD'],
+                           resolver_threads=config['NLP_ENGINE_RESOLVER_THREADS'])
+    if config['NLP_WARM_UP_ON_START']:
+        nlp_engine.warm_up()
+
+    session_store = create_session_store(config['SESSION_STORE'], config['SESSION_STORE_PATH'])
+    qr_service = QRCodeService(max_workers=config['QR_RENDER_WORKERS'],
+                               max_entries=config['QR_CACHE_MAX_ENTRIES'],
+                               default_format=config['QR_FORMAT'])
+    session_lifecycle = SessionLifecycle({status: config['SESSION_IDLE_TTLS'].get(status.label) for status in SessionStatus},
+                                         max_sessions=config['SESSION_MAX_LIVE'],
+                                         eviction=config['SESSION_EVICTION'])
+    vote_journal, recovered = None, {}
+    if config['VOTE_JOURNAL_PATH']:
+        records, _ = read_journal(config['VOTE_JOURNAL_PATH'])
+        recovered = recover_rounds(records) # Before opening the journal, which compacts the file
+        vote_journal = VoteJournal(config['VOTE_JOURNAL_PATH'],
+                                   commit_delay=config['VOTE_JOURNAL_COMMIT_DELAY'],
+                                   compact_bytes=config['VOTE_JOURNAL_COMPACT_BYTES'])
+    voting = VotingService(config, transport, session_store, nlp_engine, qr_service, session_lifecycle, nlp_profiler,
+                           vote_journal)
+    voting.restore_rounds(recovered)
+    return voting
@@ -0,0 +1,81 @@
+import argparse
+import json
+import time
+
+from benchmark_helpers import RecordingTransport
+from settings import SETTINGS
+from session_model import SessionStatus
+from voting_service import create_voting_service
+
+
+def timed(timings, name, transport, call, *args):
+    # The event's total time, and the part of it spent fanning out (SSS splitting dominates starting a round)
+    emits_before, send_before = transport.emits, transport.send_seconds
+    started = time.perf_counter()
+    call(*args)
+    timings.setdefault(name, []).append({'ms': (time.perf_counter() - started) * 1000,
+                                         'fan_out_ms': (transport.send_seconds - send_before) * 1000,
+                                         'emits': transport.emits - emits_before})
+
+
+def run_rounds(voting, transport, residents, rounds):
+    """Times the broadcasting events of `rounds` rounds in one building of `residents` residents."""
+    voting.create_session('admin', 'http://localhost:5001/')
+    session_id = transport.sockets['admin'][-1].split('"session_id":"')[1].split('"')[0]
+    for i in range(residents + 1):
+        voting.join_session(f"user_{i:04d}", {'session_id': session_id, 'nickname': f"Resident {i}"})
+    join_bytes = sum(len(packet) for packet in transport.sockets['admin'][1:]) # Admin updates while the building fills
+
+    timings = {}
+    for r in range(rounds):
+        visitor_sid = f"user_{r % (residents + 1):04d}"
+        timed(timings, 'assign_visitor_role', transport, voting.assign_visitor_role, 'admin',
+              {'session_id': session_id, 'visitor_sid': visitor_sid})
+        voting.submit_purpose(visitor_sid, {'session_id': session_id, 'purpose': 'Parcel delivery for apartment 4'})
+        while voting.session_store.get(session_id).status == SessionStatus.PROCESSING_PURPOSE:
+            time.sleep(0.01)
+        timed(timings, 'start_voting_round', transport, voting.start_voting_round, 'admin',
+              {'session_id': session_id, 'timer_duration': 300})
+        # No votes: a majority would tally early, outside the timed request
+        timed(timings, 'tally', transport, voting.request_tally, 'admin', {'session_id': session_id})
+        timed(timings, 'reset_round', transport, voting.reset_round, 'admin', {'session_id': session_id})
+    voting.disconnect('admin')
+    return timings, join_bytes
+
+
+def summarize(samples):
+    summary = {'emits': samples[-1]['emits']}
+    for key, prefix in (('ms', 'total'), ('fan_out_ms', 'fan_out')):
+        values = sorted(sample[key] for sample in samples)
+        summary[f"{prefix}_p50_ms"] = round(values[len(values) // 2], 3)
+        summary[f"{prefix}_max_ms"] = round(values[-1], 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan-out of the voting broadcasts to a building's residents: room emits against one emit per SID.")
+    parser.add_argument("--residents", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    config = dict(SETTINGS)
+    config.update({'SESSION_STORE': 'memory', 'NLP_WARM_UP_ON_START': False, 'SSS_SHARE_POOL_DEPTH': 0})
+    results = {'residents': args.residents, 'rounds': args.rounds}
+    for name, per_sid in (('per_sid_emits', True), ('room_emits', False)):
+        transport = RecordingTransport(packets=True, per_sid=per_sid)
+        voting = create_voting_service(config, transport)
+        timings, join_bytes = run_rounds(voting, transport, args.residents, args.rounds)
+        voting.round_timers.stop()
+        voting.nlp_engine.shutdown()
+        voting.qr_service.shutdown()
+        results[name] = {event: summarize(samples) for event, samples in timings.items()}
+        results[name]['admin_bytes_on_join'] = join_bytes
+        print(json.dumps({name: results[name]}))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()